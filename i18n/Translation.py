@@ -414,6 +414,12 @@ translation_dict = {
             "カメラ領域",
         (ctxt, "Line Size Adjustment"):
             "ラインサイズ調整",
+        (ctxt, "Resolution"):
+            "解像度",
+        ("*", "On-Screen Size"):
+            "画面上のサイズ",
+        ("*", "Render Resolution"):
+            "レンダー解像度",
         (ctxt, "Viewport Render"):
             "ビューポートレンダー",
         (ctxt, "Render Image"):
@@ -422,6 +428,10 @@ translation_dict = {
             "アニメーションをレンダリング",
         (ctxt, "Render Keyframes"):
             "キーフレームをレンダリング",
+        (ctxt, "In-Memory Compositing"):
+            "メモリ上で合成",
+        (ctxt, "Pipelined Animation"):
+            "アニメーションを並行して書き出し",
 
         # Attribute Override
         (ctxt, "Attribute Override"):
@@ -438,6 +448,76 @@ translation_dict = {
             "PSOFT Pencil+ 4 Render App パス",
         (ctxt, "Viewport Preview Timeout Period"):
             "ビューポートプレビューのタイムアウト時間",
+        (ctxt, "Viewport Preview Frame Cache (MB)"):
+            "ビューポートプレビューのフレームキャッシュ (MB)",
+        ("*", "Memory for lines already drawn in the viewport. Reused only while playing back or scrubbing a scene that has not changed"):
+            "ビューポートで描画済みのラインを保持するメモリ。シーンが変更されていない状態での再生やスクラブ中にのみ再利用されます",
+        (ctxt, "Viewport Preview Buffer Format"):
+            "ビューポートプレビューのバッファ形式",
+        ("*", "Alpha + Palette"):
+            "アルファ + パレット",
+        (ctxt, "Line Image Storage after Rendering"):
+            "レンダリング後のライン画像の保持方法",
+        ("*", "Cache File"):
+            "キャッシュファイル",
+        ("*", "Pack and Unpack"):
+            "パックとアンパック",
+        (ctxt, "Frame Storage"):
+            "フレームの保存方法",
+        ("*", "Separate Files"):
+            "個別のファイル",
+        ("*", "Container per Output"):
+            "出力ごとのコンテナ",
+        ("*", "Container per Line"):
+            "ラインごとのコンテナ",
+        (ctxt, "Group By"):
+            "グループ化",
+        ("*", "Edge Type"):
+            "エッジの種類",
+        ("*", "Line Set"):
+            "ラインセット",
+        ("*", "Visibility"):
+            "可視線・隠線",
+        (ctxt, "Simplify"):
+            "簡略化",
+        (ctxt, "Tolerance"):
+            "許容誤差",
+        (ctxt, "Decimal Places"):
+            "小数点以下の桁数",
+        (ctxt, "Compression"):
+            "圧縮",
+        (ctxt, "Level"):
+            "レベル",
+        (ctxt, "Vector Only"):
+            "ベクターのみ",
+        (ctxt, "Bake to Grease Pencil"):
+            "Grease Pencilにベイク",
+        (ctxt, "Render Frames"):
+            "フレームをレンダリング",
+        (ctxt, "Multilayer EXR Output"):
+            "マルチレイヤーEXR出力",
+        (ctxt, "File Path"):
+            "ファイルパス",
+        (ctxt, "Half Float"):
+            "半精度浮動小数点",
+        (ctxt, "Line Image"):
+            "ライン画像",
+        (ctxt, "Storage"):
+            "保存形式",
+        ("*", "Float"):
+            "単精度浮動小数点",
+        ("*", "8-bit"):
+            "8bit",
+        (ctxt, "Use Scene Frame Range"):
+            "シーンのフレーム範囲を使用",
+        (ctxt, "Write Vector Files in Background"):
+            "ベクターファイルをバックグラウンドで書き出し",
+        (ctxt, "Vector File Writer Threads"):
+            "ベクターファイル書き出しスレッド数",
+        (ctxt, "Flush Vector Files to Disk"):
+            "ベクターファイルをディスクに同期",
+        (ctxt, "Replace Vector Files Atomically"):
+            "ベクターファイルをアトミックに置き換え",
         (ctxt, "Abort Rendering when Errors Occur"):
             "エラー発生時にレンダリングを中断する",
 
@@ -0,0 +1,7 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+from .container import LineDataContainerWriter, LineDataContainerReader, ChunkInfo
+from .strokes import StrokeArrays, EpsStrokeIndex, open_stroke_index
+from .svg import write_svg
+from .compression import CODEC_NONE, CODEC_GZIP, CODEC_ZSTD
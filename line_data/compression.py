@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+# ベクターファイルとコンテナのチャンクの圧縮
+# zstdは zstandard モジュールがある場合のみ使用できる
+
+import gzip
+import shutil
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_EXTENSIONS = {CODEC_NONE: "", CODEC_GZIP: ".gz", CODEC_ZSTD: ".zst"}
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def is_available(codec: int) -> bool:
+    return codec in (CODEC_NONE, CODEC_GZIP) or (codec == CODEC_ZSTD and zstandard is not None)
+
+
+def get_extension(codec: int) -> str:
+    return _EXTENSIONS[codec]
+
+
+def detect_codec(head: bytes) -> int:
+    # ファイルの先頭から圧縮形式を判定する
+    if head.startswith(_GZIP_MAGIC):
+        return CODEC_GZIP
+    if head.startswith(_ZSTD_MAGIC):
+        return CODEC_ZSTD
+    return CODEC_NONE
+
+
+def copy_compressed(src: BinaryIO, dst: BinaryIO, codec: int, level: int):
+    # srcを圧縮しながらdstに書き込む。dstは閉じない
+    # levelは1～19。gzipでは9を上限とする
+    if codec == CODEC_NONE:
+        shutil.copyfileobj(src, dst, _COPY_BUFFER_SIZE)
+    elif codec == CODEC_GZIP:
+        # ファイル名と時刻を含めず、同じ内容からは同じ出力になるようにする
+        with gzip.GzipFile(filename="", mode="wb", compresslevel=min(max(level, 1), 9), fileobj=dst, mtime=0) as f:
+            shutil.copyfileobj(src, f, _COPY_BUFFER_SIZE)
+    elif codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compression is not available.")
+        zstandard.ZstdCompressor(level=level).copy_stream(src, dst, read_size=_COPY_BUFFER_SIZE, write_size=_COPY_BUFFER_SIZE)
+    else:
+        raise ValueError(f"Unsupported codec: {codec}")
+
+
+def decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_NONE:
+        return data
+    if codec == CODEC_GZIP:
+        return gzip.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd decompression is not available.")
+        # フレームに元のサイズが書かれていないストリーム圧縮のデータにも対応する
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unsupported codec: {codec}")
@@ -0,0 +1,220 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+# 複数フレームのラインデータ(.pld)を1つのファイルにまとめるコンテナ形式
+# bpyに依存しないため、Blenderの外のツールからも読み込むことができる
+#
+# ファイル構成 (リトルエンディアン)
+#   ヘッダー   : magic "P4LSEQ01"(8) / flags u32 / reserved u32
+#   チャンク   : magic "CHNK"(4) / frame i32 / name_len u16 / codec u16 / payload_len u64 / name / payload
+#               codecはpayloadの圧縮形式 (compression.CODEC_*)
+#   インデックス: magic "INDX"(4) / count u32 / (frame i32, chunk_offset u64) * count
+#   フッター   : index_offset u64 / magic "P4LSEQIX"(8)
+# インデックスは書き込み終了時に追記する。インデックスが無い(書き込み中に中断された)場合はチャンクを先頭から走査する
+# 同じフレーム・名前のチャンクが複数ある場合は後に書かれたものが有効になる
+
+import os
+import shutil
+import struct
+from typing import NamedTuple
+
+from . import compression
+from .compression import CODEC_NONE
+
+FILE_MAGIC = b"P4LSEQ01"
+CHUNK_MAGIC = b"CHNK"
+INDEX_MAGIC = b"INDX"
+FOOTER_MAGIC = b"P4LSEQIX"
+
+_HEADER = struct.Struct("<8sII")
+_CHUNK = struct.Struct("<4siHHQ")
+_INDEX = struct.Struct("<4sI")
+_INDEX_ENTRY = struct.Struct("<iQ")
+_FOOTER = struct.Struct("<Q8s")
+
+
+class ChunkInfo(NamedTuple):
+    frame: int
+    name: str
+    codec: int
+    chunk_offset: int
+    payload_offset: int
+    payload_length: int
+
+
+def _read_chunk_info(f, chunk_offset: int, file_size: int) -> ChunkInfo:
+    f.seek(chunk_offset)
+    data = f.read(_CHUNK.size)
+    if len(data) < _CHUNK.size:
+        return None
+    magic, frame, name_len, codec, payload_length = _CHUNK.unpack(data)
+    if magic != CHUNK_MAGIC:
+        return None
+    payload_offset = chunk_offset + _CHUNK.size + name_len
+    if payload_offset + payload_length > file_size:
+        return None
+    name = f.read(name_len).decode("utf-8")
+    return ChunkInfo(frame, name, codec, chunk_offset, payload_offset, payload_length)
+
+
+def _read_index(f, file_size: int) -> tuple[list[ChunkInfo], int]:
+    # (チャンクのリスト, チャンク領域の終端) を返す
+    f.seek(0)
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != FILE_MAGIC:
+        raise ValueError("Not a Pencil+ 4 line data container.")
+
+    if file_size >= _HEADER.size + _FOOTER.size:
+        f.seek(file_size - _FOOTER.size)
+        index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic == FOOTER_MAGIC and _HEADER.size <= index_offset < file_size:
+            f.seek(index_offset)
+            index_magic, count = _INDEX.unpack(f.read(_INDEX.size))
+            if index_magic == INDEX_MAGIC:
+                entries = f.read(_INDEX_ENTRY.size * count)
+                chunks = []
+                for _, chunk_offset in _INDEX_ENTRY.iter_unpack(entries):
+                    chunk = _read_chunk_info(f, chunk_offset, index_offset)
+                    if chunk is None:
+                        break
+                    chunks.append(chunk)
+                else:
+                    return (chunks, index_offset)
+
+    # インデックスが無いか壊れている場合は先頭から走査し、読める所までを有効とする
+    chunks = []
+    offset = _HEADER.size
+    while True:
+        chunk = _read_chunk_info(f, offset, file_size)
+        if chunk is None:
+            break
+        chunks.append(chunk)
+        offset = chunk.payload_offset + chunk.payload_length
+    return (chunks, offset)
+
+
+class LineDataContainerWriter:
+    # フレームの追記用。既存のファイルを開いた場合はインデックスを外して続きに追記する
+    def __init__(self, path: str):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.__file = open(path, "r+b" if exists else "w+b")
+        if exists:
+            self.__chunks, end = _read_index(self.__file, os.path.getsize(path))
+            self.__file.truncate(end)
+            self.__file.seek(end)
+        else:
+            self.__chunks = []
+            self.__file.write(_HEADER.pack(FILE_MAGIC, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self) -> bool:
+        return self.__file is None
+
+    def __begin_chunk(self, frame: int, name: str, codec: int, payload_length: int) -> int:
+        name_bytes = name.encode("utf-8")
+        offset = self.__file.tell()
+        self.__file.write(_CHUNK.pack(CHUNK_MAGIC, frame, len(name_bytes), codec, payload_length))
+        self.__file.write(name_bytes)
+        self.__chunks.append(ChunkInfo(frame, name, codec, offset, offset + _CHUNK.size + len(name_bytes), payload_length))
+        return offset
+
+    def append(self, frame: int, name: str, payload: bytes, codec: int = CODEC_NONE):
+        self.__begin_chunk(frame, name, codec, len(payload))
+        self.__file.write(payload)
+
+    def append_file(self, frame: int, name: str, path: str, codec: int = CODEC_NONE, level: int = 6):
+        # ファイルの内容をメモリに読み込まずにチャンクとして書き込む
+        # 圧縮する場合は圧縮しながら書き込み、最後にチャンクヘッダーのサイズを書き換える
+        if codec == CODEC_NONE:
+            self.__begin_chunk(frame, name, codec, os.path.getsize(path))
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.__file, 1024 * 1024)
+            return
+        chunk_offset = self.__begin_chunk(frame, name, codec, 0)
+        chunk = self.__chunks[-1]
+        with open(path, "rb") as f:
+            compression.copy_compressed(f, self.__file, codec, level)
+        end = self.__file.tell()
+        payload_length = end - chunk.payload_offset
+        self.__file.seek(chunk_offset)
+        self.__file.write(_CHUNK.pack(CHUNK_MAGIC, frame, len(name.encode("utf-8")), codec, payload_length))
+        self.__file.seek(end)
+        self.__chunks[-1] = chunk._replace(payload_length=payload_length)
+
+    def flush(self, fsync: bool = False):
+        self.__file.flush()
+        if fsync:
+            os.fsync(self.__file.fileno())
+
+    def close(self, fsync: bool = False):
+        if self.__file is None:
+            return
+        index_offset = self.__file.tell()
+        self.__file.write(_INDEX.pack(INDEX_MAGIC, len(self.__chunks)))
+        for chunk in self.__chunks:
+            self.__file.write(_INDEX_ENTRY.pack(chunk.frame, chunk.chunk_offset))
+        self.__file.write(_FOOTER.pack(index_offset, FOOTER_MAGIC))
+        self.flush(fsync)
+        self.__file.close()
+        self.__file = None
+
+
+class LineDataContainerReader:
+    # フレーム単位のランダムアクセス用
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        chunks, _ = _read_index(self._file, os.path.getsize(path))
+        self.__chunks = {}
+        for chunk in chunks:
+            self.__chunks.setdefault(chunk.frame, {})[chunk.name] = chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def frames(self) -> list[int]:
+        return sorted(self.__chunks.keys())
+
+    def names(self, frame: int) -> list[str]:
+        return list(self.__chunks.get(frame, {}).keys())
+
+    def chunks(self, frame: int = None) -> list[ChunkInfo]:
+        if frame is not None:
+            return list(self.__chunks.get(frame, {}).values())
+        return [chunk for frame in self.frames for chunk in self.__chunks[frame].values()]
+
+    def get_chunk(self, frame: int, name: str = None) -> ChunkInfo:
+        # nameを省略した場合、そのフレームにチャンクが1つだけであればそれを返す
+        chunks = self.__chunks.get(frame)
+        if chunks is None:
+            raise KeyError(f"Frame {frame} not found.")
+        if name is None:
+            if len(chunks) != 1:
+                raise KeyError(f"Frame {frame} has {len(chunks)} entries. Specify a name.")
+            return next(iter(chunks.values()))
+        return chunks[name]
+
+    def read_raw(self, chunk: ChunkInfo) -> bytes:
+        self._file.seek(chunk.payload_offset)
+        return self._file.read(chunk.payload_length)
+
+    def read(self, frame: int, name: str = None) -> bytes:
+        # 圧縮されたチャンクは展開して返す
+        chunk = self.get_chunk(frame, name)
+        return compression.decompress(self.read_raw(chunk), chunk.codec)
@@ -0,0 +1,360 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+# ベクター出力のストロークをNumPy配列として読み込む
+# ファイルはメモリマップで開き、最初にストローク単位の索引(バイト範囲、線幅、色)だけを作成する
+# 点列の解析は参照されたストロークに対してのみ行うため、統計やフィルタリングで全体を解析する必要がない
+# 字句解析と点列の構築はブロック単位のNumPyの配列演算で行い、演算子や点ごとにPythonのオブジェクトを作らない
+#
+# PLD(バイナリ)の構造はネイティブモジュールの内部仕様で公開されていないため、読み込めるのはEPS / AI(EPS)のみ
+# PLDとPLDを格納するコンテナ(.pldseq)は読み込まず、このモジュールを使う機能(Grease Pencilへのベイク、SVG変換)ではPLDを扱わない
+
+import mmap
+import re
+from typing import Iterator, NamedTuple
+import numpy as np
+
+from . import compression
+
+_NUMBER = rb"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_BODY_MARKERS = (b"%%EndSetup", b"%%EndProlog")
+_BOUNDING_BOX_RE = re.compile(rb"^%%(HiResBoundingBox|BoundingBox):[ \t]*(" + _NUMBER + rb")\s+(" + _NUMBER + rb")\s+(" + _NUMBER + rb")\s+(" + _NUMBER + rb")", re.MULTILINE)
+
+# 1回の配列演算で扱うバイト数。ブロックは改行位置(索引)またはストロークの境界(点列)で区切る
+_BLOCK_SIZE = 1 << 24
+
+# 区切り文字。文字列や配列の括弧もトークンに含めない
+_DELIMITERS = np.zeros(256, dtype=bool)
+_DELIMITERS[list(b" \t\r\n\f\0[]{}()<>")] = True
+_NUMBER_CHARS = np.zeros(256, dtype=bool)
+_NUMBER_CHARS[list(b"0123456789+-.eE")] = True
+_NUMBER_HEADS = np.zeros(256, dtype=bool)
+_NUMBER_HEADS[list(b"0123456789+-.")] = True
+_NUMBER_WIDTH = 32
+
+# 演算子の種類
+_OP_NONE, _OP_MOVE, _OP_LINE, _OP_CURVE, _OP_CLOSE, _OP_STROKE, _OP_CLOSE_STROKE, _OP_WIDTH, _OP_GRAY, _OP_RGB, _OP_CMYK = range(11)
+_OPERATORS = {
+    b"m": _OP_MOVE, b"moveto": _OP_MOVE,
+    b"l": _OP_LINE, b"L": _OP_LINE, b"lineto": _OP_LINE,
+    b"c": _OP_CURVE, b"C": _OP_CURVE, b"curveto": _OP_CURVE,
+    b"h": _OP_CLOSE, b"closepath": _OP_CLOSE,
+    b"S": _OP_STROKE, b"stroke": _OP_STROKE, b"s": _OP_CLOSE_STROKE,
+    b"w": _OP_WIDTH, b"setlinewidth": _OP_WIDTH,
+    b"G": _OP_GRAY, b"setgray": _OP_GRAY,
+    b"XA": _OP_RGB, b"RG": _OP_RGB, b"setrgbcolor": _OP_RGB,
+    b"K": _OP_CMYK, b"setcmykcolor": _OP_CMYK,
+}
+_OPERATOR_WIDTH = max(len(x) for x in _OPERATORS)
+_OPERATOR_NAMES = np.array(sorted(_OPERATORS), dtype=f"S{_OPERATOR_WIDTH}")
+_OPERATOR_KINDS = np.array([_OPERATORS[x] for x in sorted(_OPERATORS)], dtype=np.int8)
+_OPERAND_COUNTS = np.array([0, 2, 2, 6, 0, 0, 0, 1, 1, 3, 4], dtype=np.int64)
+
+
+class StrokeArrays(NamedTuple):
+    # 全ストロークの点を連結した配列と、ストロークごとの属性
+    # ストロークiの点は points[offsets[i]:offsets[i + 1]]
+    points: np.ndarray          # (点数, 2) float32
+    offsets: np.ndarray         # (ストローク数 + 1,) int64
+    widths: np.ndarray          # (ストローク数,) float32
+    colors: np.ndarray          # (ストローク数, 3) float32
+    line_set_ids: np.ndarray    # (ストローク数,) int16 (不明な場合は-1)
+    closed: np.ndarray          # (ストローク数,) bool
+
+
+def _token_bytes(buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # トークンを固定長(最長のトークンの長さ)のバイト列の配列として取り出す。列ごとに集めることで一時配列を小さく保つ
+    width = int(lengths.max()) if len(lengths) > 0 else 1
+    chars = np.zeros((len(starts), width), dtype=np.uint8)
+    for column in range(width):
+        selected = np.flatnonzero(lengths > column)
+        chars[selected, column] = buffer[starts[selected] + column]
+    return chars.view(f"S{width}").ravel()
+
+
+def _parse_numbers(keys: np.ndarray) -> np.ndarray:
+    try:
+        return keys.astype(np.float64)
+    except ValueError:
+        # 数値として解釈できないトークンが含まれる場合のみ、1つずつ変換する
+        values = np.full(len(keys), np.nan)
+        for i, key in enumerate(keys):
+            try:
+                values[i] = float(key)
+            except ValueError:
+                pass
+        return values
+
+
+def _tokenize(buffer: np.ndarray, operand_kinds: tuple = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # (トークンの開始位置, 演算子の種類, 数値(数値以外はNaN), トークンの終了位置) を返す
+    # operand_kinds を指定した場合は、その種類の演算子の直前の数値のみを変換する
+    delimiters = _DELIMITERS[buffer]
+    # コメント: %から行末まで
+    percents = np.flatnonzero(buffer == ord("%"))
+    if len(percents) > 0:
+        newlines = np.flatnonzero((buffer == ord("\n")) | (buffer == ord("\r")))
+        line_ends = np.append(newlines, len(buffer))[np.searchsorted(newlines, percents)]
+        depth = np.cumsum(np.bincount(percents, minlength=len(buffer) + 1) - np.bincount(line_ends, minlength=len(buffer) + 1))
+        delimiters |= depth[:-1] > 0
+    edges = np.diff(np.concatenate(([True], delimiters, [True])).astype(np.int8))
+    starts = np.flatnonzero(edges == -1)
+    ends = np.flatnonzero(edges == 1)
+    lengths = ends - starts
+    heads = buffer[starts]
+
+    kinds = np.zeros(len(starts), dtype=np.int8)
+    candidates = np.flatnonzero(~_NUMBER_HEADS[heads] & (lengths <= _OPERATOR_WIDTH))
+    keys = _token_bytes(buffer, starts[candidates], lengths[candidates]).astype(f"S{_OPERATOR_WIDTH}")
+    found = np.minimum(np.searchsorted(_OPERATOR_NAMES, keys), len(_OPERATOR_NAMES) - 1)
+    matched = _OPERATOR_NAMES[found] == keys
+    kinds[candidates[matched]] = _OPERATOR_KINDS[found[matched]]
+
+    # 数値: 全ての文字が数値に使われる文字であるトークン
+    values = np.full(len(starts), np.nan)
+    others = np.concatenate(([0], np.cumsum(~_NUMBER_CHARS[buffer], dtype=np.int64)))
+    numeric = _NUMBER_HEADS[heads] & (lengths <= _NUMBER_WIDTH) & (others[ends] == others[starts])
+    if operand_kinds is not None:
+        operators = np.flatnonzero(np.isin(kinds, operand_kinds))
+        needed = np.zeros(len(starts), dtype=bool)
+        for distance in range(1, int(_OPERAND_COUNTS.max()) + 1):
+            needed[operators[operators >= distance] - distance] = True
+        numeric &= needed
+    candidates = np.flatnonzero(numeric)
+    if len(candidates) > 0:
+        values[candidates] = _parse_numbers(_token_bytes(buffer, starts[candidates], lengths[candidates]))
+    return (starts, kinds, values, ends)
+
+
+def _operands(kinds: np.ndarray, values: np.ndarray, operators: np.ndarray, count: int) -> tuple[np.ndarray, np.ndarray]:
+    # 演算子の直前にあるcount個の数値 (演算子数, count) と、全てそろっているかどうかを返す
+    index = operators[:, np.newaxis] - count + np.arange(count)
+    operands = np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+    return (operands, ~np.any(np.isnan(operands), axis=1))
+
+
+def _to_rgb(kinds: np.ndarray, kind_values: tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+    gray, rgb, cmyk = kind_values
+    colors = np.zeros((len(kinds), 3), dtype=np.float32)
+    colors[kinds == _OP_GRAY] = gray[:, :1]
+    colors[kinds == _OP_RGB] = rgb
+    c, m, y, k = cmyk.T
+    colors[kinds == _OP_CMYK] = np.stack([(1.0 - c) * (1.0 - k), (1.0 - m) * (1.0 - k), (1.0 - y) * (1.0 - k)], axis=1)
+    return colors
+
+
+def _build_paths(kinds: np.ndarray, values: np.ndarray, curve_segments: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # トークン列からストロークごとの点列を作る
+    # (点 (点数, 2) float32, ストロークごとの点数, ストロークごとに閉じているか) を返す
+    # 最後の描画演算子より後のパスは含めない
+    operators = np.flatnonzero(kinds != _OP_NONE)
+    op_kinds = kinds[operators]
+    terminators = (op_kinds == _OP_STROKE) | (op_kinds == _OP_CLOSE_STROKE)
+    stroke_count = int(np.count_nonzero(terminators))
+    stroke_ids = np.cumsum(terminators) - terminators
+    in_stroke = stroke_ids < stroke_count
+
+    closed = np.zeros(stroke_count, dtype=bool)
+    closed[stroke_ids[in_stroke & ((op_kinds == _OP_CLOSE) | (op_kinds == _OP_CLOSE_STROKE))]] = True
+
+    # 点を生成する演算子と、その終点
+    is_path = in_stroke & ((op_kinds == _OP_MOVE) | (op_kinds == _OP_LINE) | (op_kinds == _OP_CURVE))
+    path_ops = operators[is_path]
+    path_kinds = op_kinds[is_path]
+    path_strokes = stroke_ids[is_path]
+    counts = _OPERAND_COUNTS[path_kinds]
+    index = path_ops[:, np.newaxis] - 6 + np.arange(6)
+    operands = np.where(index >= 0, values[np.maximum(index, 0)], np.nan)
+    # 演算子の直前のcount個の数値がそろっているもののみ使う(移動・直線の終点も末尾の2つ)
+    required = np.arange(6) >= 6 - counts[:, np.newaxis]
+    valid = ~np.any(np.isnan(operands) & required, axis=1)
+    path_kinds, path_strokes, operands = path_kinds[valid], path_strokes[valid], operands[valid]
+    ends = operands[:, 4:6]
+    # 曲線の始点は直前の点(同じストロークに前の点が無い曲線は除く)
+    is_curve = path_kinds == _OP_CURVE
+    has_start = np.concatenate(([False], path_strokes[1:] == path_strokes[:-1]))
+    keep = ~is_curve | has_start
+    previous = np.concatenate((ends[:1], ends[:-1]))
+    path_kinds, path_strokes, operands, ends, previous = path_kinds[keep], path_strokes[keep], operands[keep], ends[keep], previous[keep]
+    is_curve = path_kinds == _OP_CURVE
+
+    point_counts = np.where(is_curve, curve_segments, 1)
+    point_offsets = np.cumsum(point_counts) - point_counts
+    points = np.empty((int(point_counts.sum()), 2), dtype=np.float32)
+    points[point_offsets[~is_curve]] = ends[~is_curve]
+    if np.any(is_curve):
+        # 3次ベジェ曲線の基底 (分割数, 4) と制御点 (曲線数, 4, 2) の積
+        t = np.arange(1, curve_segments + 1, dtype=np.float64) / curve_segments
+        u = 1.0 - t
+        basis = np.stack([u * u * u, 3.0 * u * u * t, 3.0 * u * t * t, t * t * t], axis=1)
+        controls = np.stack([previous[is_curve], operands[is_curve, 0:2], operands[is_curve, 2:4], ends[is_curve]], axis=1)
+        curve_points = basis @ controls
+        points[(point_offsets[is_curve][:, np.newaxis] + np.arange(curve_segments)).ravel()] = curve_points.reshape(-1, 2)
+    stroke_point_counts = np.bincount(np.repeat(path_strokes, point_counts), minlength=stroke_count).astype(np.int64)
+    return (points, stroke_point_counts, closed)
+
+
+class EpsStrokeIndex:
+    # EPS / AI(EPS)のストロークの遅延索引
+    # data: bytesまたはmmap。start / end でデータ中のPostScriptの範囲を指定する(DOS EPSバイナリヘッダー付きのファイルなど)
+    # line_set_id: ファイルが1つのラインセットのみを含むことが分かっている場合に指定する (EPSにはラインセットの情報が無い)
+    def __init__(self, data, start: int = 0, end: int = None, curve_segments: int = 8, line_set_id: int = -1):
+        self._data = data
+        self._owns_data = False
+        self.curve_segments = curve_segments
+        end = len(data) if end is None else end
+        body_start = start
+
+        # (左, 下, 右, 上)。HiResBoundingBoxがあればそちらを優先する。ヘッダーのコメントのみを対象にする
+        self.bounding_box = None
+        for match in _BOUNDING_BOX_RE.finditer(data, start, min(end, start + 65536)):
+            if self.bounding_box is None or match.group(1) == b"HiResBoundingBox":
+                self.bounding_box = tuple(float(v) for v in match.groups()[1:])
+            if match.group(1) == b"HiResBoundingBox":
+                break
+        for marker in _BODY_MARKERS:
+            position = data.find(marker, start, end)
+            if position >= 0:
+                body_start = max(body_start, position + len(marker))
+
+        # ブロックごとに、描画演算子の終了位置と、線幅・色の変更位置と値を集める
+        stroke_ends, width_positions, width_values, color_positions, color_values = [], [], [], [], []
+        for offset, buffer in self.__blocks(body_start, end):
+            starts, kinds, values, ends = _tokenize(buffer, (_OP_WIDTH, _OP_GRAY, _OP_RGB, _OP_CMYK))
+            del buffer
+            stroke_ends.append(offset + ends[(kinds == _OP_STROKE) | (kinds == _OP_CLOSE_STROKE)])
+            operators = np.flatnonzero(kinds == _OP_WIDTH)
+            operands, valid = _operands(kinds, values, operators, 1)
+            width_positions.append(offset + starts[operators[valid]])
+            width_values.append(operands[valid, 0])
+            operators = np.flatnonzero((kinds == _OP_GRAY) | (kinds == _OP_RGB) | (kinds == _OP_CMYK))
+            kind_values = []
+            valid = np.ones(len(operators), dtype=bool)
+            for kind, count in ((_OP_GRAY, 1), (_OP_RGB, 3), (_OP_CMYK, 4)):
+                selected = kinds[operators] == kind
+                operands, selected_valid = _operands(kinds, values, operators[selected], count)
+                valid[np.flatnonzero(selected)[~selected_valid]] = False
+                kind_values.append(np.nan_to_num(operands))
+            colors = _to_rgb(kinds[operators], kind_values)
+            color_positions.append(offset + starts[operators[valid]])
+            color_values.append(colors[valid])
+
+        stroke_ends = np.concatenate(stroke_ends) if stroke_ends else np.zeros(0, dtype=np.int64)
+        stroke_starts = np.concatenate(([body_start], stroke_ends[:-1])).astype(np.int64)[:len(stroke_ends)]
+        self.byte_ranges = np.stack([stroke_starts, stroke_ends], axis=1).astype(np.int64).reshape(-1, 2)
+        # ストロークごとに、終端より前で最後に設定された線幅と色
+        width_positions = np.concatenate(width_positions) if width_positions else np.zeros(0, dtype=np.int64)
+        width_values = np.concatenate(width_values) if width_values else np.zeros(0)
+        latest = np.searchsorted(width_positions, stroke_ends) - 1
+        self.widths = np.where(latest >= 0, np.append(width_values, 1.0)[latest], 1.0).astype(np.float32)
+        color_positions = np.concatenate(color_positions) if color_positions else np.zeros(0, dtype=np.int64)
+        color_values = np.concatenate(color_values) if color_values else np.zeros((0, 3), dtype=np.float32)
+        latest = np.searchsorted(color_positions, stroke_ends) - 1
+        self.colors = np.where(latest[:, np.newaxis] >= 0, np.concatenate((color_values, np.zeros((1, 3), dtype=np.float32)))[latest], 0.0).astype(np.float32)
+        self.line_set_ids = np.full(len(stroke_ends), line_set_id, dtype=np.int16)
+
+    def __blocks(self, start: int, end: int) -> Iterator[tuple[int, np.ndarray]]:
+        # 改行位置で区切ったブロックを、コピーせずに配列として返す
+        while start < end:
+            block_end = end
+            if end - start > _BLOCK_SIZE:
+                newline = self._data.find(b"\n", start + _BLOCK_SIZE, end)
+                block_end = end if newline < 0 else newline + 1
+            yield (start, np.frombuffer(self._data, dtype=np.uint8, count=block_end - start, offset=start))
+            start = block_end
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        # open_stroke_index()がパスから開いたメモリマップを閉じる
+        if self._owns_data:
+            self._data.close()
+            self._owns_data = False
+
+    def __len__(self) -> int:
+        return len(self.byte_ranges)
+
+    def stroke(self, index: int) -> tuple[np.ndarray, bool]:
+        # ストロークの点列 (点数, 2) と、閉じているかどうかを返す
+        mask = np.zeros(len(self), dtype=bool)
+        mask[index] = True
+        strokes = self.select(mask)
+        return (strokes.points, bool(strokes.closed[0]))
+
+    def iter_select(self, mask: np.ndarray = None, block_size: int = _BLOCK_SIZE) -> Iterator[tuple[np.ndarray, StrokeArrays]]:
+        # maskで選択したストロークを、連続するストロークをまとめたブロックごとに解析する
+        # (ストロークのインデックス, StrokeArrays) を返す
+        indices = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if len(indices) == 0:
+            return
+        # 連続していないストロークの位置と、ブロックの大きさで区切る
+        sizes = self.byte_ranges[indices, 1] - self.byte_ranges[indices, 0]
+        runs = np.cumsum(np.concatenate(([0], np.diff(indices) != 1)))
+        run_starts = np.flatnonzero(np.concatenate(([True], runs[1:] != runs[:-1])))
+        cumulative = np.cumsum(sizes) - np.repeat(np.cumsum(sizes)[run_starts] - sizes[run_starts], np.diff(np.append(run_starts, len(indices))))
+        groups = runs * (int(cumulative.max()) // block_size + 2) + (cumulative - 1) // block_size
+        boundaries = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1], [True])))
+        for first, last in zip(boundaries[:-1].tolist(), boundaries[1:].tolist()):
+            group = indices[first:last]
+            start, end = int(self.byte_ranges[group[0], 0]), int(self.byte_ranges[group[-1], 1])
+            buffer = np.frombuffer(self._data, dtype=np.uint8, count=end - start, offset=start)
+            _, kinds, values, _ = _tokenize(buffer)
+            del buffer
+            points, counts, closed = _build_paths(kinds, values, self.curve_segments)
+            # 範囲はストロークの終端で区切っているため、範囲内の描画演算子の数は選択したストロークの数と一致する
+            offsets = np.zeros(len(group) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            yield (group, StrokeArrays(points[:offsets[-1]], offsets, self.widths[group], self.colors[group],
+                                       self.line_set_ids[group], closed))
+
+    def select(self, mask: np.ndarray = None) -> StrokeArrays:
+        # maskで選択したストロークだけを解析して配列にまとめる
+        parts = [strokes for _, strokes in self.iter_select(mask)]
+        if len(parts) == 0:
+            return StrokeArrays(np.zeros((0, 2), dtype=np.float32), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.float32),
+                                np.zeros((0, 3), dtype=np.float32), np.zeros(0, dtype=np.int16), np.zeros(0, dtype=bool))
+        offsets = [parts[0].offsets]
+        for part in parts[1:]:
+            offsets.append(part.offsets[1:] + offsets[-1][-1])
+        return StrokeArrays(np.concatenate([x.points for x in parts]), np.concatenate(offsets),
+                            np.concatenate([x.widths for x in parts]), np.concatenate([x.colors for x in parts]),
+                            np.concatenate([x.line_set_ids for x in parts]), np.concatenate([x.closed for x in parts]))
+
+
+def open_stroke_index(source, **options):
+    # source: ファイルパス、またはbytes
+    if not isinstance(source, str):
+        codec = compression.detect_codec(bytes(source[:4]))
+        source = compression.decompress(source, codec) if codec != compression.CODEC_NONE else source
+        return _open_stroke_index(source, 0, len(source), **options)
+    # 圧縮されたファイルはメモリマップを使わず、展開したデータを読み込む
+    with open(source, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        codec = compression.detect_codec(data[:4])
+        if codec != compression.CODEC_NONE:
+            payload = compression.decompress(data[:], codec)
+            data.close()
+            return _open_stroke_index(payload, 0, len(payload), **options)
+        index = _open_stroke_index(data, 0, len(data), **options)
+    except Exception:
+        data.close()
+        raise
+    index._owns_data = True
+    return index
+
+
+def _open_stroke_index(data, start: int, end: int, **options):
+    head = bytes(data[start:start + 16])
+    if head.startswith(b"\xc5\xd0\xd3\xc6"):
+        # DOS EPSバイナリヘッダー: PostScript部分の位置と長さ
+        ps_start = int.from_bytes(head[4:8], "little")
+        ps_length = int.from_bytes(head[8:12], "little")
+        return EpsStrokeIndex(data, start + ps_start, min(end, start + ps_start + ps_length), **options)
+    if head.startswith(b"%!PS"):
+        return EpsStrokeIndex(data, start, end, **options)
+    raise ValueError("Unsupported line data format. Only EPS and AI(EPS) vector output can be read.")
@@ -0,0 +1,113 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+# ストロークの索引からSVGを書き出す
+# ストローク単位で簡略化・量子化しながらファイルに書き込むため、全体の文字列をメモリ上に作らない
+# 線幅と色が同じ連続したストロークは1つのpath要素にまとめる
+
+from typing import Iterable
+from xml.sax.saxutils import quoteattr
+import numpy as np
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    # Ramer–Douglas–Peucker法で、tolerance以内のずれに収まる点を取り除く
+    count = len(points)
+    if count < 3 or tolerance <= 0.0:
+        return points
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        relative = points[first + 1:last] - points[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0.0:
+            distances = np.hypot(relative[:, 0], relative[:, 1])
+        else:
+            distances = np.abs(segment[0] * relative[:, 1] - segment[1] * relative[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = first + 1 + index
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+
+class _NumberFormatter:
+    # 座標を10^-precision単位の整数に量子化し、先頭の点以外は相対座標で書き出す
+    def __init__(self, precision: int):
+        self.precision = max(0, precision)
+        self.scale = 10 ** self.precision
+
+    def quantize(self, values: np.ndarray) -> np.ndarray:
+        return np.round(values * self.scale).astype(np.int64)
+
+    def format(self, values: Iterable[int]) -> str:
+        if self.precision == 0:
+            return " ".join(map(str, values))
+        result = []
+        for value in values:
+            text = f"{value / self.scale:.{self.precision}f}".rstrip("0").rstrip(".")
+            result.append("0" if text in ("", "-0") else text)
+        return " ".join(result)
+
+
+def _format_color(color: np.ndarray) -> str:
+    r, g, b = (int(round(min(max(float(c), 0.0), 1.0) * 255)) for c in color)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def write_svg(file, groups: list[tuple[str, object]], tolerance: float = 0.0, precision: int = 1,
+              bounding_box: tuple[float, float, float, float] = None) -> int:
+    # file: テキストモードで開いたファイル
+    # groups: (グループ名, ストロークの索引) のリスト。グループごとに<g>要素を作る
+    # tolerance: 簡略化の許容誤差(EPSの座標単位。Pencil+のベクター出力では1ピクセル)。0の場合は簡略化しない
+    # 書き出したストローク数を返す
+    if bounding_box is None:
+        bounding_box = next((index.bounding_box for _, index in groups if index.bounding_box is not None), (0.0, 0.0, 0.0, 0.0))
+    left, bottom, right, top = bounding_box
+    formatter = _NumberFormatter(precision)
+    width, height = formatter.format(formatter.quantize(np.array([right - left, top - bottom]))).split()
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">\n')
+
+    # EPSは左下原点のため、上下を反転する
+    origin = np.array([left, top], dtype=np.float64)
+    flip = np.array([1.0, -1.0], dtype=np.float64)
+    written = 0
+    for name, index in groups:
+        file.write(f'<g id={quoteattr(name)} fill="none" stroke-linecap="round" stroke-linejoin="round">\n')
+        style = None
+        # 索引のブロックごとに点列をまとめて読み込む
+        for indices, strokes in index.iter_select():
+            for j, i in enumerate(indices.tolist()):
+                points = strokes.points[strokes.offsets[j]:strokes.offsets[j + 1]]
+                if len(points) < 2:
+                    continue
+                points = simplify((points.astype(np.float64) - origin) * flip, tolerance)
+                quantized = formatter.quantize(points)
+                deltas = np.diff(quantized, axis=0)
+                deltas = deltas[np.any(deltas != 0, axis=1)]
+
+                stroke_style = (_format_color(index.colors[i]), formatter.format(formatter.quantize(index.widths[i:i + 1])))
+                if stroke_style != style:
+                    if style is not None:
+                        file.write('"/>\n')
+                    file.write(f'<path stroke="{stroke_style[0]}" stroke-width="{stroke_style[1]}" d="')
+                    style = stroke_style
+                file.write(f"M{formatter.format(quantized[0])}")
+                if len(deltas) > 0:
+                    file.write(f"l{formatter.format(deltas.ravel())}")
+                if strokes.closed[j]:
+                    file.write("z")
+                written += 1
+        if style is not None:
+            file.write('"/>\n')
+        file.write("</g>\n")
+    file.write("</svg>\n")
+    return written
@@ -28,6 +28,8 @@ def copy_props(py_instance, cpp_instance, instance_dict=None, context: bpy.types
         # enum
         elif cpp_type.__name__.startswith("pcl4_enum_"):
             enum_items = py_instance.bl_rna.properties[prop_name].enum_items
+            # Python側にのみ存在する項目は、対応するネイティブ側の項目に置き換える
+            py_value = getattr(py_instance, "cpp_enum_fallbacks", {}).get(prop_name, {}).get(py_value, py_value)
             raw_value = next(x.value for x in enum_items if x.identifier == py_value)
             setattr(cpp_instance, prop_name, cpp_type(raw_value))
         # vector / color
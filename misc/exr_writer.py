@@ -0,0 +1,129 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+# 複数のレイヤーを1つのOpenEXR(シングルパート、スキャンライン)に書き出す
+# チャンネル名は "レイヤー.パス.チャンネル" とし、Blenderではマルチレイヤーとして読み込まれる
+# NONE / ZIPS / ZIPはnumpyとzlibで書き出す。PIZ / DWAAはOpenImageIOがある場合のみ使用でき、無い場合はZIPで書き出す
+
+import struct
+import zlib
+import numpy as np
+
+try:
+    import OpenImageIO
+except ImportError:
+    OpenImageIO = None
+
+COMPRESSIONS = {"NONE": 0, "ZIPS": 2, "ZIP": 3, "PIZ": 4, "DWAA": 8}
+_LINES_PER_BLOCK = {"NONE": 1, "ZIPS": 1, "ZIP": 16}
+_CHANNEL_NAMES = {1: ("V",), 2: ("V", "A"), 3: ("R", "G", "B"), 4: ("R", "G", "B", "A")}
+_PIXEL_TYPE_HALF = 1
+_PIXEL_TYPE_FLOAT = 2
+
+
+def is_available(compression: str) -> bool:
+    return compression in _LINES_PER_BLOCK or OpenImageIO is not None
+
+
+def _attribute(name: str, type: str, value: bytes) -> bytes:
+    return name.encode() + b"\0" + type.encode() + b"\0" + struct.pack("<i", len(value)) + value
+
+
+def _zip_block(raw: bytes) -> bytes:
+    # OpenEXRのZIP圧縮: バイトを偶数番目・奇数番目に並べ替え、差分を取ってからzlibで圧縮する
+    # 圧縮後の方が大きい場合は無圧縮のまま格納する
+    data = np.frombuffer(raw, dtype=np.uint8)
+    reordered = np.concatenate([data[0::2], data[1::2]])
+    predicted = np.empty_like(reordered)
+    predicted[:1] = reordered[:1]
+    predicted[1:] = np.diff(reordered) + np.uint8(128)
+    compressed = zlib.compress(predicted.tobytes(), 4)
+    return compressed if len(compressed) < len(raw) else raw
+
+
+def collect_channels(layers: list[tuple], half: bool) -> list[tuple[str, np.ndarray]]:
+    # layers: (レイヤー名(パス名を含む), 上の行から並ぶ画素 (height, width, channels)[, 半精度にするか]) のリスト
+    # 半精度の指定が無いレイヤーはhalfに従う
+    # (チャンネル名, 画素 (height, width)) をチャンネル名の順に並べて返す
+    channels = []
+    for layer in layers:
+        layer_name, pixels = layer[:2]
+        dtype = np.dtype("<f2") if (layer[2] if len(layer) > 2 else half) else np.dtype("<f4")
+        for i, channel_name in enumerate(_CHANNEL_NAMES[pixels.shape[2]]):
+            channels.append((f"{layer_name}.{channel_name}", np.ascontiguousarray(pixels[:, :, i], dtype=dtype)))
+    channels.sort(key=lambda x: x[0])
+    return channels
+
+
+def write_multilayer_exr(path: str, width: int, height: int, layers: list[tuple],
+                         compression: str = "ZIP", half: bool = True) -> str:
+    # 警告があればその内容を返す
+    warning = None
+    if compression not in _LINES_PER_BLOCK:
+        if OpenImageIO is not None:
+            _write_with_oiio(path, width, height, layers, compression, half)
+            return None
+        warning = f"{compression} compression requires OpenImageIO. ZIP was used instead."
+        compression = "ZIP"
+
+    channels = collect_channels(layers, half)
+    long_names = any(len(name) > 31 for name, _ in channels)
+
+    chlist = b"".join(name.encode() + b"\0" +
+                      struct.pack("<iB3xii", _PIXEL_TYPE_HALF if pixels.dtype.itemsize == 2 else _PIXEL_TYPE_FLOAT, 0, 1, 1)
+                      for name, pixels in channels) + b"\0"
+    window = struct.pack("<iiii", 0, 0, width - 1, height - 1)
+    header = (b"\x76\x2f\x31\x01" + struct.pack("<I", 2 | (0x400 if long_names else 0)) +
+              _attribute("channels", "chlist", chlist) +
+              _attribute("compression", "compression", struct.pack("<B", COMPRESSIONS[compression])) +
+              _attribute("dataWindow", "box2i", window) +
+              _attribute("displayWindow", "box2i", window) +
+              _attribute("lineOrder", "lineOrder", struct.pack("<B", 0)) +
+              _attribute("pixelAspectRatio", "float", struct.pack("<f", 1.0)) +
+              _attribute("screenWindowCenter", "v2f", struct.pack("<ff", 0.0, 0.0)) +
+              _attribute("screenWindowWidth", "float", struct.pack("<f", 1.0)) +
+              b"\0")
+
+    # ブロックごとに (行, チャンネル, 列) の順で並べる。チャンネルごとに型が異なる場合は行単位で連結する
+    planes = [pixels for _, pixels in channels]
+    uniform = len(set(pixels.dtype for pixels in planes)) <= 1
+    if uniform:
+        planes = np.stack(planes) if len(planes) > 0 else np.zeros((0, height, width), dtype=np.float16)
+    # オフセットテーブルは仮に書いておき、ブロックを書き終えてから埋める
+    lines_per_block = _LINES_PER_BLOCK[compression]
+    block_count = (height + lines_per_block - 1) // lines_per_block
+    offsets = []
+    with open(path, "wb") as f:
+        f.write(header)
+        table_offset = f.tell()
+        f.write(bytes(8 * block_count))
+        for y in range(0, height, lines_per_block):
+            if uniform:
+                raw = planes[:, y:y + lines_per_block, :].transpose(1, 0, 2).tobytes()
+            else:
+                raw = b"".join(pixels[row].tobytes() for row in range(y, min(y + lines_per_block, height)) for pixels in planes)
+            data = raw if compression == "NONE" else _zip_block(raw)
+            offsets.append(f.tell())
+            f.write(struct.pack("<ii", y, len(data)))
+            f.write(data)
+        f.seek(table_offset)
+        f.write(struct.pack(f"<{block_count}Q", *offsets))
+    return warning
+
+
+def _write_with_oiio(path: str, width: int, height: int, layers: list[tuple], compression: str, half: bool):
+    # チャンネルごとの型を指定して書き出す
+    channels = collect_channels(layers, half)
+    spec = OpenImageIO.ImageSpec(width, height, len(channels), OpenImageIO.FLOAT)
+    spec.channelnames = tuple(name for name, _ in channels)
+    spec.channelformats = tuple(OpenImageIO.TypeDesc(OpenImageIO.HALF if pixels.dtype.itemsize == 2 else OpenImageIO.FLOAT)
+                                for _, pixels in channels)
+    spec.attribute("compression", compression.lower())
+    output = OpenImageIO.ImageOutput.create(path)
+    if output is None or not output.open(path, spec):
+        raise OSError(OpenImageIO.geterror() or f"Failed to open {path}")
+    try:
+        if not output.write_image(np.stack([pixels.astype(np.float32) for _, pixels in channels], axis=2)):
+            raise OSError(output.geterror() or f"Failed to write {path}")
+    finally:
+        output.close()
@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import collections
+
+
+class FrameCache:
+    # 描画済みのフレームをバイト数の予算内で保持するLRUキャッシュ
+    # キーの先頭はリージョンのポインタ。値はnbytes属性を持つオブジェクト(ViewportLineImageなど)
+    def __init__(self):
+        self.__items = collections.OrderedDict()
+        self.__size = 0
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def get(self, key: tuple):
+        item = self.__items.get(key)
+        if item is None:
+            return None
+        self.__items.move_to_end(key)
+        return item[0]
+
+    def contains(self, key: tuple) -> bool:
+        return key in self.__items
+
+    def put(self, key: tuple, value, budget: int):
+        self.remove(key)
+        nbytes = value.nbytes
+        if nbytes > budget:
+            return
+        # 予算を超える場合は最も長く参照されていないものから破棄する
+        while len(self.__items) > 0 and self.__size + nbytes > budget:
+            _, (_, evicted_nbytes) = self.__items.popitem(last=False)
+            self.__size -= evicted_nbytes
+        self.__items[key] = (value, nbytes)
+        self.__size += nbytes
+
+    def remove(self, key: tuple):
+        item = self.__items.pop(key, None)
+        if item is not None:
+            self.__size -= item[1]
+
+    def remove_region(self, region_ptr: int):
+        for key in [key for key in self.__items.keys() if key[0] == region_ptr]:
+            self.remove(key)
+
+    def clear(self):
+        self.__items.clear()
+        self.__size = 0
@@ -0,0 +1,45 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import collections
+import numpy as np
+import bpy
+
+# 解像度(要素数)ごとのゼロ埋めバッファ。フレーム間で使い回す
+__MAX_ZERO_BUFFERS = 4
+__zero_buffers = collections.OrderedDict()
+
+
+def get_zero_buffer(length: int) -> np.ndarray:
+    buffer = __zero_buffers.get(length)
+    if buffer is None:
+        buffer = np.zeros(length, dtype=np.float32)
+        buffer.flags.writeable = False
+        __zero_buffers[length] = buffer
+        while len(__zero_buffers) > __MAX_ZERO_BUFFERS:
+            __zero_buffers.popitem(last=False)
+    else:
+        __zero_buffers.move_to_end(length)
+    return buffer
+
+
+def clear_zero_buffers():
+    __zero_buffers.clear()
+
+
+def clear_image(image: bpy.types.Image):
+    # Pythonのリストを経由せず、画素を0で埋める
+    length = image.size[0] * image.size[1] * image.channels
+    if length > 0:
+        image.pixels.foreach_set(get_zero_buffer(length))
+
+
+def resize_image(image: bpy.types.Image, width: int, height: int):
+    # 生成画像は画素を再サンプリングせずにバッファを確保し直す
+    if image.source == "GENERATED":
+        if image.generated_width != width:
+            image.generated_width = width
+        if image.generated_height != height:
+            image.generated_height = height
+    else:
+        image.scale(width, height)
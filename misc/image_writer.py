@@ -0,0 +1,82 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+
+
+def to_integer_pixels(pixels, width: int, height: int, color_mode: str = "RGBA", color_depth: str = "8") -> np.ndarray:
+    # 下の行から並ぶfloatのRGBA画素を、上の行から並ぶ整数の画素配列 (height, width, channels) に変換する
+    image = np.asarray(pixels, dtype=np.float32).reshape(height, width, 4)[::-1]
+    if color_mode == "BW":
+        image = image[:, :, 0:1] * 0.2126 + image[:, :, 1:2] * 0.7152 + image[:, :, 2:3] * 0.0722
+    elif color_mode == "RGB":
+        image = image[:, :, :3]
+    if color_depth == "16":
+        return (np.clip(image, 0.0, 1.0) * 65535.0 + 0.5).astype(">u2")
+    return (np.clip(image, 0.0, 1.0) * 255.0 + 0.5).astype(np.uint8)
+
+
+def encode_png(pixels, width: int, height: int, color_mode: str = "RGBA", color_depth: str = "8", compression: int = 15) -> bytes:
+    data = to_integer_pixels(pixels, width, height, color_mode, color_depth)
+    color_type = {"BW": 0, "RGB": 2}.get(color_mode, 6)
+    bit_depth = 16 if color_depth == "16" else 8
+
+    # 各行の先頭にフィルタ種別(0: None)を付加する
+    rows = data.reshape(height, -1).view(np.uint8)
+    raw = np.zeros((height, rows.shape[1] + 1), dtype=np.uint8)
+    raw[:, 1:] = rows
+    level = min(max(round(compression * 9 / 100), 0), 9)
+
+    def chunk(tag: bytes, body: bytes) -> bytes:
+        return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bit_depth, color_type, 0, 0, 0)) +
+            chunk(b"IDAT", zlib.compress(raw.tobytes(), level)) +
+            chunk(b"IEND", b""))
+
+
+class ImageWriteQueue:
+    # エンコードとファイル書き込みをバックグラウンドスレッドで行う
+    # キューの長さを制限し、書き込みが追いつかない場合は put() で待機する
+    def __init__(self, max_pending: int = 2):
+        self.__queue = queue.Queue(maxsize=max(max_pending, 1))
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.errors = []
+        self.timings = {}
+        self.__thread.start()
+
+    def put(self, key, path: str, pixels, width: int, height: int,
+            color_mode: str = "RGBA", color_depth: str = "8", compression: int = 15) -> float:
+        start = time.perf_counter()
+        self.__queue.put((key, path, pixels, width, height, color_mode, color_depth, compression))
+        return time.perf_counter() - start
+
+    def finish(self):
+        self.__queue.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            key, path, pixels, width, height, color_mode, color_depth, compression = item
+            try:
+                start = time.perf_counter()
+                data = encode_png(pixels, width, height, color_mode, color_depth, compression)
+                encoded = time.perf_counter()
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+                self.timings[key] = {"encode": encoded - start, "write": time.perf_counter() - encoded}
+            except Exception as e:
+                self.errors.append(f"{path}: {e}")
@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+import collections
+from . import image_writer
+
+# BlenderのFFmpeg設定のコーデックとffmpegのエンコーダーの対応
+__video_codecs = {
+    "H264": "libx264",
+    "H265": "libx265",
+    "MPEG4": "mpeg4",
+    "MPEG2": "mpeg2video",
+    "MPEG1": "mpeg1video",
+    "WEBM": "libvpx-vp9",
+    "AV1": "libaom-av1",
+    "THEORA": "libtheora",
+    "FLASH": "flv",
+    "PNG": "png",
+    "QTRLE": "qtrle",
+    "FFV1": "ffv1",
+    "HUFFYUV": "huffyuv",
+    "DNXHD": "dnxhd",
+    "PRORES": "prores_ks",
+}
+
+# アルファチャンネルを出力できるコーデックのピクセルフォーマット
+__alpha_pixel_formats = {
+    "PNG": "rgba",
+    "QTRLE": "argb",
+    "FFV1": "bgra",
+    "HUFFYUV": "rgba",
+    "PRORES": "yuva444p10le",
+    "WEBM": "yuva420p",
+}
+
+__constant_rate_factors = {
+    "LOSSLESS": 0,
+    "PERC_LOSSLESS": 17,
+    "HIGH": 20,
+    "MEDIUM": 23,
+    "LOW": 26,
+    "VERYLOW": 29,
+    "LOWEST": 32,
+}
+
+
+def find_ffmpeg() -> str:
+    return shutil.which("ffmpeg")
+
+
+def get_encoder_args(ffmpeg_settings, use_alpha: bool) -> list[str]:
+    codec = ffmpeg_settings.codec
+    args = ["-c:v", __video_codecs.get(codec, "libx264")]
+    if use_alpha and codec in __alpha_pixel_formats:
+        args += ["-pix_fmt", __alpha_pixel_formats[codec]]
+    elif codec in {"H264", "H265", "MPEG4", "MPEG2", "WEBM", "AV1", "THEORA"}:
+        args += ["-pix_fmt", "yuv420p"]
+    if codec in {"H264", "H265", "WEBM", "AV1"} and ffmpeg_settings.constant_rate_factor in __constant_rate_factors:
+        args += ["-crf", str(__constant_rate_factors[ffmpeg_settings.constant_rate_factor])]
+        if codec in {"WEBM", "AV1"}:
+            args += ["-b:v", "0"]
+    elif ffmpeg_settings.video_bitrate > 0:
+        args += ["-b:v", f"{ffmpeg_settings.video_bitrate}k"]
+    if ffmpeg_settings.gopsize > 0:
+        args += ["-g", str(ffmpeg_settings.gopsize)]
+    return args
+
+
+class FFmpegMovieWriter:
+    # 合成済みのフレームを無圧縮のRGBAとしてffmpegの標準入力に送り、画像ファイルを経由せずに動画を書き出す
+    def __init__(self, path: str, width: int, height: int, fps: float, encoder_args: list[str], ffmpeg: str = None):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.error = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        args = [ffmpeg or find_ffmpeg(), "-y", "-loglevel", "error",
+                "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+                *encoder_args, path]
+        self.__process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # 標準エラー出力のパイプが満杯になるとffmpegが停止するため、別スレッドで読み続け末尾の行のみ保持する
+        self.__stderr_lines = collections.deque(maxlen=20)
+        self.__stderr_thread = threading.Thread(target=self.__drain_stderr, daemon=True)
+        self.__stderr_thread.start()
+
+    def __drain_stderr(self):
+        for line in self.__process.stderr:
+            self.__stderr_lines.append(line.decode(errors="replace").rstrip())
+
+    def write(self, pixels) -> float:
+        start = time.perf_counter()
+        if self.error is None:
+            try:
+                self.__process.stdin.write(image_writer.to_integer_pixels(pixels, self.width, self.height).tobytes())
+            except (BrokenPipeError, OSError) as e:
+                self.error = str(e)
+        return time.perf_counter() - start
+
+    def close(self) -> str:
+        # エンコード完了まで待機し、エラーがあればその内容を返す
+        try:
+            self.__process.stdin.close()
+        except OSError:
+            pass
+        returncode = self.__process.wait()
+        self.__stderr_thread.join()
+        stderr = "\n".join(self.__stderr_lines).strip()
+        if returncode != 0:
+            self.error = stderr or self.error or f"ffmpeg exited with code {self.__process.returncode}"
+        return self.error
@@ -0,0 +1,10 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+def get_scene_data_key(depsgraph, space, object_type_filter_props: list[str]) -> tuple:
+    # ビューポートの描画用データ(extract_sceneの結果)を共有する単位のキーを返す
+    # オブジェクトの表示状態がビューポート固有になる設定 (ローカルビュー、ローカルコレクション) が無効であれば、
+    # 同じデプスグラフを表示する別のビューポートとも描画用データを共有する
+    local_key = space.as_pointer() if space.local_view is not None or space.use_local_collections else 0
+    object_type_filter = tuple(getattr(space, x) for x in object_type_filter_props)
+    return (depsgraph.as_pointer(), space.shading.type, local_key, object_type_filter)
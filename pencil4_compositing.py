@@ -69,6 +69,7 @@ class PCL4_OT_DeleteLineRenderElement(bpy.types.Operator):
             if elem.as_pointer() == ptr:
                 image = elem.output.main
                 render_elements.remove(i)
+                pencil4_render_images.ImageOwnershipRegistry.register_view_layer(context.scene, view_layer)
 
                 if image is not None:
                     tree = context.scene.node_tree
@@ -206,9 +207,9 @@ class PCL4_PT_VectorOutput(bpy.types.Panel):
 
     @classmethod
     def get_line_outputs_from_node(cls, context, node):
-        for view_layer in context.scene.view_layers:
-            if view_layer.pencil4_line_outputs.output.main == node.image:
-                return view_layer.pencil4_line_outputs
+        owner = pencil4_render_images.ImageOwnershipRegistry.get_owner(node.image, context.scene, is_element=False)
+        if owner is not None:
+            return owner[1].pencil4_line_outputs
 
     @classmethod
     def get_line_outputs_from_node_ptr(cls, context, node_ptr):
@@ -227,24 +228,24 @@ class PCL4_PT_VectorOutput(bpy.types.Panel):
         if node is None or node.bl_idname != "CompositorNodeImage":
             return False
 
-        for view_layer in context.scene.view_layers:
-            if view_layer.pencil4_line_outputs.output.main == node.image:
-                return True
-        
-        return False
+        return cls.get_line_outputs_from_node(context, node) is not None
         
     def draw(self, context):
         layout = self.layout
 
         node = context.active_node
-        outputs = self.get_line_outputs_from_node(context, node)
-        if outputs is None:
+        owner = pencil4_render_images.ImageOwnershipRegistry.get_owner(node.image, context.scene, is_element=False)
+        if owner is None:
             return
+        view_layer = owner[1]
+        outputs = view_layer.pencil4_line_outputs
         
         col = layout.column(align=True)
         col.enabled = len(outputs.vector_outputs) > 0
         col.label(text="Base Path", text_ctxt=Translation.ctxt)
         col.prop(outputs, "vector_output_base_path", text="")
+        col.separator()
+        col.prop(outputs, "vector_only", text="Vector Only", text_ctxt=Translation.ctxt)
 
         layout.separator()
 
@@ -300,6 +301,33 @@ class PCL4_PT_VectorOutput(bpy.types.Panel):
         col.separator()
         col.label(text="File Type", text_ctxt=Translation.ctxt)
         prop("file_type", "")
+        if output.file_type == "PLD":
+            col.separator()
+            col.label(text="Frame Storage", text_ctxt=Translation.ctxt)
+            prop("container_mode", "")
+        if output.file_type != "SVG":
+            col.separator()
+            col.label(text="Compression", text_ctxt=Translation.ctxt)
+            row = col.row(align=True)
+            row.prop(output, "compression", text="")
+            sub = row.row(align=True)
+            sub.enabled = output.compression != "NONE"
+            sub.prop(output, "compression_level", text="Level", text_ctxt=Translation.ctxt)
+        else:
+            col.separator()
+            col.label(text="Group By", text_ctxt=Translation.ctxt)
+            prop("svg_group_by", "")
+            col.separator()
+            prop("svg_simplify_on", "Simplify")
+            row = col.row(align=True)
+            row.enabled = output.svg_simplify_on
+            row.prop(output, "svg_simplify_tolerance", text="Tolerance", text_ctxt=Translation.ctxt)
+            prop("svg_precision", "Decimal Places")
+        if output.file_type in ("AIEPS", "EPS"):
+            col.separator()
+            bake_button = col.operator("pcl4.bake_grease_pencil", text="Bake to Grease Pencil", text_ctxt=Translation.ctxt)
+            bake_button.view_layer = view_layer.name
+            bake_button.output_index = outputs.vector_output_selected_index
 
         layout.separator()
 
@@ -330,7 +358,69 @@ class PCL4_PT_VectorOutput(bpy.types.Panel):
                 row = col.row(align=True)
 
 
-        
+
+class PCL4_PT_LineImage(bpy.types.Panel):
+    bl_idname = "PCL4_PT_line_image"
+
+    bl_space_type = "NODE_EDITOR"
+    bl_region_type = "UI"
+    bl_category = "Pencil+ 4 Line"
+    bl_label = "Line Image"
+    bl_translation_context = Translation.ctxt
+    bl_order = 0
+
+    @classmethod
+    def poll(cls, context):
+        return PCL4_PT_VectorOutput.poll(context)
+
+    def draw(self, context):
+        outputs = PCL4_PT_VectorOutput.get_line_outputs_from_node(context, context.active_node)
+        if outputs is None:
+            return
+
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+        layout.enabled = not outputs.vector_only
+        layout.prop(outputs.output, "storage_format", text="Storage", text_ctxt=Translation.ctxt)
+
+
+class PCL4_PT_MultilayerExrOutput(bpy.types.Panel):
+    bl_idname = "PCL4_PT_multilayer_exr_output"
+
+    bl_space_type = "NODE_EDITOR"
+    bl_region_type = "UI"
+    bl_category = "Pencil+ 4 Line"
+    bl_label = "Multilayer EXR Output"
+    bl_translation_context = Translation.ctxt
+    bl_order = 0
+
+    @classmethod
+    def poll(cls, context):
+        return PCL4_PT_VectorOutput.poll(context)
+
+    def draw_header(self, context):
+        outputs = PCL4_PT_VectorOutput.get_line_outputs_from_node(context, context.active_node)
+        if outputs is not None:
+            self.layout.prop(outputs, "exr_output_on", text="")
+
+    def draw(self, context):
+        outputs = PCL4_PT_VectorOutput.get_line_outputs_from_node(context, context.active_node)
+        if outputs is None:
+            return
+
+        layout = self.layout
+        layout.enabled = outputs.exr_output_on and not outputs.vector_only
+        col = layout.column(align=True)
+        col.label(text="File Path", text_ctxt=Translation.ctxt)
+        col.prop(outputs, "exr_output_path", text="")
+        col.separator()
+        col.label(text="Compression", text_ctxt=Translation.ctxt)
+        col.prop(outputs, "exr_compression", text="")
+        col.separator()
+        col.prop(outputs, "exr_half_float", text="Half Float", text_ctxt=Translation.ctxt)
+
+
 class PCL4_PT_LineRenderElement(bpy.types.Panel):
     bl_idname = "PCL4_PT_line_render_element"
     
@@ -351,11 +441,8 @@ class PCL4_PT_LineRenderElement(bpy.types.Panel):
         if node is None or node.bl_idname != "CompositorNodeImage":
             return False
 
-        for view_layer in context.scene.view_layers:
-            if view_layer.pencil4_line_outputs.contains_in_render_elements(node.image):
-                return True
-        
-        return False
+        owner = pencil4_render_images.ImageOwnershipRegistry.get_owner(node.image, context.scene, is_element=True)
+        return owner is not None
         
     def draw(self, context):
         layout = self.layout
@@ -363,11 +450,8 @@ class PCL4_PT_LineRenderElement(bpy.types.Panel):
         layout.use_property_decorate = False
         node = context.space_data.node_tree.nodes.active
 
-        for view_layer in context.scene.view_layers:
-            elem = view_layer.pencil4_line_outputs.get_render_element_from_image(node.image)
-            if elem is not None:
-                break
-        
+        owner = pencil4_render_images.ImageOwnershipRegistry.get_owner(node.image, context.scene, is_element=True)
+        elem = owner[2] if owner is not None else None
         if elem is None:
             return
         
@@ -376,6 +460,7 @@ class PCL4_PT_LineRenderElement(bpy.types.Panel):
 
         col = layout.column(align=True)
         enum_property(col, elem, "element_type", pencil4_render_images.RenderElement.element_type_items, text="Output Element")
+        col.prop(elem.output, "storage_format", text="Storage", text_ctxt=Translation.ctxt)
         col = col.column(align=True)
         col.enabled = elem.element_type != "COLOR"
         prop("z_min", "Z Min")
@@ -0,0 +1,250 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+if "bpy" in locals():
+    import imp
+    imp.reload(pencil4_render_images)
+    imp.reload(pencil4_render_session)
+    imp.reload(pencil4_viewport)
+    imp.reload(pencil4_handler)
+    imp.reload(line_data)
+else:
+    from . import pencil4_render_images
+    from . import pencil4_render_session
+    from . import pencil4_viewport
+    from . import pencil4_handler
+    from . import line_data
+
+import re
+import bpy
+import numpy as np
+from mathutils import Matrix
+
+from .i18n import Translation
+
+# Blender 4.3以降はGrease Pencil v3の属性APIで、フレーム単位にまとめてストロークを作成する
+_use_grease_pencil_v3 = bpy.app.version >= (4, 3, 0)
+_MATERIAL_NAME = "Pencil+ 4 Line"
+
+
+class PCL4_OT_BakeGreasePencil(bpy.types.Operator):
+    # ベクター出力(EPS / AI(EPS))のストロークをフレームごとにGrease Pencilに変換する
+    # Grease Pencilオブジェクトはカメラの子にし、ストロークをカメラのフレーム上に配置する
+    bl_idname = "pcl4.bake_grease_pencil"
+    bl_label = "Bake to Grease Pencil"
+    bl_description = "Draw lines over a frame range and convert the vector output into Grease Pencil strokes"
+    bl_options = {'REGISTER', 'UNDO'}
+    bl_translation_context = Translation.ctxt
+
+    view_layer: bpy.props.StringProperty(default="", options={"HIDDEN"})
+    output_index: bpy.props.IntProperty(default=-1, options={"HIDDEN"})
+    render: bpy.props.BoolProperty(name="Render Frames", default=True,
+                                   description="Draw the lines of each frame before baking. When disabled, existing vector files are used")
+    use_scene_frame_range: bpy.props.BoolProperty(name="Use Scene Frame Range", default=True)
+    frame_start: bpy.props.IntProperty(name="Start", default=1)
+    frame_end: bpy.props.IntProperty(name="End", default=1)
+    object_name: bpy.props.StringProperty(name="Object", default="Pencil+ 4 Lines")
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        layout = self.layout
+        layout.use_property_split = True
+        layout.use_property_decorate = False
+        layout.prop(self, "object_name", text_ctxt=Translation.ctxt)
+        layout.prop(self, "render", text_ctxt=Translation.ctxt)
+        layout.prop(self, "use_scene_frame_range", text_ctxt=Translation.ctxt)
+        col = layout.column(align=True)
+        col.enabled = not self.use_scene_frame_range
+        col.prop(self, "frame_start", text_ctxt=Translation.ctxt)
+        col.prop(self, "frame_end", text_ctxt=Translation.ctxt)
+
+    def execute(self, context):
+        scene = context.scene
+        view_layer = scene.view_layers.get(self.view_layer) if self.view_layer else context.view_layer
+        if view_layer is None:
+            self.report({'ERROR'}, "View layer not found.")
+            return {'CANCELLED'}
+        outputs = view_layer.pencil4_line_outputs
+        index = outputs.vector_output_selected_index if self.output_index < 0 else self.output_index
+        if not 0 <= index < len(outputs.vector_outputs):
+            self.report({'ERROR'}, "Vector output not found.")
+            return {'CANCELLED'}
+        output = outputs.vector_outputs[index]
+        if output.file_type not in ("AIEPS", "EPS"):
+            self.report({'ERROR'}, "Grease Pencil baking requires an EPS or AI(EPS) vector output.")
+            return {'CANCELLED'}
+        if self.render and not output.on:
+            self.report({'ERROR'}, "The vector output is disabled.")
+            return {'CANCELLED'}
+        camera = scene.camera
+        if camera is None or camera.type != "CAMERA":
+            self.report({'ERROR'}, "Camera not found.")
+            return {'CANCELLED'}
+
+        if self.render and pencil4_handler.in_render_session():
+            self.report({'ERROR'}, "Cannot bake while rendering.")
+            return {'CANCELLED'}
+
+        frame_start = scene.frame_start if self.use_scene_frame_range else self.frame_start
+        frame_end = scene.frame_end if self.use_scene_frame_range else self.frame_end
+        gp_object = get_grease_pencil_object(context, self.object_name, camera)
+        frame_current = scene.frame_current
+        baked_frames = 0
+        missing_frames = []
+        # シーンのレンダリングは行わず、レンダリング時と同じ手順でラインのみを描画してベクターファイルを書き出す
+        session = None
+        if self.render:
+            session = pencil4_render_session.Pencil4RenderSession()
+            pencil4_viewport.ViewportLineRenderManager.in_render_session = True
+            pencil4_render_images.correct_duplicated_output_images(scene)
+            pencil4_render_images.setup_images(scene)
+            pencil4_render_images.VectorOutputPathResolver.begin()
+        try:
+            for frame in range(frame_start, frame_end + 1, scene.frame_step):
+                scene.frame_set(frame)
+                if session is not None:
+                    depsgraph = view_layer.depsgraph
+                    depsgraph.update()
+                    session.draw_line(depsgraph)
+                    session.cleanup_frame()
+                    pencil4_handler.wait_vector_file_transfers()
+                # <LineName>などでファイルがラインごとに分かれる場合は、ラインごとのレイヤーにベイクする
+                baked = False
+                for line_name, path in output.get_file_paths(frame):
+                    with line_data.open_stroke_index(path) as index:
+                        strokes = index.select()
+                        bounding_box = index.bounding_box
+                    if bounding_box is None:
+                        continue
+                    points, radii = to_camera_space(strokes, bounding_box, camera.data, scene)
+                    bake_frame(gp_object, get_layer_name(output.sub_path, line_name), frame, strokes, points, radii)
+                    baked = True
+                if baked:
+                    baked_frames += 1
+                else:
+                    missing_frames.append(frame)
+        finally:
+            if session is not None:
+                session.cleanup_all()
+                pencil4_handler.wait_vector_file_transfers()
+                pencil4_render_images.VectorOutputPathResolver.end()
+                pencil4_viewport.ViewportLineRenderManager.in_render_session = False
+            scene.frame_set(frame_current)
+
+        if len(missing_frames) > 0:
+            self.report({'WARNING'}, f"Vector files not found for {len(missing_frames)} frames (first: {missing_frames[0]}).")
+        self.report({'INFO'}, f"Baked {baked_frames} frames to {gp_object.name}.")
+        return {'FINISHED'}
+
+
+def get_material() -> bpy.types.Material:
+    material = bpy.data.materials.get(_MATERIAL_NAME)
+    if material is None:
+        material = bpy.data.materials.new(_MATERIAL_NAME)
+    if not material.is_grease_pencil:
+        bpy.data.materials.create_gpencil_data(material)
+        material.grease_pencil.show_fill = False
+        material.grease_pencil.color = (1.0, 1.0, 1.0, 1.0)
+    return material
+
+
+def get_grease_pencil_object(context, name: str, camera: bpy.types.Object) -> bpy.types.Object:
+    gp_type = "GREASEPENCIL" if _use_grease_pencil_v3 else "GPENCIL"
+    gp_object = bpy.data.objects.get(name)
+    if gp_object is None or gp_object.type != gp_type:
+        data_collection = getattr(bpy.data, "grease_pencils_v3", bpy.data.grease_pencils) if _use_grease_pencil_v3 else bpy.data.grease_pencils
+        gp_object = bpy.data.objects.new(name, data_collection.new(name))
+        context.scene.collection.objects.link(gp_object)
+    if gp_object.parent != camera:
+        gp_object.parent = camera
+    gp_object.matrix_parent_inverse = Matrix.Identity(4)
+    gp_object.matrix_basis = Matrix.Identity(4)
+    material = get_material()
+    if material.name not in gp_object.data.materials:
+        gp_object.data.materials.append(material)
+    return gp_object
+
+
+def to_camera_space(strokes: line_data.StrokeArrays, bounding_box: tuple, camera: bpy.types.Camera,
+                    scene: bpy.types.Scene) -> tuple[np.ndarray, np.ndarray]:
+    # ベクターファイルの座標(左下原点)をカメラのフレーム上の点(カメラのローカル座標)に変換する
+    # (点の配列 (点数, 3), ストロークごとの半径) を返す
+    top_right, bottom_right, bottom_left, top_left = (np.array(v, dtype=np.float64) for v in camera.view_frame(scene=scene))
+    left, bottom, right, top = bounding_box
+    axis_x = bottom_right - bottom_left
+    axis_y = top_left - bottom_left
+    u = (strokes.points[:, 0].astype(np.float64) - left) / max(right - left, 1e-6)
+    v = (strokes.points[:, 1].astype(np.float64) - bottom) / max(top - bottom, 1e-6)
+    points = bottom_left + u[:, np.newaxis] * axis_x + v[:, np.newaxis] * axis_y
+    unit_per_pixel = np.linalg.norm(axis_x) / max(right - left, 1e-6)
+    return (points.astype(np.float32), (strokes.widths * (0.5 * unit_per_pixel)).astype(np.float32))
+
+
+def get_layer_name(sub_path: str, line_name: str) -> str:
+    # サブパスからフレーム番号の#を除き、<LineName>などをライン名に置き換えてレイヤー名にする
+    name = re.sub("\\<(LineName|linename|LINENAME|Linename)\\>", lambda _: line_name, sub_path)
+    return name.replace("#", "").strip("_-. ") or "Lines"
+
+
+def bake_frame(gp_object: bpy.types.Object, layer_name: str, frame: int, strokes: line_data.StrokeArrays,
+               points: np.ndarray, radii: np.ndarray):
+    counts = np.diff(strokes.offsets)
+    valid = counts > 0
+    material_index = gp_object.data.materials.find(_MATERIAL_NAME)
+    colors = np.concatenate([strokes.colors, np.ones((len(strokes.colors), 1), dtype=np.float32)], axis=1)
+    if _use_grease_pencil_v3:
+        _bake_frame_v3(gp_object.data, layer_name, frame, counts, valid, points, radii, colors, strokes.closed, material_index)
+    else:
+        _bake_frame_legacy(gp_object.data, layer_name, frame, strokes.offsets, valid, points, strokes.widths, colors, strokes.closed, material_index)
+
+
+def _get_attribute(attributes, name: str, type: str, domain: str):
+    attribute = attributes.get(name)
+    if attribute is None:
+        attribute = attributes.new(name, type, domain)
+    return attribute
+
+
+def _bake_frame_v3(grease_pencil, layer_name: str, frame: int, counts: np.ndarray, valid: np.ndarray,
+                   points: np.ndarray, radii: np.ndarray, colors: np.ndarray, closed: np.ndarray, material_index: int):
+    # 全ストロークを1回のadd_strokesで作成し、点と曲線の属性をforeach_setでまとめて設定する
+    layer = grease_pencil.layers.get(layer_name) or grease_pencil.layers.new(layer_name)
+    if any(x.frame_number == frame for x in layer.frames):
+        layer.frames.remove(frame)
+    drawing = layer.frames.new(frame).drawing
+    counts = counts[valid]
+    if len(counts) == 0:
+        return
+    drawing.add_strokes(counts.tolist())
+
+    attributes = drawing.attributes
+    attributes["position"].data.foreach_set("vector", points.ravel())
+    _get_attribute(attributes, "radius", "FLOAT", "POINT").data.foreach_set("value", np.repeat(radii[valid], counts))
+    _get_attribute(attributes, "vertex_color", "FLOAT_COLOR", "POINT").data.foreach_set("color", np.repeat(colors[valid], counts, axis=0).ravel())
+    _get_attribute(attributes, "cyclic", "BOOLEAN", "CURVE").data.foreach_set("value", closed[valid])
+    _get_attribute(attributes, "material_index", "INT", "CURVE").data.foreach_set("value", np.full(len(counts), material_index, dtype=np.int32))
+
+
+def _bake_frame_legacy(grease_pencil, layer_name: str, frame: int, offsets: np.ndarray, valid: np.ndarray,
+                       points: np.ndarray, widths: np.ndarray, colors: np.ndarray, closed: np.ndarray, material_index: int):
+    # Blender 4.2以前のAPIにはストロークや点を一括で作成する手段が無いため、作成と点の設定のみストロークごとに行い、
+    # ストロークの属性はフレームのストロークに対してforeach_setでまとめて設定する
+    # 線幅はピクセル単位の値をそのまま使用する。新しいストロークの表示モードは3D空間
+    layer = grease_pencil.layers.get(layer_name) or grease_pencil.layers.new(layer_name)
+    existing = next((x for x in layer.frames if x.frame_number == frame), None)
+    if existing is not None:
+        layer.frames.remove(existing)
+    gp_frame = layer.frames.new(frame)
+    indices = np.flatnonzero(valid)
+    point_colors = np.repeat(colors, np.diff(offsets), axis=0)
+    for i in indices.tolist():
+        start, end = int(offsets[i]), int(offsets[i + 1])
+        stroke_points = gp_frame.strokes.new().points
+        stroke_points.add(end - start)
+        stroke_points.foreach_set("co", points[start:end].ravel())
+        stroke_points.foreach_set("vertex_color", point_colors[start:end].ravel())
+    gp_frame.strokes.foreach_set("material_index", np.full(len(indices), material_index, dtype=np.int32))
+    gp_frame.strokes.foreach_set("use_cyclic", closed[indices])
+    gp_frame.strokes.foreach_set("line_width", np.maximum(1, np.round(widths[indices])).astype(np.int32))
@@ -7,10 +7,14 @@ if "bpy" in locals():
     imp.reload(pencil4_render_session)
     imp.reload(pencil4_render_images)
     imp.reload(pencil4_viewport)
+    imp.reload(pencil4_viewport_compositor_override)
+    imp.reload(pencil4_vector_writer)
 else:
     from . import pencil4_render_session
     from . import pencil4_render_images
     from . import pencil4_viewport
+    from . import pencil4_viewport_compositor_override
+    from . import pencil4_vector_writer
 
 from .pencil4_render_session import Pencil4RenderSession as RenderSession
 from .merge_helper import merge_helper
@@ -59,6 +63,7 @@ def on_pre_render(scene: bpy.types.Scene):
             pencil4_viewport.ViewportLineRenderManager.in_render_session = True
             pencil4_render_images.correct_duplicated_output_images(scene)
             pencil4_render_images.setup_images(scene)
+            pencil4_render_images.VectorOutputPathResolver.begin()
     else:
         __session.cleanup_frame()
 
@@ -68,6 +73,8 @@ def on_render_cancel(scene: bpy.types.Scene):
     if __session is not None:
         __session.cleanup_all()
         __session = None
+        wait_vector_file_transfers()
+        pencil4_render_images.VectorOutputPathResolver.end()
         pencil4_render_images.unpack_images(scene)
         pencil4_viewport.ViewportLineRenderManager.in_render_session = False
         restore_hidden_shader_nodes()
@@ -78,16 +85,24 @@ def on_render_complete(scene: bpy.types.Scene):
     if __session is not None:
         __session.cleanup_all()
         __session = None
+        wait_vector_file_transfers()
+        pencil4_render_images.VectorOutputPathResolver.end()
         pencil4_render_images.unpack_images(scene)
         pencil4_viewport.ViewportLineRenderManager.in_render_session = False
         restore_hidden_shader_nodes()
 
+def wait_vector_file_transfers():
+    _, failures = pencil4_vector_writer.VectorFileWriter.wait()
+    for failure in failures:
+        pencil4_render_session.show_render_error(failure)
+
 @persistent
 def on_post_frame_change(scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph):
     global __session
     if __session is not None:
         __session.draw_line(depsgraph)
     pencil4_viewport.ViewportLineRenderManager.invalidate_objects_cache()
+    pencil4_viewport_compositor_override.Manager.invalidate()
 
 @persistent
 def on_save_pre(dummy):
@@ -105,6 +120,8 @@ def on_save_post(dummy):
 def on_load_post(dummy):
     pencil4_viewport.on_load_post()
     pencil4_render_images.ViewLayerLineOutputs.on_load_post()
+    pencil4_render_images.ImageOwnershipRegistry.invalidate()
+    pencil4_viewport_compositor_override.Manager.invalidate()
     merge_helper.unlink()
     PencilNodeTree.correct_curve_tree()
     PencilNodeTree.migrate_nodes()
@@ -114,11 +131,15 @@ def on_depsgraph_update_pre(scene: bpy.types.Scene):
     global __depsgraph_update_lock
     __depsgraph_update_lock.acquire()
     pencil4_viewport.ViewportLineRenderManager.invalidate_objects_cache()
+    pencil4_viewport.ViewportLineRenderManager.invalidate_frame_cache()
 
 @persistent
-def on_depsgraph_update_post(scene: bpy.types.Scene):
+def on_depsgraph_update_post(scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph = None):
     global __depsgraph_update_lock
     __depsgraph_update_lock.release()
+    pencil4_render_images.ImageOwnershipRegistry.on_depsgraph_update(depsgraph)
+    if depsgraph is None or any(isinstance(update.id, (bpy.types.NodeTree, bpy.types.Image, bpy.types.Scene)) for update in depsgraph.updates):
+        pencil4_viewport_compositor_override.Manager.invalidate()
 
 # Blender 3.5 ~ 4.1 では、レンダリング中に特定のシェーダーノードを表示するとフリーズする問題がある
 # 対策として、フリーズの原因になる表示中のシェーダーノードを隠す
@@ -16,8 +16,27 @@ import os
 class PCL4_Preferences(bpy.types.AddonPreferences):
     bl_idname = __package__
 
+    viewport_buffer_format_items = (
+        ("FLOAT", "Float", "32-bit float RGBA", 0),
+        ("BYTE", "8-bit", "8-bit premultiplied RGBA", 2),
+        ("PALETTE", "Alpha + Palette", "8-bit alpha with a single line color, or 8-bit RGBA when the lines use several colors", 3),
+    )
+
+    line_image_detach_method_items = (
+        ("CACHE_FILE", "Cache File", "Save rendered lines to a temporary EXR file", 0),
+        ("PACK", "Pack and Unpack", "Pack rendered lines into the file and remove the packed data", 1),
+    )
+
     render_app_path: bpy.props.StringProperty(default="", subtype="FILE_PATH")
     viewport_render_timeout: bpy.props.FloatProperty(default=2.0, min=0.5, max=10.0)
+    viewport_frame_cache_size: bpy.props.IntProperty(default=256, min=0, max=65536,
+                                                   description="Memory for lines already drawn in the viewport. Reused only while playing back or scrubbing a scene that has not changed")
+    viewport_buffer_format: bpy.props.EnumProperty(items=viewport_buffer_format_items, default="BYTE")
+    line_image_detach_method: bpy.props.EnumProperty(items=line_image_detach_method_items, default="PACK")
+    vector_output_async: bpy.props.BoolProperty(default=True)
+    vector_output_writer_threads: bpy.props.IntProperty(default=2, min=1, max=16)
+    vector_output_fsync: bpy.props.BoolProperty(default=False)
+    vector_output_atomic_rename: bpy.props.BoolProperty(default=True)
     abort_rendering_if_error_occur: bpy.props.BoolProperty(default=False)
 
     def draw(self, context):
@@ -25,6 +44,15 @@ class PCL4_Preferences(bpy.types.AddonPreferences):
 
         layout.prop(self, "render_app_path", text="PSOFT Pencil+ 4 Render App Path", text_ctxt=Translation.ctxt)
         layout.prop(self, "viewport_render_timeout", text="Viewport Preview Timeout Period", text_ctxt=Translation.ctxt)
+        layout.prop(self, "viewport_frame_cache_size", text="Viewport Preview Frame Cache (MB)", text_ctxt=Translation.ctxt)
+        layout.prop(self, "viewport_buffer_format", text="Viewport Preview Buffer Format", text_ctxt=Translation.ctxt)
+        layout.prop(self, "line_image_detach_method", text="Line Image Storage after Rendering", text_ctxt=Translation.ctxt)
+        layout.prop(self, "vector_output_async", text="Write Vector Files in Background", text_ctxt=Translation.ctxt)
+        col = layout.column()
+        col.enabled = self.vector_output_async
+        col.prop(self, "vector_output_writer_threads", text="Vector File Writer Threads", text_ctxt=Translation.ctxt)
+        col.prop(self, "vector_output_fsync", text="Flush Vector Files to Disk", text_ctxt=Translation.ctxt)
+        col.prop(self, "vector_output_atomic_rename", text="Replace Vector Files Atomically", text_ctxt=Translation.ctxt)
         layout.prop(self, "abort_rendering_if_error_occur", text="Abort Rendering when Errors Occur", text_ctxt=Translation.ctxt)
 
         layout.separator()
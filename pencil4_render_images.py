@@ -4,16 +4,24 @@
 if "bpy" in locals():
     import imp
     imp.reload(cpp_ulits)
+    imp.reload(image_utils)
+    imp.reload(exr_writer)
+    imp.reload(line_data)
 else:
     from .misc import cpp_ulits
+    from .misc import image_utils
+    from .misc import exr_writer
+    from . import line_data
 
 import sys
 import platform
 import os
 import re
+import glob
 from typing import Tuple
 import bpy
 import itertools
+import numpy as np
 from typing import Iterable
 
 
@@ -64,6 +72,15 @@ def get_element_image_name_prefix(view_layer: bpy.types.ViewLayer) -> str:
 class OutputImage(bpy.types.PropertyGroup):
     main: bpy.props.PointerProperty(type=bpy.types.Image)
 
+    # 描画後の画像の保存形式。ネイティブの描画先は常にfloatのRGBAのため、レンダリング後のキャッシュファイルへの切り離しと
+    # マルチレイヤーEXRの書き出しに適用する。メモリ使用量が減るのは、切り離した後に8bitの画像として読み込み直すBYTEのみ
+    # Blenderは半精度や1チャンネルのEXRもfloatのRGBAバッファとして読み込むため、それらの形式はメモリ使用量を減らせず、提供しない
+    storage_format_items = (
+        ("FLOAT", "Float", "32-bit float RGBA", 0),
+        ("BYTE", "8-bit", "8-bit RGBA (for masks). Reloaded as an 8-bit image after rendering when cached to a file, which reduces memory use", 3),
+    )
+    storage_format: bpy.props.EnumProperty(items=storage_format_items, default="FLOAT")
+
     def contains(self, image:bpy.types.Image):
         if image is None:
             return False
@@ -114,34 +131,119 @@ class VectorOutput(bpy.types.PropertyGroup):
     file_type_items = (
         ("AIEPS", "AI(EPS)", "Adobe Illustrator 8 EPS", 0),
         ('EPS', "EPS", "Encapsulated Post Scrip", 1),
-        ('PLD', "PLD", "Pencil+ Line Data", 2),
+        ('PLD', "PLD", "Pencil+ Line Data (cannot be baked to Grease Pencil)", 2),
+        ("SVG", "SVG", "Scalable Vector Graphics", 3),
+    )
+    # SVGはネイティブ側ではEPSとして描画し、転送時にPythonでSVGに変換する
+    cpp_enum_fallbacks = {"file_type": {"SVG": "EPS"}}
+    svg_group_by_items = (
+        ("NONE", "None", "Write all lines into a single group", 0),
+        ("EDGE_TYPE", "Edge Type", "Group lines by edge type", 1),
+        ("LINE_SET", "Line Set", "Group lines by line set ID", 2),
+        ("VISIBILITY", "Visibility", "Group lines into visible and hidden lines", 3),
+    )
+    edge_type_props = (
+        ("outline_on", "outline"),
+        ("object_on", "object"),
+        ("intersection_on", "intersection"),
+        ("smoothing_on", "smoothing"),
+        ("material_id_on", "material_id"),
+        ("selected_edges_on", "selected_edges"),
+        ("normal_angle_on", "normal_angle"),
+        ("wireframe_on", "wireframe"),
+    )
+    visibility_props = (
+        ("visible_lines_on", "visible"),
+        ("hidden_lines_on", "hidden"),
+    )
+    svg_group_separator = "__"
+    compression_items = (
+        ("NONE", "None", "Write uncompressed files", 0),
+        ("GZIP", "gzip", "Compress with gzip", 1),
+        ("ZSTD", "Zstandard", "Compress with Zstandard (falls back to gzip when unavailable)", 2),
     )
+    container_mode_items = (
+        ("NONE", "Separate Files", "Write a file for each frame and line", 0),
+        ("OUTPUT", "Container per Output", "Append all frames and lines to a single container file", 1),
+        ("LINE", "Container per Line", "Append all frames of each line to a container file", 2),
+    )
+    line_name_pattern = "_{0,1}\\<(LineName|linename|LINENAME|Linename)\\>"
 
     def get_output_path(self):
-        for view_layer in itertools.chain.from_iterable(scene.view_layers for scene in bpy.data.scenes):
-            if not view_layer.pencil4_line_outputs.output.main:
-                continue
-            for vector_output in view_layer.pencil4_line_outputs.vector_outputs:
-                if vector_output == self:
-                    sub_path = self.sub_path
-                    placeholder_count = sub_path.count("#")
-                    if placeholder_count == 0:
-                        sub_path += str(bpy.context.scene.frame_current).zfill(4)
-                    else:
-                        sub_path = sub_path.replace("#" * placeholder_count, str(bpy.context.scene.frame_current).zfill(placeholder_count))
-
-                    # base_pathに"/tmp"が設定されている場合、正確な絶対パスを取得する方法が分からないので、Image経由で絶対パスを取得する                    
-                    image = view_layer.pencil4_line_outputs.output.main
-                    filepath_raw = image.filepath_raw
-                    image.filepath_raw = view_layer.pencil4_line_outputs.vector_output_base_path
-                    path = image.filepath_from_user()
-                    image.filepath_raw = filepath_raw
-
-                    path = os.path.join(path, sub_path)
-                    path += ".pld" if self.file_type == "PLD" else ".eps"
-                    return path
+        view_layer = ImageOwnershipRegistry.get_vector_output_owner(self)
+        if view_layer is not None and view_layer.pencil4_line_outputs.output.main:
+            path = os.path.join(VectorOutputPathResolver.get_base_dir(view_layer),
+                                VectorOutputPathResolver.format_sub_path(self.sub_path, bpy.context.scene.frame_current))
+            path += ".pld" if self.file_type == "PLD" else ".eps"
+            return path
         return ""
 
+    def get_file_paths(self, frame: int) -> list[Tuple[str, str]]:
+        # 指定のフレームで書き出されたファイルの (ライン名, パス(圧縮時の拡張子を含む)) のリストを返す。コンテナに追記する出力では使用しない
+        # サブパスに<LineName>などを含む場合、ネイティブ側はラインごとにファイルを分けて書き出すため、一致する既存のファイルを列挙する
+        view_layer = ImageOwnershipRegistry.get_vector_output_owner(self)
+        if view_layer is None or not view_layer.pencil4_line_outputs.output.main:
+            return []
+        path = os.path.join(VectorOutputPathResolver.get_base_dir(view_layer),
+                            re.sub("\\<(LineName|linename|LINENAME|Linename)\\>", "<LineName>",
+                                   VectorOutputPathResolver.format_sub_path(self.sub_path, frame)))
+        path += {"PLD": ".pld", "SVG": ".svg"}.get(self.file_type, ".eps")
+        path += line_data.compression.get_extension(self.get_compression_spec()[0])
+        if "<LineName>" not in path:
+            return [("", path)] if os.path.isfile(path) else []
+        prefix, _, suffix = path.partition("<LineName>")
+        paths = glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix))
+        return [(x[len(prefix):len(x) - len(suffix)], x) for x in sorted(paths) if os.path.isfile(x)]
+
+    def get_svg_groups(self) -> list[Tuple[str, dict]]:
+        # SVGのグループごとに (グループ名, ネイティブ側の出力に上書きするプロパティ) を返す
+        # グループごとにネイティブ側の出力を分けて描画するため、グループの数だけ描画の負荷が増える
+        if self.svg_group_by == "EDGE_TYPE":
+            return [(name, {other: other == prop_name for other, _ in self.edge_type_props})
+                    for prop_name, name in self.edge_type_props if getattr(self, prop_name)]
+        if self.svg_group_by == "LINE_SET":
+            return [(f"line_set_{i + 1}", {"line_set_ids": [j == i for j in range(8)]})
+                    for i in range(8) if self.line_set_ids[i]]
+        if self.svg_group_by == "VISIBILITY":
+            return [(name, {other: other == prop_name for other, _ in self.visibility_props})
+                    for prop_name, name in self.visibility_props if getattr(self, prop_name)]
+        return [("lines", {})]
+
+    def get_svg_spec(self) -> Tuple[list[str], float, int]:
+        # SVGへの変換に必要な (グループ名のリスト, 簡略化の許容誤差, 小数点以下の桁数) を返す
+        # SVGのファイル名は、<LineName>などで分かれたネイティブ側の出力のファイル名から決める
+        if self.file_type != "SVG":
+            return None
+        return ([name for name, _ in self.get_svg_groups()],
+                self.svg_simplify_tolerance if self.svg_simplify_on else 0.0,
+                self.svg_precision)
+
+    def get_compression_spec(self) -> Tuple[int, int]:
+        # (圧縮形式, 圧縮レベル) を返す。zstdが使えない環境ではgzipで圧縮する
+        if self.file_type == "SVG" or self.compression == "NONE":
+            return (line_data.CODEC_NONE, 0)
+        codec = line_data.CODEC_ZSTD if self.compression == "ZSTD" else line_data.CODEC_GZIP
+        if not line_data.compression.is_available(codec):
+            codec = line_data.CODEC_GZIP
+        return (codec, self.compression_level)
+
+    def get_container_spec(self, frame: int) -> Tuple[str, str, str, str]:
+        # コンテナへの追記に必要な (モード, コンテナのパス, ファイル名のライン名より前, ライン名より後) を返す
+        # LINEモードのパスはライン名の位置に<LineName>を含む
+        if self.file_type != "PLD" or self.container_mode == "NONE":
+            return None
+        view_layer = ImageOwnershipRegistry.get_vector_output_owner(self)
+        if view_layer is None or not view_layer.pencil4_line_outputs.output.main:
+            return None
+        name = re.sub("#+", "", self.sub_path)
+        name = re.sub(self.line_name_pattern, "" if self.container_mode == "OUTPUT" else "_<LineName>", name)
+        name = name.strip("_-. ") or "Line"
+        path = os.path.join(VectorOutputPathResolver.get_base_dir(view_layer), name + ".pldseq")
+        file_name = re.sub("\\<(LineName|linename|LINENAME|Linename)\\>", "<LineName>",
+                           VectorOutputPathResolver.format_sub_path(self.sub_path, frame)) + ".pld"
+        prefix, _, suffix = file_name.partition("<LineName>")
+        return (self.container_mode, path, prefix, suffix)
+
     def update_sub_path(self, context):
         if self.file_type == "PLD":
             if not re.match("\\<(LineName|linename|LINENAME|Linename)\\>", self.sub_path):
@@ -155,6 +257,13 @@ class VectorOutput(bpy.types.PropertyGroup):
     sub_path: bpy.props.StringProperty(default="Line", subtype="FILE_NAME")
 
     file_type: bpy.props.EnumProperty(items=file_type_items, default="AIEPS", update=update_sub_path)
+    container_mode: bpy.props.EnumProperty(items=container_mode_items, default="NONE")
+    compression: bpy.props.EnumProperty(items=compression_items, default="NONE")
+    compression_level: bpy.props.IntProperty(default=6, min=1, max=19)
+    svg_simplify_on: bpy.props.BoolProperty(default=True)
+    svg_simplify_tolerance: bpy.props.FloatProperty(default=0.5, min=0.0, soft_max=4.0, subtype="PIXEL")
+    svg_precision: bpy.props.IntProperty(default=1, min=0, max=4)
+    svg_group_by: bpy.props.EnumProperty(items=svg_group_by_items, default="NONE")
     visible_lines_on: bpy.props.BoolProperty(default=True)
     hidden_lines_on: bpy.props.BoolProperty(default=True)
     outline_on: bpy.props.BoolProperty(default=True)
@@ -174,6 +283,22 @@ class ViewLayerLineOutputs(bpy.types.PropertyGroup):
     vector_outputs: bpy.props.CollectionProperty(type=VectorOutput)
     vector_output_selected_index: bpy.props.IntProperty(options={"HIDDEN", "SKIP_SAVE"})
     vector_output_base_path: bpy.props.StringProperty(subtype="DIR_PATH")
+    # ベクター出力のみを行い、レンダーエレメントの画像の確保・描画とメイン画像の切り離しを省略する
+    # ネイティブの描画は出力サイズをメイン画像から取得するため、メイン画像はレンダリングサイズで確保し、描画後に初期化する
+    vector_only: bpy.props.BoolProperty(default=False)
+
+    exr_compression_items = (
+        ("NONE", "None", "", 0),
+        ("ZIPS", "ZIPS", "Lossless, compressed one scanline at a time", 1),
+        ("ZIP", "ZIP", "Lossless, compressed 16 scanlines at a time", 2),
+        ("PIZ", "PIZ", "Lossless wavelet compression (requires OpenImageIO, otherwise ZIP)", 3),
+        ("DWAA", "DWAA", "Lossy DCT compression (requires OpenImageIO, otherwise ZIP)", 4),
+    )
+    # メイン画像と全てのレンダーエレメントを、フレームごとに1つのマルチレイヤーEXRに書き出す
+    exr_output_on: bpy.props.BoolProperty(default=False)
+    exr_output_path: bpy.props.StringProperty(default="//pencil4_line/Line_####", subtype="FILE_PATH")
+    exr_compression: bpy.props.EnumProperty(items=exr_compression_items, default="ZIP")
+    exr_half_float: bpy.props.BoolProperty(default=True)
 
     fix_output_after_load: bpy.props.BoolProperty(default=True)
 
@@ -181,9 +306,10 @@ class ViewLayerLineOutputs(bpy.types.PropertyGroup):
         return self.get_render_element_from_image(image) is not None
     
     def get_render_element_from_image(self, image:bpy.types.Image) -> RenderElement:
-        for elem in self.render_elements:
-            if elem.output.contains(image):
+        for _, view_layer, elem in ImageOwnershipRegistry.get_owners(image):
+            if elem is not None and view_layer.pencil4_line_outputs == self:
                 return elem
+        return None
     
     def rename_images(self, view_layer: bpy.types.ViewLayer):
         self.output.rename(get_image_name(view_layer))
@@ -223,10 +349,219 @@ class ViewLayerLineOutputs(bpy.types.PropertyGroup):
             view_layer.pencil4_line_outputs.rename_images(view_layer)
 
 
+class ImageOwnershipRegistry:
+    # 出力画像のポインタ -> [(シーン名, ビューレイヤー名, レンダーエレメントのインデックス(メインは-1)), ...]
+    # ベクター出力のポインタ -> (シーン名, ビューレイヤー名, インデックス)
+    # 1つの画像を複数のビューレイヤーで共有できるため、画像ごとに所属先のリストを保持する
+    # 参照時に実際の所属と一致するかを確認し、一致しないもの、または登録されていない画像があれば再構築する
+    # 登録されていない画像は次の無効化まで記録し、出力画像以外の参照のたびに再構築しないようにする
+    __image_owners = {}
+    __vector_output_owners = {}
+    __unowned_images = set()
+    __valid = False
+
+    @classmethod
+    def invalidate(cls):
+        cls.__valid = False
+
+    @classmethod
+    def on_depsgraph_update(cls, depsgraph: bpy.types.Depsgraph):
+        # 画像の追加、削除があった場合のみ無効化する
+        # ビューレイヤーの削除や名前の変更は、参照時の確認で検出して再構築する
+        if depsgraph is None or any(isinstance(update.id, bpy.types.Image) for update in depsgraph.updates):
+            cls.invalidate()
+
+    @classmethod
+    def rebuild(cls):
+        cls.__image_owners.clear()
+        cls.__vector_output_owners.clear()
+        cls.__unowned_images.clear()
+        for scene in bpy.data.scenes:
+            for view_layer in scene.view_layers:
+                cls.__register_view_layer(scene, view_layer)
+        cls.__valid = True
+
+    @classmethod
+    def register_view_layer(cls, scene: bpy.types.Scene, view_layer: bpy.types.ViewLayer):
+        # レンダーエレメントやベクター出力の追加、削除の後に、そのビューレイヤーの登録だけを更新する
+        if not cls.__valid:
+            return
+        for key, entries in list(cls.__image_owners.items()):
+            entries = [x for x in entries if x[0] != scene.name or x[1] != view_layer.name]
+            if len(entries) > 0:
+                cls.__image_owners[key] = entries
+            else:
+                del cls.__image_owners[key]
+        for key in [key for key, value in cls.__vector_output_owners.items() if value[0] == scene.name and value[1] == view_layer.name]:
+            del cls.__vector_output_owners[key]
+        cls.__unowned_images.clear()
+        cls.__register_view_layer(scene, view_layer)
+
+    @classmethod
+    def __register_view_layer(cls, scene: bpy.types.Scene, view_layer: bpy.types.ViewLayer):
+        outputs = view_layer.pencil4_line_outputs
+        if outputs.output.main is not None:
+            cls.__image_owners.setdefault(outputs.output.main.as_pointer(), []).append((scene.name, view_layer.name, -1))
+        for index, elem in enumerate(outputs.render_elements):
+            if elem.output.main is not None:
+                cls.__image_owners.setdefault(elem.output.main.as_pointer(), []).append((scene.name, view_layer.name, index))
+        for index, vector_output in enumerate(outputs.vector_outputs):
+            cls.__vector_output_owners[vector_output.as_pointer()] = (scene.name, view_layer.name, index)
+
+    @staticmethod
+    def __resolve_view_layer(entry) -> Tuple[bpy.types.Scene, bpy.types.ViewLayer]:
+        scene = bpy.data.scenes.get(entry[0])
+        view_layer = scene.view_layers.get(entry[1]) if scene is not None else None
+        return (scene, view_layer) if view_layer is not None else (None, None)
+
+    @classmethod
+    def __find_image_owners(cls, image: bpy.types.Image):
+        # 登録が実際の所属と一致しない場合はNoneを返す
+        owners = []
+        for entry in cls.__image_owners.get(image.as_pointer(), ()):
+            scene, view_layer = cls.__resolve_view_layer(entry)
+            if view_layer is None:
+                return None
+            outputs = view_layer.pencil4_line_outputs
+            if entry[2] < 0:
+                if outputs.output.main != image:
+                    return None
+                owners.append((scene, view_layer, None))
+            elif entry[2] < len(outputs.render_elements) and outputs.render_elements[entry[2]].output.main == image:
+                owners.append((scene, view_layer, outputs.render_elements[entry[2]]))
+            else:
+                return None
+        return owners
+
+    @classmethod
+    def get_owners(cls, image: bpy.types.Image) -> list[Tuple[bpy.types.Scene, bpy.types.ViewLayer, RenderElement]]:
+        # メインの出力画像として使われている場合、RenderElementはNoneになる
+        if image is None:
+            return []
+        image = image.original
+        if not cls.__valid:
+            cls.rebuild()
+        pointer = image.as_pointer()
+        owners = cls.__find_image_owners(image)
+        if owners is None or (len(owners) == 0 and pointer not in cls.__unowned_images):
+            cls.rebuild()
+            owners = cls.__find_image_owners(image) or []
+            if len(owners) == 0:
+                cls.__unowned_images.add(pointer)
+        return owners
+
+    @classmethod
+    def get_owner(cls, image: bpy.types.Image, scene: bpy.types.Scene = None, is_element: bool = None) -> Tuple[bpy.types.Scene, bpy.types.ViewLayer, RenderElement]:
+        # 条件に一致する最初の所属先を返す
+        # scene: 指定した場合はそのシーンのビューレイヤーに限る
+        # is_element: Trueの場合はレンダーエレメント、Falseの場合はメインの出力画像としての所属に限る
+        for owner in cls.get_owners(image):
+            if scene is not None and owner[0] != scene:
+                continue
+            if is_element is not None and (owner[2] is not None) != is_element:
+                continue
+            return owner
+        return None
+
+    @classmethod
+    def __find_vector_output_owner(cls, vector_output: VectorOutput):
+        entry = cls.__vector_output_owners.get(vector_output.as_pointer())
+        if entry is None:
+            return None
+        _, view_layer = cls.__resolve_view_layer(entry)
+        if view_layer is None:
+            return None
+        vector_outputs = view_layer.pencil4_line_outputs.vector_outputs
+        return view_layer if entry[2] < len(vector_outputs) and vector_outputs[entry[2]] == vector_output else None
+
+    @classmethod
+    def get_vector_output_owner(cls, vector_output: VectorOutput) -> bpy.types.ViewLayer:
+        # ベクター出力は必ずいずれかのビューレイヤーに属するため、見つからない場合は再構築する
+        if not cls.__valid:
+            cls.rebuild()
+        view_layer = cls.__find_vector_output_owner(vector_output)
+        if view_layer is None:
+            cls.rebuild()
+            view_layer = cls.__find_vector_output_owner(vector_output)
+        return view_layer
+
+
+class VectorOutputPathResolver:
+    # ベクター出力のパス解決のキャッシュ
+    # begin()からend()までの間(レンダリング中)は、出力フォルダの絶対パスとフォルダの作成・書き込み可否の確認結果を使い回す
+    __active = False
+    __base_dirs = {}
+    __dir_checks = {}
+
+    @classmethod
+    def begin(cls):
+        cls.__base_dirs.clear()
+        cls.__dir_checks.clear()
+        cls.__active = True
+
+    @classmethod
+    def end(cls):
+        cls.__active = False
+        cls.__base_dirs.clear()
+        cls.__dir_checks.clear()
+
+    @staticmethod
+    def format_sub_path(sub_path: str, frame: int) -> str:
+        placeholder_count = sub_path.count("#")
+        if placeholder_count == 0:
+            return sub_path + str(frame).zfill(4)
+        return sub_path.replace("#" * placeholder_count, str(frame).zfill(placeholder_count))
+
+    @staticmethod
+    def __resolve_base_dir(outputs: ViewLayerLineOutputs) -> str:
+        base_path = outputs.vector_output_base_path
+        image = outputs.output.main
+        if not base_path.replace("\\", "/").startswith("/tmp"):
+            return bpy.path.abspath(base_path, library=image.library)
+
+        # base_pathに"/tmp"が設定されている場合、正確な絶対パスを取得する方法が分からないので、Image経由で絶対パスを取得する
+        filepath_raw = image.filepath_raw
+        image.filepath_raw = base_path
+        path = image.filepath_from_user()
+        image.filepath_raw = filepath_raw
+        return path
+
+    @classmethod
+    def get_base_dir(cls, view_layer: bpy.types.ViewLayer) -> str:
+        outputs = view_layer.pencil4_line_outputs
+        if not cls.__active:
+            return cls.__resolve_base_dir(outputs)
+        key = (view_layer.id_data.name, view_layer.name, outputs.vector_output_base_path)
+        base_dir = cls.__base_dirs.get(key)
+        if base_dir is None:
+            base_dir = cls.__resolve_base_dir(outputs)
+            cls.__base_dirs[key] = base_dir
+        return base_dir
+
+    @classmethod
+    def check_dir(cls, dir: str, create_folder: bool) -> bool:
+        # フォルダが書き込み可能であればTrueを返す。create_folderがTrueの場合は必要に応じてフォルダを作成する
+        key = (dir, create_folder)
+        if cls.__active and key in cls.__dir_checks:
+            return cls.__dir_checks[key]
+        result = True
+        if create_folder and not os.path.exists(dir):
+            try:
+                os.makedirs(dir)
+            except Exception as e:
+                result = False
+        if result and not os.access(dir, os.W_OK):
+            result = False
+        if cls.__active:
+            cls.__dir_checks[key] = result
+        return result
+
+
 def register_props():
     bpy.types.ViewLayer.pencil4_line_outputs = bpy.props.PointerProperty(type=ViewLayerLineOutputs)
 
 def unregister_props():
+    ImageOwnershipRegistry.invalidate()
     del(bpy.types.ViewLayer.pencil4_line_outputs)
 
 def new_image(name:str) -> bpy.types.Image:
@@ -239,12 +574,15 @@ def new_image(name:str) -> bpy.types.Image:
 def get_image(view_layer: bpy.types.ViewLayer) -> bpy.types.Image:
     if view_layer is None:
         return None
-    if view_layer.pencil4_line_outputs.output.main is not None:
-        if view_layer.pencil4_line_outputs.output.main.name != "" and\
-        not view_layer.pencil4_line_outputs.output.main in set(bpy.data.images):
+    main = view_layer.pencil4_line_outputs.output.main
+    if main is not None:
+        # 名前で引けた場合は存在しているため、全画像の走査は名前で引けない場合だけ行う
+        if main.name != "" and bpy.data.images.get(main.name) != main and\
+        not main in set(bpy.data.images):
             view_layer.pencil4_line_outputs.output.main = None
     if view_layer.pencil4_line_outputs.output.main is None:
         view_layer.pencil4_line_outputs.output.main = new_image(get_image_name(view_layer))
+        ImageOwnershipRegistry.register_view_layer(view_layer.id_data, view_layer)
     return view_layer.pencil4_line_outputs.output.main
 
 
@@ -253,6 +591,7 @@ def new_element_image(view_layer: bpy.types.ViewLayer) -> bpy.types.Image:
         return None
     new_element:RenderElement = view_layer.pencil4_line_outputs.render_elements.add()
     new_element.output.main = new_image(get_element_image_name_prefix(view_layer))
+    ImageOwnershipRegistry.register_view_layer(view_layer.id_data, view_layer)
     return new_element.output.main
 
 
@@ -270,7 +609,7 @@ def setup_image(image: bpy.types.Image, width: int, height: int):
     if image.alpha_mode != "PREMUL":
         image.alpha_mode = "PREMUL"
     if image.size[0] != width or image.size[1] != height:
-        image.scale(image.size[0] if width <= 0 else width, image.size[1] if height <= 0 else height)
+        image_utils.resize_image(image, image.size[0] if width <= 0 else width, image.size[1] if height <= 0 else height)
 
 
 def setup_images(scene: bpy.types.Scene):
@@ -284,16 +623,79 @@ def setup_images(scene: bpy.types.Scene):
 
 
 def unpack_images(scene: bpy.types.Scene):
-    def unpack_image(image: bpy.types.Image):
-        if image is not None:
-            image.pack()
-            if image.packed_file is not None:
-                image.unpack(method='REMOVE')
+    # レンダリング結果の画素を生成画像の状態から切り離す
+    # CACHE_FILEでは一時フォルダのファイルに直接保存し、パックデータの生成と破棄を省略する
+    # 保存形式はOutputImage.storage_formatに従い、8bitの画像はPNGに保存して読み込み直す
+    detach_method = bpy.context.preferences.addons[__package__].preferences.line_image_detach_method
+    cache_dir = os.path.join(bpy.app.tempdir, "pencil4_line_cache")
+    def unpack_image(output: OutputImage):
+        image = output.main
+        if image is None:
+            return
+        if detach_method == "CACHE_FILE":
+            # 保存後の画像はsourceがFILEになるため、ファイルパスと形式は保存したキャッシュファイルを指したままにし、
+            # 元のファイルパスを復元しない(復元すると古いファイルを参照する画像になる)。半精度の設定のみを元に戻す
+            # 名前が異なっても同じファイル名になり得るため、ファイル名には画像のポインタを含める
+            original_settings = (image.filepath_raw, image.file_format)
+            original_half_precision = image.use_half_precision
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                is_byte = output.storage_format == "BYTE"
+                image.filepath_raw = os.path.join(cache_dir, f"{bpy.path.clean_name(image.name)}_{image.as_pointer():x}" + (".png" if is_byte else ".exr"))
+                image.file_format = "PNG" if is_byte else "OPEN_EXR"
+                if not is_byte:
+                    image.use_half_precision = False
+                image.save()
+                if is_byte:
+                    image.reload()
+                return
+            except (OSError, RuntimeError):
+                # 保存に失敗した場合は設定を元に戻し、パックで切り離す
+                image.filepath_raw, image.file_format = original_settings
+            finally:
+                image.use_half_precision = original_half_precision
+        image.pack()
+        if image.packed_file is not None:
+            image.unpack(method='REMOVE')
     for view_layer in scene.view_layers:
+        if view_layer.pencil4_line_outputs.vector_only:
+            continue
+        outputs = view_layer.pencil4_line_outputs
         (image, element_dict) = enumerate_images_from_compositor_nodes(view_layer)
-        unpack_image(image)
-        for i in element_dict.keys():
-            unpack_image(i)
+        if image is not None:
+            unpack_image(outputs.output)
+        for elem in outputs.render_elements:
+            if elem.output.main in element_dict:
+                unpack_image(elem.output)
+
+
+def write_multilayer_exr(view_layer: bpy.types.ViewLayer, image: bpy.types.Image, element_images: Iterable[bpy.types.Image], frame: int) -> str:
+    # メイン画像とレンダーエレメントの画像を1つのマルチレイヤーEXRに書き出す。警告があればその内容を返す
+    # レイヤー名はビューレイヤー名、パス名はメイン画像が"Line"、レンダーエレメントが"Element<番号>"
+    # 画像ごとの保存形式に従う。FLOATはEXR出力の設定、BYTEは半精度で書き出す
+    outputs = view_layer.pencil4_line_outputs
+    element_images = set(element_images)
+    layer_name = view_layer.name.replace(".", "_")
+    images = [("Line", outputs.output)] if image is not None else []
+    images += [(f"Element{i + 1}", elem.output) for i, elem in enumerate(outputs.render_elements) if elem.output.main in element_images]
+    if len(images) == 0:
+        return None
+
+    width, height = images[0][1].main.size
+    layers = []
+    for pass_name, output in images:
+        pass_image = output.main
+        if tuple(pass_image.size) != (width, height):
+            continue
+        pixels = np.empty(width * height * pass_image.channels, dtype=np.float32)
+        pass_image.pixels.foreach_get(pixels)
+        pixels = pixels.reshape(height, width, pass_image.channels)[::-1]
+        half = outputs.exr_half_float or output.storage_format == "BYTE"
+        layers.append((f"{layer_name}.{pass_name}", pixels, half))
+
+    path = VectorOutputPathResolver.format_sub_path(bpy.path.abspath(outputs.exr_output_path), frame) + ".exr"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return exr_writer.write_multilayer_exr(path, width, height, layers, outputs.exr_compression, outputs.exr_half_float)
 
 
 def reset_image(image: bpy.types.Image):
@@ -304,22 +706,20 @@ def reset_image(image: bpy.types.Image):
     if image.source == 'GENERATED':
         image.generated_color = [0, 0, 0, 0]
     else:
-        image.pixels = [0] * (image.size[0] * image.size[1] * 4)
+        image_utils.clear_image(image)
 
 
 def iterate_all_pencil_image_nodes(node_tree: bpy.types.NodeTree) -> Iterable[bpy.types.Node]:
     for node in node_tree.nodes:
-        if node.type == "IMAGE" and node.image is not None:
-            for view_layer in itertools.chain.from_iterable(scene.view_layers for scene in bpy.data.scenes):
-                if (view_layer.pencil4_line_outputs.contains_in_render_elements(node.image) or
-                    view_layer.pencil4_line_outputs.output.main == node.image):
-                    yield node
-                    break
+        if node.type == "IMAGE" and node.image is not None and len(ImageOwnershipRegistry.get_owners(node.image)) > 0:
+            yield node
     
 
 def enumerate_images_from_compositor_nodes(view_layer: bpy.types.ViewLayer, check_image_size: Tuple[int, int] = None) -> Tuple[bpy.types.Image, dict[bpy.types.Image, cpp.line_render_element]]:
+    # ベクター出力のみのビューレイヤーではレンダーエレメントを列挙しない
     main_image = None
     element_dict = {}
+    vector_only = view_layer.pencil4_line_outputs.vector_only
 
     if bpy.context.scene.node_tree is not None:
         for image in [node.image for node in bpy.context.scene.node_tree.nodes if node.type == "IMAGE" and node.image]:
@@ -327,7 +727,7 @@ def enumerate_images_from_compositor_nodes(view_layer: bpy.types.ViewLayer, chec
                 continue
             if image == view_layer.pencil4_line_outputs.output.main:
                 main_image = image
-            elif view_layer.pencil4_line_outputs.contains_in_render_elements(image):
+            elif not vector_only and view_layer.pencil4_line_outputs.contains_in_render_elements(image):
                 py_element = view_layer.pencil4_line_outputs.get_render_element_from_image(image)
                 cpp_element = cpp.line_render_element()
                 cpp_ulits.copy_props(py_element, cpp_element)
@@ -338,6 +738,10 @@ def enumerate_images_from_compositor_nodes(view_layer: bpy.types.ViewLayer, chec
 
 
 def enumerate_vector_outputs_from_compositor_nodes(view_layer: bpy.types.ViewLayer, create_folder: bool = False) -> list[cpp.vector_output]:
+    return [cpp_output for cpp_output, _ in enumerate_vector_output_pairs_from_compositor_nodes(view_layer, create_folder)]
+
+
+def enumerate_vector_output_pairs_from_compositor_nodes(view_layer: bpy.types.ViewLayer, create_folder: bool = False) -> list[Tuple[cpp.vector_output, VectorOutput]]:
     if bpy.context.scene.node_tree is not None:
         for image in [node.image for node in bpy.context.scene.node_tree.nodes if node.type == "IMAGE" and node.image]:
             if image == view_layer.pencil4_line_outputs.output.main:
@@ -349,16 +753,22 @@ def enumerate_vector_outputs_from_compositor_nodes(view_layer: bpy.types.ViewLay
                     cpp_ulits.copy_props(py_output, cpp_output)
 
                     dir = os.path.dirname(cpp_output.output_path)
-                    if create_folder:
-                        if not os.path.exists(dir):
-                            try:
-                                os.makedirs(dir)
-                            except Exception as e:
-                                continue
-                    if not os.access(dir, os.W_OK):
+                    if not VectorOutputPathResolver.check_dir(dir, create_folder):
                         continue
-                    
-                    outputs.append(cpp_output)
+
+                    if py_output.file_type != "SVG":
+                        outputs.append((cpp_output, py_output))
+                        continue
+
+                    # SVGはグループごとに出力を分け、ファイル名の末尾にグループ名を付ける
+                    root, ext = os.path.splitext(cpp_output.output_path)
+                    for group_name, overrides in py_output.get_svg_groups():
+                        group_output = cpp.vector_output()
+                        cpp_ulits.copy_props(py_output, group_output)
+                        for prop_name, value in overrides.items():
+                            setattr(group_output, prop_name, value)
+                        group_output.output_path = f"{root}{VectorOutput.svg_group_separator}{group_name}{ext}"
+                        outputs.append((group_output, py_output))
                 return outputs
 
     return []
@@ -9,6 +9,7 @@ if "bpy" in locals():
     import imp
     imp.reload(pencil4line_for_blender)
     imp.reload(pencil4_render_images)
+    imp.reload(pencil4_vector_writer)
     imp.reload(cpp_ulits)
 else:
     import bpy
@@ -43,6 +44,7 @@ else:
             else:
                 from .bin import pencil4line_for_blender_linux_311_450 as pencil4line_for_blender
     from . import pencil4_render_images
+    from . import pencil4_vector_writer
     from .misc import cpp_ulits
 
 from .node_tree import PencilNodeTree
@@ -51,6 +53,7 @@ from .node_tree.misc.DataUtils import line_object_types
 import bpy
 import itertools
 import os
+import numpy as np
 
 _dll_valid = False
 def get_dll_valid():
@@ -64,17 +67,25 @@ def get_render_size(depsgraph: bpy.types.Depsgraph) -> tuple[int, int]:
     height = depsgraph.scene.render.resolution_y * depsgraph.scene.render.resolution_percentage // 100
     return (width, height)
 
+class Pencil4SceneData:
+    def __init__(self):
+        self.line_nodes = []
+        self.line_function_nodes = []
+        self.render_instances = []
+        self.curve_data = dict()
+        self.groups = []
+        self.mesh_color_attributes = None
+
+
 class Pencil4RenderSession:
     def __init__(self):
         pencil4_render_images.ViewLayerLineOutputs.correct_image_names()
         self.__interm_context = pencil4line_for_blender.interm_context()
-        self.__curve_data = dict()
         self.__processed_view_layers = set()
 
 
     def cleanup_frame(self):
         self.__interm_context.cleanup_frame()
-        self.__curve_data.clear()
         self.__processed_view_layers.clear()
 
     def cleanup_all(self):
@@ -95,16 +106,36 @@ class Pencil4RenderSession:
         (image, element_dict) = pencil4_render_images.enumerate_images_from_compositor_nodes(depsgraph.view_layer, (width, height))
         if image is None and len(element_dict) == 0:
             return pencil4line_for_blender.draw_ret.success
+        # ベクター出力のみのビューレイヤーで、有効なベクター出力が無ければ描画しない
+        outputs = depsgraph.view_layer.pencil4_line_outputs
+        if outputs.vector_only and not any(x.on for x in outputs.vector_outputs):
+            return pencil4line_for_blender.draw_ret.success
 
         # 描画
         ret = pencil4line_for_blender.draw_ret.error_unknown
         try:
-            ret = self.__draw_line(depsgraph, width, height, image, element_dict,
-                                   is_cycles = depsgraph.scene.render.engine == "CYCLES",
-                                   is_eevee_next = depsgraph.scene.render.engine == "BLENDER_EEVEE_NEXT")
+            is_cycles = depsgraph.scene.render.engine == "CYCLES"
+            is_eevee_next = depsgraph.scene.render.engine == "BLENDER_EEVEE_NEXT"
+            scene_data = extract_scene(depsgraph, is_cycles=is_cycles, is_eevee_next=is_eevee_next)
+            ret = self.__draw_line(depsgraph, width, height, image, element_dict, scene_data)
+            if (ret == pencil4line_for_blender.draw_ret.success or ret == pencil4line_for_blender.draw_ret.success_without_license) and\
+                outputs.exr_output_on and not outputs.vector_only:
+                # コンポジットを経由せず、描画結果をマルチレイヤーEXRに書き出す
+                try:
+                    warning = pencil4_render_images.write_multilayer_exr(depsgraph.view_layer, image, element_dict.keys(), depsgraph.scene.frame_current)
+                    if warning is not None:
+                        show_render_error(warning)
+                except OSError as e:
+                    show_render_error(f"Failed to write multilayer EXR ({e.strerror or e})")
+                except Exception as e:
+                    # EXRの書き出しに失敗しても、ライン画像の描画結果は残す
+                    show_render_error(f"Failed to write multilayer EXR ({e})")
         finally:
-            if ret != pencil4line_for_blender.draw_ret.success and ret != pencil4line_for_blender.draw_ret.success_without_license:
+            failed = ret != pencil4line_for_blender.draw_ret.success and ret != pencil4line_for_blender.draw_ret.success_without_license
+            # ベクター出力のみの場合も、描画に使ったメイン画像の画素がコンポジットに渡らないよう初期化する
+            if failed or outputs.vector_only:
                 pencil4_render_images.reset_image(image)
+            if failed:
                 for i in element_dict.keys():
                     pencil4_render_images.reset_image(i)
 
@@ -123,7 +154,7 @@ class Pencil4RenderSession:
 
 
     def draw_line_for_viewport(self, depsgraph: bpy.types.Depsgraph, width: int, height: int, space: bpy.types.SpaceView3D, region_3d: bpy.types.RegionView3D,
-                               matrix_override = None):
+                               matrix_override = None, scene_data: Pencil4SceneData = None):
         if region_3d.view_perspective == "CAMERA" and space.camera is not None and space.camera.type == "CAMERA":
             camera: bpy.types.Camera = space.camera.data
             clip_start = camera.clip_start
@@ -134,27 +165,44 @@ class Pencil4RenderSession:
         else:
             clip_start = -3e38
             clip_end = 3e38
-        draw_option = self.get_draw_option(new_if_none = False)
         camera_matrix = region_3d.view_matrix.inverted()
         window_matrix = region_3d.window_matrix
         if matrix_override is not None:
             camera_matrix, window_matrix = matrix_override(camera_matrix, window_matrix)
+        if scene_data is None:
+            is_cycles, is_eevee_next = get_viewport_engine_flags(depsgraph, space)
+            scene_data = extract_scene(depsgraph, space=space, is_viewport=True, is_cycles=is_cycles, is_eevee_next=is_eevee_next)
+        return self.draw_line_for_view(depsgraph, width, height, clip_start, clip_end, camera_matrix, window_matrix, scene_data)
+
+
+    def draw_line_for_view(self, depsgraph: bpy.types.Depsgraph, width: int, height: int, clip_start: float, clip_end: float,
+                           camera_matrix: Matrix, window_matrix: Matrix, scene_data: Pencil4SceneData):
+        # 3Dビューに依存せず、指定のカメラ行列でビューポート用のライン描画を行う
+        draw_option = self.get_draw_option(new_if_none = False)
         interm_camera = pencil4line_for_blender.interm_camera(clip_start,
                             clip_end,
                             get_line_size_relative_type(depsgraph) if draw_option is not None and draw_option.linesize_relative_target_width > 0 else 0,
                             camera_matrix,
                             window_matrix)
-        return self.__draw_line(depsgraph, width, height, None, dict(),
-                                viewport_camera = interm_camera,
-                                space = space,
-                                is_cycles = depsgraph.scene.render.engine == "CYCLES" and space.shading.type == "RENDERED",
-                                is_eevee_next = (depsgraph.scene.render.engine == "BLENDER_EEVEE_NEXT" and (space.shading.type == "RENDERED" or space.shading.type == "MATERIAL")) or
-                                                (depsgraph.scene.render.engine == "CYCLES" and space.shading.type == "MATERIAL" and "BLENDER_EEVEE_NEXT" in bpy.types.RenderSettings.bl_rna.properties["engine"].enum_items.keys()))
+        return self.__draw_line(depsgraph, width, height, None, dict(), scene_data,
+                                viewport_camera = interm_camera)
 
 
     def get_viewport_image_buffer(self):
             return self.__interm_context.get_viewport_image_buffer()
 
+    def get_viewport_image_array(self) -> np.ndarray:
+        # ビューポートのライン描画結果をfloat32の1次元配列として取得する
+        # バッファプロトコルに対応していればコピーせずに参照し、そうでなければ1回だけ変換する
+        buffer = self.__interm_context.get_viewport_image_buffer()
+        try:
+            view = memoryview(buffer)
+        except TypeError:
+            return np.fromiter(buffer, dtype=np.float32, count=len(buffer))
+        if view.format == "f" and view.c_contiguous:
+            return np.frombuffer(view, dtype=np.float32)
+        return np.asarray(view, dtype=np.float32).reshape(-1)
+
 
     def __draw_line(self,
                     depsgraph: bpy.types.Depsgraph,
@@ -162,13 +210,10 @@ class Pencil4RenderSession:
                     height: int,
                     image: bpy.types.Image,
                     element_dict: dict[bpy.types.Image, pencil4line_for_blender.line_render_element],
-                    viewport_camera: pencil4line_for_blender.interm_camera = None,
-                    space: bpy.types.SpaceView3D = None,
-                    is_cycles: bool = False,
-                    is_eevee_next: bool = False) -> pencil4line_for_blender.draw_ret:
+                    scene_data: Pencil4SceneData,
+                    viewport_camera: pencil4line_for_blender.interm_camera = None) -> pencil4line_for_blender.draw_ret:
         # ライン描画設定が何もなければライン描画せず終了
-        (line_nodes, line_function_nodes) = PencilNodeTree.generate_cpp_nodes(depsgraph)
-        if len(line_nodes) == 0:
+        if len(scene_data.line_nodes) == 0:
             pencil4_render_images.reset_image(image)
             for i in element_dict.keys():
                 pencil4_render_images.reset_image(i)
@@ -184,89 +229,6 @@ class Pencil4RenderSession:
         is_viewport = viewport_camera is not None
         material_override = depsgraph.view_layer_eval.material_override if depsgraph.scene.render.engine == "CYCLES" else None
 
-        # Holdout設定
-        holdout_objects_from_collection = set()
-        check_holdout = depsgraph.scene.render.engine != "BLENDER_WORKBENCH"
-        if is_viewport and space and space.shading.type in ["WIREFRAME", "SOLID"]:
-            check_holdout = False
-        if check_holdout:
-            for object in itertools.chain.from_iterable([c.collection.objects for c in flatten_hierarchy(depsgraph.view_layer_eval.layer_collection) if c.holdout]):
-                holdout_objects_from_collection.add(object)
-
-        # 描画用オブジェクトのインスタンスの生成
-        render_instances = []
-        ungrouped_objects = set()
-        mesh_color_attributes = {}
-
-        system_tessellated_objects = set()
-        object_instance: bpy.types.DepsgraphObjectInstance
-        for object_instance in depsgraph.object_instances:
-            obj = object_instance.object
-            src_object = obj.original
-            if obj.type == "MESH" and src_object.type != "MESH":
-                system_tessellated_objects.add(src_object)
-
-        for object_instance in depsgraph.object_instances:
-            if not object_instance.show_self:
-                continue
-
-            obj = object_instance.object
-            if (is_cycles or is_eevee_next) and not obj.visible_camera:
-                continue
-            if is_viewport:
-                if object_instance.parent is not None:
-                    if not object_instance.parent.visible_get(view_layer=depsgraph.view_layer_eval, viewport=space):
-                        continue
-                elif not obj.visible_get(view_layer=depsgraph.view_layer_eval, viewport=space):
-                    continue
-            src_object = obj.original
-
-            # オブジェクトのメッシュを取得
-            mesh: bpy.types.Mesh = None
-            if obj.type == "MESH":
-                mesh = obj.data
-                if mesh.is_editmode:
-                    mesh = obj.to_mesh()
-            elif obj.type in line_object_types:
-                if src_object in system_tessellated_objects:
-                    continue
-                mesh = obj.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
-                if mesh is None:
-                    continue
-                if obj.type == "CURVE" and len(mesh.polygons) == 0:
-                    # カーブをメッシュに変換したとき、押し出し量が0の場合だとエッジのみが生成されポリゴンは生成されない
-                    # このとき、もともとのカーブに付随していたマテリアルの情報は失われてしまう
-                    # ライン描画にはマテリアルの情報が必要になる場合もあるので、欠損した情報を付加する必要がある
-                    curve: bpy.types.Curve = obj.data
-                    self.__curve_data[mesh] = pencil4line_for_blender.interm_curve_data(curve.materials, [x.material_index for x in curve.splines])
-            
-            if mesh is not None:
-                override_library = src_object.override_library
-                src_object = override_library.reference if override_library is not None else src_object
-
-                ungrouped_objects.add(src_object)
-
-                if check_holdout:
-                    holdout = obj.is_holdout
-                    if not holdout:
-                        holdout = (object_instance.parent if object_instance.parent is not None else obj) in holdout_objects_from_collection
-                else:
-                    holdout = False
-
-                object_materials = ()
-                if material_override is None and any([ms.link == "OBJECT" for ms in obj.material_slots]):
-                    object_materials = tuple([ms.material for ms in obj.material_slots])
-                
-                render_Instance = pencil4line_for_blender.interm_render_Instance(src_object, object_instance.matrix_world, mesh, holdout, object_materials)
-                render_instances.append(render_Instance)
-
-                if mesh_color_attributes is not None and mesh not in mesh_color_attributes:
-                    attr = getattr(mesh, "color_attributes", None)
-                    if attr is None:
-                        mesh_color_attributes = None
-                    else:
-                        mesh_color_attributes[mesh] = list(attr)
-
         # 描画用カメラ情報の生成
         interm_camera = None
         if viewport_camera is not None:
@@ -282,36 +244,15 @@ class Pencil4RenderSession:
                                 get_camera_matrix(scene_camera),
                                 projection)
 
-        # グループ設定
-        groups = []
-        def collect_group(collection: bpy.types.Collection):
-            if collection is None:
-                return
-            for child in collection.children:
-                collect_group(child)
-            for object in collection.objects:
-                if object.type == "EMPTY" and object.instance_type == "COLLECTION":
-                    collect_group(object.instance_collection)
-            if collection.pcl4_line_merge_group:
-                objects = set()
-                for x in collection.all_objects:
-                    x = x if x.override_library is None else x.override_library.reference
-                    if x in ungrouped_objects:
-                        objects.add(x)
-                if len(objects) > 0:
-                    groups.append(list(objects))
-                    ungrouped_objects.difference_update(objects)
-        collect_group(depsgraph.scene.collection)
-
         # 描画
         pencil4line_for_blender.set_blender_version(bpy.app.version[0], bpy.app.version[1], bpy.app.version[2])
         pencil4line_for_blender.set_render_app_path(bpy.context.preferences.addons[__package__].preferences.render_app_path)
 
-        if mesh_color_attributes is None:
+        if scene_data.mesh_color_attributes is None:
             self.__interm_context.mesh_color_attributes_on = False
         else:
             self.__interm_context.mesh_color_attributes_on = True
-            self.__interm_context.mesh_color_attributes = [(mesh, attr) for mesh, attr in mesh_color_attributes.items() if len(attr) > 0]
+            self.__interm_context.mesh_color_attributes = [(mesh, attr) for mesh, attr in scene_data.mesh_color_attributes.items() if len(attr) > 0]
 
         self.__interm_context.platform = f"Blender {bpy.app.version_string}"
 
@@ -322,26 +263,35 @@ class Pencil4RenderSession:
             self.__interm_context.task_name = task_name
             return self.__interm_context.draw_for_viewport(width, height,
                                         interm_camera,
-                                        render_instances,
+                                        scene_data.render_instances,
                                         material_override,
-                                        list(self.__curve_data.items()),
-                                        line_nodes,
-                                        line_function_nodes,
-                                        groups)
+                                        list(scene_data.curve_data.items()),
+                                        scene_data.line_nodes,
+                                        scene_data.line_function_nodes,
+                                        scene_data.groups)
         else:
             task_name += f" : {depsgraph.view_layer.name}"
             task_name += f" : frame {depsgraph.scene.frame_current}"
             self.__interm_context.task_name = task_name
-            return self.__interm_context.draw(image,
-                                        interm_camera,
-                                        render_instances,
-                                        material_override,
-                                        list(self.__curve_data.items()),
-                                        line_nodes,
-                                        line_function_nodes,
-                                        list(element_dict.values()),
-                                        pencil4_render_images.enumerate_vector_outputs_from_compositor_nodes(depsgraph.view_layer, True),
-                                        groups)
+
+            # ネイティブ側はdraw()の中でベクターファイルを同期的に書き出すため、書き出し先をローカルの作業フォルダに差し替える
+            # 出力先への転送のみをバックグラウンドで行う
+            vector_output_pairs = pencil4_render_images.enumerate_vector_output_pairs_from_compositor_nodes(depsgraph.view_layer, True)
+            vector_outputs = [cpp_output for cpp_output, _ in vector_output_pairs]
+            staged_vector_outputs = pencil4_vector_writer.VectorFileWriter.stage(vector_output_pairs, depsgraph.scene.frame_current)
+            try:
+                return self.__interm_context.draw(image,
+                                            interm_camera,
+                                            scene_data.render_instances,
+                                            material_override,
+                                            list(scene_data.curve_data.items()),
+                                            scene_data.line_nodes,
+                                            scene_data.line_function_nodes,
+                                            list(element_dict.values()),
+                                            vector_outputs,
+                                            scene_data.groups)
+            finally:
+                pencil4_vector_writer.VectorFileWriter.submit(staged_vector_outputs)
     
     def get_draw_option(self, new_if_none:bool = False):
         if new_if_none and self.__interm_context.draw_options is None:
@@ -352,6 +302,141 @@ class Pencil4RenderSession:
         self.__interm_context.draw_options = None
 
 
+def get_viewport_engine_flags(depsgraph: bpy.types.Depsgraph, space: bpy.types.SpaceView3D) -> tuple[bool, bool]:
+    return get_shading_engine_flags(depsgraph, space.shading.type)
+
+
+def get_shading_engine_flags(depsgraph: bpy.types.Depsgraph, shading_type: str) -> tuple[bool, bool]:
+    is_cycles = depsgraph.scene.render.engine == "CYCLES" and shading_type == "RENDERED"
+    is_eevee_next = (depsgraph.scene.render.engine == "BLENDER_EEVEE_NEXT" and (shading_type == "RENDERED" or shading_type == "MATERIAL")) or\
+                    (depsgraph.scene.render.engine == "CYCLES" and shading_type == "MATERIAL" and "BLENDER_EEVEE_NEXT" in bpy.types.RenderSettings.bl_rna.properties["engine"].enum_items.keys())
+    return (is_cycles, is_eevee_next)
+
+
+def extract_scene(depsgraph: bpy.types.Depsgraph,
+                  space: bpy.types.SpaceView3D = None,
+                  is_viewport: bool = False,
+                  is_cycles: bool = False,
+                  is_eevee_next: bool = False,
+                  shading_type: str = None) -> Pencil4SceneData:
+    # カメラや描画サイズに依存しない、デプスグラフ単位の描画用データを生成する
+    # ビューポートでは同じデプスグラフを表示する全てのリージョンでこの結果を共有する
+    scene_data = Pencil4SceneData()
+    (scene_data.line_nodes, scene_data.line_function_nodes) = PencilNodeTree.generate_cpp_nodes(depsgraph)
+    if len(scene_data.line_nodes) == 0 or not _dll_valid:
+        return scene_data
+    material_override = depsgraph.view_layer_eval.material_override if depsgraph.scene.render.engine == "CYCLES" else None
+
+    # Holdout設定
+    holdout_objects_from_collection = set()
+    check_holdout = depsgraph.scene.render.engine != "BLENDER_WORKBENCH"
+    if is_viewport and shading_type is None and space:
+        shading_type = space.shading.type
+    if is_viewport and shading_type in ["WIREFRAME", "SOLID"]:
+        check_holdout = False
+    if check_holdout:
+        for object in itertools.chain.from_iterable([c.collection.objects for c in flatten_hierarchy(depsgraph.view_layer_eval.layer_collection) if c.holdout]):
+            holdout_objects_from_collection.add(object)
+
+    # 描画用オブジェクトのインスタンスの生成
+    render_instances = scene_data.render_instances
+    ungrouped_objects = set()
+    mesh_color_attributes = {}
+
+    system_tessellated_objects = set()
+    object_instance: bpy.types.DepsgraphObjectInstance
+    for object_instance in depsgraph.object_instances:
+        obj = object_instance.object
+        src_object = obj.original
+        if obj.type == "MESH" and src_object.type != "MESH":
+            system_tessellated_objects.add(src_object)
+
+    for object_instance in depsgraph.object_instances:
+        if not object_instance.show_self:
+            continue
+
+        obj = object_instance.object
+        if (is_cycles or is_eevee_next) and not obj.visible_camera:
+            continue
+        if is_viewport:
+            if object_instance.parent is not None:
+                if not object_instance.parent.visible_get(view_layer=depsgraph.view_layer_eval, viewport=space):
+                    continue
+            elif not obj.visible_get(view_layer=depsgraph.view_layer_eval, viewport=space):
+                continue
+        src_object = obj.original
+
+        # オブジェクトのメッシュを取得
+        mesh: bpy.types.Mesh = None
+        if obj.type == "MESH":
+            mesh = obj.data
+            if mesh.is_editmode:
+                mesh = obj.to_mesh()
+        elif obj.type in line_object_types:
+            if src_object in system_tessellated_objects:
+                continue
+            mesh = obj.to_mesh(preserve_all_data_layers=True, depsgraph=depsgraph)
+            if mesh is None:
+                continue
+            if obj.type == "CURVE" and len(mesh.polygons) == 0:
+                # カーブをメッシュに変換したとき、押し出し量が0の場合だとエッジのみが生成されポリゴンは生成されない
+                # このとき、もともとのカーブに付随していたマテリアルの情報は失われてしまう
+                # ライン描画にはマテリアルの情報が必要になる場合もあるので、欠損した情報を付加する必要がある
+                curve: bpy.types.Curve = obj.data
+                scene_data.curve_data[mesh] = pencil4line_for_blender.interm_curve_data(curve.materials, [x.material_index for x in curve.splines])
+        
+        if mesh is not None:
+            override_library = src_object.override_library
+            src_object = override_library.reference if override_library is not None else src_object
+
+            ungrouped_objects.add(src_object)
+
+            if check_holdout:
+                holdout = obj.is_holdout
+                if not holdout:
+                    holdout = (object_instance.parent if object_instance.parent is not None else obj) in holdout_objects_from_collection
+            else:
+                holdout = False
+
+            object_materials = ()
+            if material_override is None and any([ms.link == "OBJECT" for ms in obj.material_slots]):
+                object_materials = tuple([ms.material for ms in obj.material_slots])
+            
+            render_Instance = pencil4line_for_blender.interm_render_Instance(src_object, object_instance.matrix_world, mesh, holdout, object_materials)
+            render_instances.append(render_Instance)
+
+            if mesh_color_attributes is not None and mesh not in mesh_color_attributes:
+                attr = getattr(mesh, "color_attributes", None)
+                if attr is None:
+                    mesh_color_attributes = None
+                else:
+                    mesh_color_attributes[mesh] = list(attr)
+    scene_data.mesh_color_attributes = mesh_color_attributes
+
+    # グループ設定
+    groups = scene_data.groups
+    def collect_group(collection: bpy.types.Collection):
+        if collection is None:
+            return
+        for child in collection.children:
+            collect_group(child)
+        for object in collection.objects:
+            if object.type == "EMPTY" and object.instance_type == "COLLECTION":
+                collect_group(object.instance_collection)
+        if collection.pcl4_line_merge_group:
+            objects = set()
+            for x in collection.all_objects:
+                x = x if x.override_library is None else x.override_library.reference
+                if x in ungrouped_objects:
+                    objects.add(x)
+            if len(objects) > 0:
+                groups.append(list(objects))
+                ungrouped_objects.difference_update(objects)
+    collect_group(depsgraph.scene.collection)
+
+    return scene_data
+
+
 def get_line_size_relative_type(depsgraph: bpy.types.Depsgraph) -> int:
     camera = depsgraph.scene_eval.camera
     return ["AUTO", "HORIZONTAL", "VERTICAL"].index(camera.data.sensor_fit) if camera is not None else 0
@@ -0,0 +1,267 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import io
+import os
+import shutil
+import uuid
+import threading
+import concurrent.futures
+import bpy
+
+from . import line_data
+from .line_data.container import LineDataContainerWriter
+from .pencil4_render_images import VectorOutput
+
+
+class VectorFileWriter:
+    # ネイティブのライン描画は、描画と同じレンダリングのスレッドでベクターファイルを同期的に書き出す。その書き出し先をローカルの作業フォルダにし、
+    # 本来の出力先(ネットワークドライブなど)への転送(コピー、圧縮、SVG変換、コンテナへの追記)のみをバックグラウンドのスレッドで行う
+    __executor: concurrent.futures.ThreadPoolExecutor = None
+    __max_workers = 0
+    __futures = []
+    __lock = threading.Lock()
+    # コンテナのパス -> (LineDataContainerWriter, ロック)。レンダリング終了時にインデックスを書き込んで閉じる
+    __containers = {}
+
+    @staticmethod
+    def __get_preferences():
+        return bpy.context.preferences.addons[__package__].preferences
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return cls.__get_preferences().vector_output_async
+
+    @staticmethod
+    def get_staging_root() -> str:
+        return os.path.join(bpy.app.tempdir, "pencil4_vector_staging")
+
+    @classmethod
+    def stage(cls, output_pairs: list, frame: int) -> list[tuple]:
+        # 各出力のパスを出力ごとの作業フォルダに差し替え、(作業フォルダ, 本来の出力フォルダ, フレーム, コンテナの設定, SVGの設定, 圧縮の設定) のリストを返す
+        # <LineName>などでファイルが複数に分かれる場合も、作業フォルダ内の全ファイルを転送する
+        # コンテナに追記する出力、SVGの出力、圧縮する出力は、バックグラウンドでの書き出しが無効でも作業フォルダを経由する
+        # SVGのグループごとに分かれたネイティブ側の出力は、同じ作業フォルダにまとめる
+        staged = []
+        staging_dirs = {}
+        enabled = len(output_pairs) > 0 and cls.is_enabled()
+        for cpp_output, py_output in output_pairs:
+            staging_dir = staging_dirs.get(py_output.as_pointer())
+            if staging_dir is None:
+                container = py_output.get_container_spec(frame)
+                svg = py_output.get_svg_spec()
+                compression = py_output.get_compression_spec()
+                if container is None and svg is None and compression[0] == line_data.CODEC_NONE and not enabled:
+                    continue
+                staging_dir = os.path.join(cls.get_staging_root(), uuid.uuid4().hex)
+                try:
+                    os.makedirs(staging_dir)
+                except OSError:
+                    continue
+                staging_dirs[py_output.as_pointer()] = staging_dir
+                staged.append((staging_dir, os.path.dirname(cpp_output.output_path), frame, container, svg, compression))
+            cpp_output.output_path = os.path.join(staging_dir, os.path.basename(cpp_output.output_path))
+        return staged
+
+    @classmethod
+    def submit(cls, staged: list[tuple]):
+        if len(staged) == 0:
+            return
+        preferences = cls.__get_preferences()
+        fsync = preferences.vector_output_fsync
+        atomic = preferences.vector_output_atomic_rename
+        if not preferences.vector_output_async:
+            # バックグラウンドでの書き出しが無効な場合はここで転送し、結果はwait()でまとめて報告する
+            for entry in staged:
+                future = concurrent.futures.Future()
+                try:
+                    future.set_result(cls.__transfer(*entry, fsync, atomic))
+                except Exception as e:
+                    future.set_exception(e)
+                with cls.__lock:
+                    cls.__futures.append(future)
+            return
+        with cls.__lock:
+            if cls.__executor is None or cls.__max_workers != preferences.vector_output_writer_threads:
+                if cls.__executor is not None:
+                    cls.__executor.shutdown(wait=False)
+                cls.__max_workers = preferences.vector_output_writer_threads
+                cls.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=cls.__max_workers,
+                                                                       thread_name_prefix="Pencil4VectorWriter")
+            for entry in staged:
+                cls.__futures.append(cls.__executor.submit(cls.__transfer, *entry, fsync, atomic))
+            pending = [future for future in cls.__futures if not future.done()]
+
+        # 転送が追いつかない場合は作業フォルダが増え続けないよう、古い転送の完了を待つ
+        limit = cls.__max_workers * 8
+        if len(pending) > limit:
+            concurrent.futures.wait(pending[:len(pending) - limit])
+
+    @classmethod
+    def wait(cls) -> tuple[int, list[str]]:
+        # 全ての転送の完了を待ち、転送したファイル数と失敗の内容を返す
+        with cls.__lock:
+            futures = cls.__futures
+            cls.__futures = []
+        if len(futures) == 0:
+            return (0, cls.__close_containers())
+        transferred = 0
+        failures = []
+        for future in futures:
+            try:
+                transferred += future.result()
+            except Exception as e:
+                failures.append(str(e))
+        failures += cls.__close_containers()
+        return (transferred, failures)
+
+    @classmethod
+    def __close_containers(cls) -> list[str]:
+        with cls.__lock:
+            containers = cls.__containers
+            cls.__containers = {}
+        if len(containers) == 0:
+            return []
+        fsync = cls.__get_preferences().vector_output_fsync
+        failures = []
+        for path, (writer, _) in containers.items():
+            try:
+                writer.close(fsync)
+            except OSError as e:
+                failures.append(f"Failed to write {path} ({e.strerror or e})")
+        return failures
+
+    @classmethod
+    def __get_container(cls, path: str) -> tuple[LineDataContainerWriter, threading.Lock]:
+        with cls.__lock:
+            container = cls.__containers.get(path)
+            if container is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                container = (LineDataContainerWriter(path), threading.Lock())
+                cls.__containers[path] = container
+            return container
+
+    @classmethod
+    def shutdown(cls):
+        cls.wait()
+        with cls.__lock:
+            if cls.__executor is not None:
+                cls.__executor.shutdown(wait=True)
+                cls.__executor = None
+
+    @staticmethod
+    def __write_file(dst: str, write, fsync: bool, atomic: bool):
+        # write(file) でファイルを書き込む。atomicの場合は一時ファイルに書き込んでからリネームする
+        tmp = f"{dst}.{uuid.uuid4().hex[:8]}.tmp" if atomic else dst
+        try:
+            with open(tmp, "wb") as f:
+                write(f)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if atomic:
+                os.replace(tmp, dst)
+        except OSError as e:
+            if atomic and os.path.exists(tmp):
+                os.remove(tmp)
+            raise OSError(f"Failed to write {dst} ({e.strerror or e})") from e
+
+    @staticmethod
+    def __sync_dir(dir: str):
+        # リネームを確定させるため、出力フォルダも同期する
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @classmethod
+    def __transfer(cls, staging_dir: str, final_dir: str, frame: int, container: tuple, svg: tuple, compression: tuple,
+                   fsync: bool, atomic: bool) -> int:
+        if container is not None:
+            return cls.__append_to_containers(staging_dir, frame, container, compression)
+        if svg is not None:
+            return cls.__convert_to_svg(staging_dir, final_dir, svg, fsync, atomic)
+        # 圧縮する場合は転送しながら圧縮し、ファイル名に拡張子(.gz / .zst)を付ける
+        codec, level = compression
+        count = 0
+        if len(os.listdir(staging_dir)) > 0:
+            os.makedirs(final_dir, exist_ok=True)
+        for name in sorted(os.listdir(staging_dir)):
+            src = os.path.join(staging_dir, name)
+            dst = os.path.join(final_dir, name + line_data.compression.get_extension(codec))
+            with open(src, "rb") as fsrc:
+                cls.__write_file(dst, lambda fdst: line_data.compression.copy_compressed(fsrc, fdst, codec, level), fsync, atomic)
+            os.remove(src)
+            count += 1
+        os.rmdir(staging_dir)
+        if fsync and count > 0:
+            cls.__sync_dir(final_dir)
+        return count
+
+    @classmethod
+    def __convert_to_svg(cls, staging_dir: str, final_dir: str, svg: tuple, fsync: bool, atomic: bool) -> int:
+        # グループごとのEPSを読み込み、1つのSVGに書き出す
+        # <LineName>などでネイティブ側の出力が複数のファイルに分かれる場合は、ファイルごとにSVGを書き出す
+        group_names, tolerance, precision = svg
+        sources = {}
+        for name in os.listdir(staging_dir):
+            file_name, _, group_name = os.path.splitext(name)[0].rpartition(VectorOutput.svg_group_separator)
+            sources.setdefault(file_name, {})[group_name] = os.path.join(staging_dir, name)
+        count = 0
+        for file_name in sorted(sources):
+            # SVGは読み込んだブロックごとに書き込み、書き出したファイルの作業ファイルはすぐに削除する
+            groups = []
+            try:
+                for group_name in group_names:
+                    if group_name in sources[file_name]:
+                        groups.append((group_name, line_data.open_stroke_index(sources[file_name][group_name])))
+                if len(groups) == 0:
+                    continue
+                os.makedirs(final_dir, exist_ok=True)
+
+                def write(f):
+                    text = io.TextIOWrapper(f, encoding="utf-8", newline="\n")
+                    line_data.write_svg(text, groups, tolerance, precision)
+                    text.flush()
+                    text.detach()
+
+                cls.__write_file(os.path.join(final_dir, file_name + ".svg"), write, fsync, atomic)
+                count += 1
+            finally:
+                for _, index in groups:
+                    index.close()
+            for path in sources[file_name].values():
+                os.remove(path)
+        if fsync and count > 0:
+            cls.__sync_dir(final_dir)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return count
+
+    @classmethod
+    def __append_to_containers(cls, staging_dir: str, frame: int, container: tuple, compression: tuple) -> int:
+        # 作業フォルダのファイルをライン名ごとのチャンクとしてコンテナに追記する
+        mode, path, prefix, suffix = container
+        count = 0
+        for name in sorted(os.listdir(staging_dir)):
+            src = os.path.join(staging_dir, name)
+            if name.startswith(prefix) and name.endswith(suffix) and len(name) > len(prefix) + len(suffix):
+                line_name = name[len(prefix):len(name) - len(suffix)]
+            else:
+                line_name = os.path.splitext(name)[0]
+            container_path = path.replace("<LineName>", line_name) if mode == "LINE" else path
+            try:
+                writer, lock = cls.__get_container(container_path)
+                with lock:
+                    writer.append_file(frame, line_name, src, *compression)
+            except OSError as e:
+                raise OSError(f"Failed to write {container_path} ({e.strerror or e})") from e
+            os.remove(src)
+            count += 1
+        os.rmdir(staging_dir)
+        return count
+
+
+def unregister():
+    VectorFileWriter.shutdown()
@@ -52,8 +52,16 @@ else:
     from .i18n import Translation
 
 from .pencil4_render_session import Pencil4RenderSession as RenderSession
+from .misc import image_writer
+from .misc import movie_writer
+from .misc.scene_data_key import get_scene_data_key
+from .misc.frame_cache import FrameCache
 
+import os
 import itertools
+import time
+import uuid
+import numpy as np
 from typing import Tuple
 from typing import Iterable
 import bpy
@@ -69,12 +77,17 @@ class ViewportLineRenderSettings(bpy.types.PropertyGroup):
         ("WHOLE_VIEWPORT", "Whole Viewport", "", 0),
         ("CAMERA_AREA", "Camera Area", "", 1),
     )
+    camera_area_resolution_items = (
+        ("SCREEN", "On-Screen Size", "", 0),
+        ("RENDER", "Render Resolution", "", 1),
+    )
 
     enable: bpy.props.BoolProperty(default=False)
     enalbe_background_color: bpy.props.BoolProperty(default=False)
     background_color: bpy.props.FloatVectorProperty(subtype="COLOR", size=4, min=0.0, max=1.0, default=[1.0, 1.0, 1.0, 1.0])
     camera_view_range: bpy.props.EnumProperty(items=rendering_target_items, default="WHOLE_VIEWPORT")
     camera_view_scale: bpy.props.BoolProperty(default=False)
+    camera_area_resolution: bpy.props.EnumProperty(items=camera_area_resolution_items, default="SCREEN")
     enalbe_background_color_for_render: bpy.props.BoolProperty(default=False)
     background_color_for_render: bpy.props.FloatVectorProperty(subtype="COLOR", size=4, min=0.0, max=1.0, default=[1.0, 1.0, 1.0, 1.0])
 
@@ -82,10 +95,52 @@ class ViewportLineRenderSettings(bpy.types.PropertyGroup):
     saved_space_index: bpy.props.IntProperty(default=-1)
 
 
+class ViewportLineImage:
+    def __init__(self, width: int, height: int, data: gpu.types.Buffer, texture_format: str, nbytes: int, palette_color: Tuple[float, float, float] = None):
+        self.width = width
+        self.height = height
+        self.data = data
+        self.texture_format = texture_format
+        self.nbytes = nbytes
+        self.palette_color = palette_color
+
+    def create_texture(self) -> gpu.types.GPUTexture:
+        return gpu.types.GPUTexture((self.width, self.height), format=self.texture_format, data=self.data)
+
+    @staticmethod
+    def create(pixels, width: int, height: int, buffer_format: str):
+        # ライン描画結果をGPUへ転送する形式に変換する
+        # FLOAT以外の形式では転送量とキャッシュのメモリ使用量が削減される
+        count = width * height * 4
+        array = pixels if isinstance(pixels, np.ndarray) else np.fromiter(pixels, dtype=np.float32, count=count)
+        if buffer_format == "FLOAT":
+            # ネイティブのバッファを参照している場合は次の描画で上書きされるため、キャッシュ用に複製する
+            if not array.flags.owndata:
+                array = array.copy()
+            return ViewportLineImage(width, height, gpu.types.Buffer("FLOAT", count, array), "RGBA8", count * 4)
+
+        rgba = array.reshape(-1, 4)
+        if buffer_format == "PALETTE":
+            # ラインが単色で描画されている場合、アルファのみを転送し色はシェーダーで与える
+            alpha = rgba[:, 3]
+            opaque = rgba[alpha > (1.0 / 255.0)]
+            color = (opaque[:, :3] / opaque[:, 3:4]) if len(opaque) > 0 else np.zeros((1, 3), dtype=np.float32)
+            if float(np.abs(color - color[0]).max()) <= 1.0 / 255.0:
+                data = np.clip(alpha * 255.0 + 0.5, 0, 255).astype(np.uint8)
+                return ViewportLineImage(width, height, gpu.types.Buffer("UBYTE", data.size, data), "R8", data.size,
+                                         palette_color=tuple(float(x) for x in color[0]))
+
+        data = np.clip(array * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        return ViewportLineImage(width, height, gpu.types.Buffer("UBYTE", count, data), "RGBA8", count)
+
+
 class ViewportLineRenderManager:
     in_render_session = False
+    frame_cache = FrameCache()
 
     __settings_dict = {}
+    __space_index = {}
+    __scene_data_dict = {}
     __timeout2_interval = 0.500
 
     class RenderMode(IntEnum):
@@ -125,6 +180,9 @@ class ViewportLineRenderManager:
         for space in ViewportLineRenderManager.__settings_dict.keys():
             __class__.reset_for_space(space)
         ViewportLineRenderManager.__settings_dict.clear()
+        ViewportLineRenderManager.__space_index.clear()
+        ViewportLineRenderManager.__scene_data_dict.clear()
+        ViewportLineRenderManager.frame_cache.clear()
 
     @staticmethod
     def load():
@@ -160,14 +218,41 @@ class ViewportLineRenderManager:
                         settings.saved_area_index = area_index
                         settings.saved_space_index = space_index
 
-    @staticmethod
-    def get_area_and_screen(space: bpy.types.Space) -> Tuple[bpy.types.Area, bpy.types.Screen]:
+    @classmethod
+    def invalidate_space_index(cls):
+        cls.__space_index.clear()
+
+    @classmethod
+    def __rebuild_space_index(cls):
+        cls.__space_index.clear()
         for screen in bpy.data.screens:
-            for area in screen.areas:
-                for s in area.spaces:
-                    if s == space:
-                        return [area, screen]
-        return [None, None]
+            for area_index, area in enumerate(screen.areas):
+                for space_index, s in enumerate(area.spaces):
+                    cls.__space_index[s.as_pointer()] = (screen.name, area_index, space_index)
+
+    @classmethod
+    def __lookup_space_index(cls, space: bpy.types.Space) -> Tuple[bpy.types.Area, bpy.types.Screen]:
+        # エリアの分割や結合でインデックスがずれている可能性があるため、参照先が一致するかを確認する
+        entry = cls.__space_index.get(space.as_pointer())
+        if entry is None:
+            return None
+        screen_name, area_index, space_index = entry
+        screen = bpy.data.screens.get(screen_name)
+        if screen is None or len(screen.areas) <= area_index:
+            return None
+        area = screen.areas[area_index]
+        if len(area.spaces) <= space_index or area.spaces[space_index] != space:
+            return None
+        return [area, screen]
+
+    @classmethod
+    def get_area_and_screen(cls, space: bpy.types.Space) -> Tuple[bpy.types.Area, bpy.types.Screen]:
+        # 描画のたびに呼ばれるため、スペースからエリアとスクリーンへのインデックスを保持し、見つからない場合のみ再構築する
+        result = cls.__lookup_space_index(space)
+        if result is None:
+            cls.__rebuild_space_index()
+            result = cls.__lookup_space_index(space)
+        return result if result is not None else [None, None]
 
     @classmethod
     def get_settings(cls, space: bpy.types.Space) -> ViewportLineRenderSettings:
@@ -240,6 +325,7 @@ class ViewportLineRenderManager:
         del_keys = list(x for x in dict_value.render_session_dict if not x in regions)
         for key in del_keys:
             dict_value.render_session_dict.pop(key)
+            cls.frame_cache.remove_region(key.as_pointer())
         if dict_value.render_session_dict.get(region_3d) is None:
             session = RenderSession()
             dict_value.render_session_dict[region_3d] = session
@@ -264,7 +350,69 @@ class ViewportLineRenderManager:
         for dict_value in cls.__settings_dict.values():
             for render_session in dict_value.render_session_dict.values():
                 render_session.objects_cache_valid = False
-        
+        cls.__scene_data_dict.clear()
+
+    @classmethod
+    def invalidate_frame_cache(cls):
+        cls.frame_cache.clear()
+
+    @staticmethod
+    def __frame_cache_key(frame: int, depsgraph: bpy.types.Depsgraph, space: bpy.types.SpaceView3D, region_3d: bpy.types.RegionView3D,
+                          draw_option, width: int, height: int, is_camera_area: bool) -> tuple:
+        # カメラ領域の描画はビューの行列ではなくそのフレームのカメラで決まるため、ビューの行列をキーに含めない
+        view_key = (width, height) if is_camera_area else\
+            (tuple(tuple(v) for v in region_3d.view_matrix), tuple(tuple(v) for v in region_3d.window_matrix), width, height)
+        return (region_3d.as_pointer(), frame, depsgraph.as_pointer(), space.shading.type, view_key,
+                draw_option.line_scale,
+                draw_option.linesize_relative_target_width,
+                draw_option.linesize_relative_target_height,
+                draw_option.linesize_absolute_scale)
+
+    @staticmethod
+    def __frame_cache_budget() -> int:
+        return bpy.context.preferences.addons[__package__].preferences.viewport_frame_cache_size * 1024 * 1024
+
+    @staticmethod
+    def __is_playing_or_scrubbing() -> bool:
+        return any(window.screen.is_animation_playing or window.screen.is_scrubbing for window in bpy.context.window_manager.windows)
+
+    @classmethod
+    def __store_frame_cache(cls, key: tuple, line_image: ViewportLineImage):
+        # 視点操作のたびにキーが変わるため、キャッシュへの格納はアニメーション再生中とスクラブ中のみ行う
+        budget = cls.__frame_cache_budget()
+        if budget > 0 and cls.__is_playing_or_scrubbing():
+            cls.frame_cache.put(key, line_image, budget)
+
+    @staticmethod
+    def __create_line_image(pixels, width: int, height: int) -> ViewportLineImage:
+        if len(pixels) != width * height * 4:
+            return None
+        buffer_format = bpy.context.preferences.addons[__package__].preferences.viewport_buffer_format
+        return ViewportLineImage.create(pixels, width, height, buffer_format)
+
+    @staticmethod
+    def __scene_data_key(depsgraph: bpy.types.Depsgraph, space: bpy.types.SpaceView3D) -> tuple:
+        return get_scene_data_key(depsgraph, space, __class__.__object_type_filter_props())
+
+    __object_type_filter_prop_names = None
+    @staticmethod
+    def __object_type_filter_props() -> list[str]:
+        if __class__.__object_type_filter_prop_names is None:
+            __class__.__object_type_filter_prop_names = [x for x in bpy.types.SpaceView3D.bl_rna.properties.keys() if x.startswith("show_object_viewport_")]
+        return __class__.__object_type_filter_prop_names
+
+    @classmethod
+    def get_scene_data(cls, depsgraph: bpy.types.Depsgraph, space: bpy.types.SpaceView3D) -> pencil4_render_session.Pencil4SceneData:
+        # クアッドビューや複数のビューポートで同じシーンを表示している場合でも、
+        # ノードの変換とオブジェクトの列挙はデプスグラフの更新ごとに1回だけ行う
+        key = cls.__scene_data_key(depsgraph, space)
+        scene_data = cls.__scene_data_dict.get(key)
+        if scene_data is None:
+            is_cycles, is_eevee_next = pencil4_render_session.get_viewport_engine_flags(depsgraph, space)
+            scene_data = pencil4_render_session.extract_scene(depsgraph, space=space, is_viewport=True, is_cycles=is_cycles, is_eevee_next=is_eevee_next)
+            cls.__scene_data_dict[key] = scene_data
+        return scene_data
+
 
     @classmethod
     def __draw_timeout2(cls, space: bpy.types.SpaceView3D, region: bpy.types.Region, region_3d: bpy.types.RegionView3D):
@@ -296,7 +444,7 @@ class ViewportLineRenderManager:
         region: bpy.types.Region = bpy.context.region
         region_3d: bpy.types.RegionView3D = bpy.context.region_data
         render_session = cls.get_render_session(space, region_3d)
-        pixels = None
+        line_image = None
         width = region.width
         height = region.height
         draw_texture_origin = None
@@ -319,16 +467,29 @@ class ViewportLineRenderManager:
                 draw_option.objects_cache_valid = render_session.objects_cache_valid if render_session.render_mode != cls.RenderMode.Initialize else False
                 matrix_override_func = None
                 if region_3d.view_perspective == "CAMERA" and settings.camera_view_range == "CAMERA_AREA":
-                    width, height = pencil4_render_session.get_render_size(depsgraph)
+                    render_width, render_height = pencil4_render_session.get_render_size(depsgraph)
                     border = cls.camera_border(bpy.context.scene, region, space, region_3d)
+                    border_width = border[0][0] - border[2][0]
+                    border_height = border[0][1] - border[1][1]
                     draw_texture_origin = (border[2][0] / region.width, border[1][1] / region.height)
-                    draw_texture_size = ((border[0][0] - border[2][0]) / region.width, (border[0][1] - border[1][1]) / region.height)
+                    draw_texture_size = (border_width / region.width, border_height / region.height)
+                    # カメラ領域が画面上でレンダリング解像度より小さく表示されている場合、画面上のサイズで描画する
+                    # 縮小して表示されるだけの画素を描画しないことで、高解像度のレンダリング設定でもプレビューを軽量にする
+                    scale = max(border_width / render_width, border_height / render_height)
+                    if settings.camera_area_resolution == "SCREEN" and scale < 1.0:
+                        width = max(1, round(render_width * scale))
+                        height = max(1, round(render_height * scale))
+                        draw_option.line_scale = height / render_height
+                        draw_option.linesize_relative_target_width = render_width
+                        draw_option.linesize_relative_target_height = render_height
+                    else:
+                        width, height = render_width, render_height
+                        draw_option.line_scale = 1.0
+                        draw_option.linesize_relative_target_width = 0
+                        draw_option.linesize_relative_target_height = 0
                     def matrix_override(camera_matrix, window_matrix):
                         return _calc_matrix_override(width, height, region, region_3d, depsgraph, camera_matrix, window_matrix)
                     matrix_override_func = matrix_override
-                    draw_option.line_scale = 1.0
-                    draw_option.linesize_relative_target_width = 0
-                    draw_option.linesize_relative_target_height = 0
                     draw_option.linesize_absolute_scale = 1.0
                 elif region_3d.view_perspective == "CAMERA" and settings.camera_view_scale:
                     border = cls.camera_border(bpy.context.scene, region, space, region_3d)
@@ -343,27 +504,37 @@ class ViewportLineRenderManager:
                     draw_option.linesize_relative_target_height = 0
                     draw_option.linesize_absolute_scale = bpy.context.preferences.system.ui_scale / bpy.context.preferences.view.ui_scale
 
-                draw_ret = render_session.draw_line_for_viewport(depsgraph, width, height, space, region_3d, matrix_override_func)
-                render_session.cleanup_frame()
-
-                if draw_ret == pencil4line_for_blender.draw_ret.success or draw_ret == pencil4line_for_blender.draw_ret.success_without_license:
-                    pixels = render_session.get_viewport_image_buffer()
+                # アニメーション再生時のフレームキャッシュを参照する
+                is_camera_area = matrix_override_func is not None
+                frame_cache_key = cls.__frame_cache_key(depsgraph.scene.frame_current, depsgraph, space, region_3d, draw_option, width, height, is_camera_area)
+                line_image = cls.frame_cache.get(frame_cache_key)
+                if line_image is not None:
                     render_session.render_mode = cls.RenderMode.Normal
-                    render_session.objects_cache_valid = True
-                elif draw_ret == pencil4line_for_blender.draw_ret.timeout:
-                    render_session.objects_cache_valid = False
-                    if render_session.render_mode == cls.RenderMode.Initialize:
-                        # 長い設定時間にも関わらずタイムアウトした場合、以降のライン描画を停止する
-                        render_session.render_mode = cls.RenderMode.Timeout
-                        bpy.app.timers.register(lambda: RedrawPanel(), first_interval=0) 
-                    else:
-                        # 短い設定時間でタイムアウトした場合、
-                        # 操作のレスポンス向上のためエリア内の全ライン描画を待機状態にする
-                        for session in cls.get(space).render_session_dict.values():
-                            session.render_mode = cls.RenderMode.Wait
                 else:
-                    render_session.render_mode = cls.RenderMode.Error
-                    bpy.app.timers.register(lambda: RedrawPanel(), first_interval=0) 
+                    scene_data = cls.get_scene_data(depsgraph, space)
+                    draw_ret = render_session.draw_line_for_viewport(depsgraph, width, height, space, region_3d, matrix_override_func, scene_data)
+                    render_session.cleanup_frame()
+
+                    if draw_ret == pencil4line_for_blender.draw_ret.success or draw_ret == pencil4line_for_blender.draw_ret.success_without_license:
+                        line_image = cls.__create_line_image(render_session.get_viewport_image_array(), width, height)
+                        if line_image is not None:
+                            cls.__store_frame_cache(frame_cache_key, line_image)
+                        render_session.render_mode = cls.RenderMode.Normal
+                        render_session.objects_cache_valid = True
+                    elif draw_ret == pencil4line_for_blender.draw_ret.timeout:
+                        render_session.objects_cache_valid = False
+                        if render_session.render_mode == cls.RenderMode.Initialize:
+                            # 長い設定時間にも関わらずタイムアウトした場合、以降のライン描画を停止する
+                            render_session.render_mode = cls.RenderMode.Timeout
+                            bpy.app.timers.register(lambda: RedrawPanel(), first_interval=0) 
+                        else:
+                            # 短い設定時間でタイムアウトした場合、
+                            # 操作のレスポンス向上のためエリア内の全ライン描画を待機状態にする
+                            for session in cls.get(space).render_session_dict.values():
+                                session.render_mode = cls.RenderMode.Wait
+                    else:
+                        render_session.render_mode = cls.RenderMode.Error
+                        bpy.app.timers.register(lambda: RedrawPanel(), first_interval=0) 
 
         if render_session.render_mode == cls.RenderMode.Wait:
             # 通常の描画でタイムアウトした場合、より長いタイムアウト時間で描画を試行するためタイマーを設定する
@@ -380,7 +551,7 @@ class ViewportLineRenderManager:
                 gpu.matrix.load_matrix(Matrix.Identity(4))
                 gpu.matrix.load_projection_matrix(Matrix.Identity(4))
 
-                draw_line = pixels is not None and len(pixels) == width * height * 4
+                draw_line = line_image is not None and line_image.width == width and line_image.height == height
 
                 if settings.enalbe_background_color:
                     color = list(settings.background_color)
@@ -389,13 +560,12 @@ class ViewportLineRenderManager:
                     if color[3] != 1.0:
                         color = [color[0] * color[3], color[1] * color[3], color[2] * color[3], color[3]]
                     gpu.state.blend_set("ALPHA")
-                    __class__.__draw_color(space, color)
+                    __class__.draw_color(space, color)
 
                 if draw_line:
-                    pixels = gpu.types.Buffer("FLOAT", width * height * 4, pixels)
-                    tex = gpu.types.GPUTexture((width, height), data=pixels)
+                    tex = line_image.create_texture()
                     gpu.state.blend_set("ALPHA")
-                    __class__.__draw_texture(space, tex, draw_texture_origin, draw_texture_size)
+                    __class__.draw_texture(space, tex, draw_texture_origin, draw_texture_size, line_image.palette_color)
                     del tex
 
     @staticmethod
@@ -469,6 +639,8 @@ class ViewportLineRenderManager:
             params = gpu_utils.ShaderParameters()
             params.add_constant("VEC2", "origin")
             params.add_constant("VEC2", "size")
+            params.add_constant("FLOAT", "alphaOnly")
+            params.add_constant("VEC4", "paletteColor")
             params.add_sampler("FLOAT_2D", "image")
             params.add_vert_output("VEC2", "uvInterp")
             __class__.__draw_tex_shader = __class__.__create_shader(
@@ -482,7 +654,9 @@ class ViewportLineRenderManager:
                 '''
                 void main()
                 {
-                    FragColor = correct_color_for_framebuffer_space(texture(image, uvInterp));
+                    vec4 c = texture(image, uvInterp);
+                    c = mix(c, paletteColor * c.r, alphaOnly);
+                    FragColor = correct_color_for_framebuffer_space(c);
                 }
                 ''',
                 params
@@ -522,7 +696,7 @@ class ViewportLineRenderManager:
             shader.uniform_float("gamma", 1.0)
 
     @staticmethod
-    def __draw_color(space: bpy.types.SpaceView3D, color: list[float]):
+    def draw_color(space: bpy.types.SpaceView3D, color: list[float]):
         shader = __class__.__get_draw_color_shader()
         shader.bind()
         __class__.__setup_shader_common(shader, space)
@@ -530,13 +704,16 @@ class ViewportLineRenderManager:
         __class__.__get_shader_batch(shader).draw(shader)
 
     @staticmethod
-    def __draw_texture(space: bpy.types.SpaceView3D, tex: gpu.types.GPUTexture, origin: Tuple[float, float] = None, size: Tuple[float, float] = None):
+    def draw_texture(space: bpy.types.SpaceView3D, tex: gpu.types.GPUTexture, origin: Tuple[float, float] = None, size: Tuple[float, float] = None,
+                     palette_color: Tuple[float, float, float] = None):
         shader = __class__.__get_draw_tex_shader()
         shader.bind()
         __class__.__setup_shader_common(shader, space)
         shader.uniform_sampler("image", tex)
         shader.uniform_float("origin", origin if origin is not None else (0.0, 0.0))
         shader.uniform_float("size", size if size is not None else (1.0, 1.0))
+        shader.uniform_float("alphaOnly", 1.0 if palette_color is not None else 0.0)
+        shader.uniform_float("paletteColor", (*palette_color, 1.0) if palette_color is not None else (0.0, 0.0, 0.0, 0.0))
         __class__.__get_shader_batch(shader).draw(shader)
 
 
@@ -661,6 +838,8 @@ class PCL4_PT_ViewportLinePreview(bpy.types.Panel):
         prop("camera_view_range", "Range")
         if settings.camera_view_range == "WHOLE_VIEWPORT":
             prop("camera_view_scale", "Line Size Adjustment")
+        else:
+            prop("camera_area_resolution", "Resolution")
 
 class PCL4_PT_ViewportLineRender(bpy.types.Panel):
     bl_idname = "PCL4_PT_viewport_line_render"
@@ -692,6 +871,12 @@ class PCL4_PT_ViewportLineRender(bpy.types.Panel):
         col = col.column()
         col.enabled = context.scene.pencil4_line_viewport_render_background_color_enable
         prop("pencil4_line_viewport_render_background_color", "")
+        layout.separator()
+        col = layout.column(align=True)
+        prop("pencil4_line_viewport_render_in_memory", "In-Memory Compositing")
+        row = col.row()
+        row.enabled = context.scene.pencil4_line_viewport_render_in_memory
+        row.prop(context.scene, "pencil4_line_viewport_render_pipelined", text="Pipelined Animation", text_ctxt=Translation.ctxt)
 
 class PCL4_OT_ViewportRender(bpy.types.Operator):
     bl_idname = "pcl4.viewport_render"
@@ -725,6 +910,13 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
             else:
                 break
 
+    @staticmethod
+    def new_render_result_override_image(width: int, height: int) -> bpy.types.Image:
+        __class__.delete_render_result_override_image()
+        image = bpy.data.images.new("Render Result (Pencil+ 4)", width=width, height=height, alpha=True)
+        image["is_pcl4_render_result"] = True
+        return image
+
     @staticmethod
     def get_render_result_override_image() -> bpy.types.Image:
         return next((image for image in bpy.data.images if image.get("is_pcl4_render_result", False)), None)
@@ -737,6 +929,17 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
                     window.screen.areas[0].spaces[0].image = image
 
     def cleanup(self, context):
+        if self.writer is not None:
+            self.writer.finish()
+            for error in self.writer.errors:
+                self.report({'ERROR'}, error)
+        if self.movie_writer is not None:
+            error = self.movie_writer.close()
+            if error is not None:
+                self.report({'ERROR'}, error)
+        self.report_timings()
+        self.writer = None
+        self.movie_writer = None
         output_image = __class__.get_render_result_override_image()
         if output_image is not None:
             output_image.pack()
@@ -759,7 +962,16 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
             output_image = __class__.get_render_result_override_image()
 
             # 必要がある場合のみレンダリングを実行する
-            if not self.animation or self.render_frames is None or frame_current in self.render_frames:
+            if (not self.animation or self.render_frames is None or frame_current in self.render_frames) and self.in_memory:
+                space: bpy.types.SpaceView3D = bpy.context.space_data
+                region: bpy.types.Region = bpy.context.region
+                region_3d: bpy.types.RegionView3D = space.region_3d
+                output_image = self.render_frame_in_memory(context, space, region, region_3d)
+                if output_image is None:
+                    self.report({'ERROR'}, "Failed to render lines.")
+                    self.cancel(context)
+                    return {'CANCELLED'}
+            elif not self.animation or self.render_frames is None or frame_current in self.render_frames:
                 space: bpy.types.SpaceView3D = bpy.context.space_data
                 region: bpy.types.Region = bpy.context.region
                 region_3d: bpy.types.RegionView3D = space.region_3d
@@ -795,7 +1007,8 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
                 width, height = pencil4_render_session.get_render_size(depsgraph)
                 def matrix_override(camera_matrix, window_matrix):
                     return _calc_matrix_override(width, height, region, region_3d, depsgraph, camera_matrix, window_matrix)
-                draw_ret = self.session.draw_line_for_viewport(context.evaluated_depsgraph_get(), width, height, space, region_3d, matrix_override)
+                scene_data = ViewportLineRenderManager.get_scene_data(depsgraph, space)
+                draw_ret = self.session.draw_line_for_viewport(depsgraph, width, height, space, region_3d, matrix_override, scene_data)
                 if draw_ret != pencil4line_for_blender.draw_ret.success and draw_ret != pencil4line_for_blender.draw_ret.success_without_license:
                     self.report({'ERROR'}, "Failed to render lines.")
                     self.cancel(context)
@@ -824,8 +1037,9 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
                                 gpu.state.blend_set("ALPHA")
                                 draw_texture_2d(tex, (-1, -1), 2, 2)
                                 del tex
-                            if len(self.session.get_viewport_image_buffer()) == width * height * 4:
-                                pixels = gpu.types.Buffer("FLOAT", width * height * 4, self.session.get_viewport_image_buffer())
+                            line_pixels = self.session.get_viewport_image_array()
+                            if len(line_pixels) == width * height * 4:
+                                pixels = gpu.types.Buffer("FLOAT", width * height * 4, line_pixels)
                                 tex = gpu.types.GPUTexture((width, height), data=pixels)
                                 gpu.state.blend_set("ALPHA_PREMULT")
                                 draw_texture_2d(tex, (-1, -1), 2, 2)
@@ -834,33 +1048,169 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
                 offscreen.free()
                 buffer.dimensions = width * height * 4
                 pencil4_render_images.setup_image(output_image, width, height)
-                output_image.pixels = buffer
+                output_image.pixels.foreach_set(buffer)
             
             # レンダリング結果を保存する
             if output_image is None:
                 self.report({'ERROR'}, "Failed to Pencil+ 4 Line Viewport Render.")
                 self.cancel(context)
                 return {'CANCELLED'}
-            output_image.save_render(frame_path)
+            timings = self.frame_timings.setdefault(frame_current, {})
+            if self.movie_writer is not None and self.frame_pixels is not None:
+                # 動画はエンコーダーに直接フレームを送り、画像ファイルを書き出さない
+                timings["stream"] = self.movie_writer.write(self.frame_pixels[0])
+                if self.movie_writer.error is not None:
+                    self.report({'ERROR'}, self.movie_writer.error)
+                    self.cancel(context)
+                    return {'CANCELLED'}
+            elif self.writer is not None and self.frame_pixels is not None:
+                # エンコードと書き込みはバックグラウンドスレッドで行い、その間に次のフレームの描画を進める
+                image_settings = context.scene.render.image_settings
+                pixels, width, height = self.frame_pixels
+                timings["queue"] = self.writer.put(frame_current, bpy.path.abspath(frame_path), pixels, width, height,
+                                                   image_settings.color_mode, image_settings.color_depth, image_settings.compression)
+            else:
+                start = time.perf_counter()
+                output_image.save_render(frame_path)
+                timings["save"] = time.perf_counter() - start
             if not self.animation or frame_current >= context.scene.frame_end:
                 self.cleanup(context)
                 return {'FINISHED'}
             if self.animation:
+                start = time.perf_counter()
                 context.scene.frame_set(frame_current + context.scene.frame_step)
+                self.frame_timings.setdefault(context.scene.frame_current, {})["frame_set"] = time.perf_counter() - start
         return {'RUNNING_MODAL'}
 
+    def report_timings(self):
+        # 各工程の平均処理時間をレポートする
+        if self.writer is not None:
+            for frame, timings in self.writer.timings.items():
+                self.frame_timings.setdefault(frame, {}).update(timings)
+        stages = ["frame_set", "lines", "viewport", "composite", "image", "queue", "save", "stream", "encode", "write"]
+        stages = [stage for stage in stages if any(stage in timings for timings in self.frame_timings.values())]
+        if len(self.frame_timings) == 0 or len(stages) == 0:
+            return
+        averages = []
+        for stage in stages:
+            values = [timings[stage] for timings in self.frame_timings.values() if stage in timings]
+            averages.append(f"{stage} {sum(values) * 1000.0 / len(values):.1f}")
+        self.report({'INFO'}, f"{len(self.frame_timings)} frames, average ms: " + ", ".join(averages))
+
+    def render_frame_in_memory(self, context, space: bpy.types.SpaceView3D, region: bpy.types.Region, region_3d: bpy.types.RegionView3D) -> bpy.types.Image:
+        # ビューポートの描画、ライン描画結果の合成をGPU上で行い、ファイルを経由せずに出力画像を生成する
+        timings = self.frame_timings.setdefault(context.scene.frame_current, {})
+        start = time.perf_counter()
+        depsgraph = context.evaluated_depsgraph_get()
+        width, height = pencil4_render_session.get_render_size(depsgraph)
+
+        # ライン描画を実行する
+        if self.session is None:
+            self.session = RenderSession()
+        def matrix_override(camera_matrix, window_matrix):
+            return _calc_matrix_override(width, height, region, region_3d, depsgraph, camera_matrix, window_matrix)
+        scene_data = ViewportLineRenderManager.get_scene_data(depsgraph, space)
+        draw_ret = self.session.draw_line_for_viewport(depsgraph, width, height, space, region_3d, matrix_override, scene_data)
+        if draw_ret != pencil4line_for_blender.draw_ret.success and draw_ret != pencil4line_for_blender.draw_ret.success_without_license:
+            return None
+        line_pixels = self.session.get_viewport_image_array()
+        timings["lines"] = time.perf_counter() - start
+        start = time.perf_counter()
+
+        # ビューポートをレンダリング解像度で描画する (オーバーレイはBlenderのビューポートレンダリングと同様に表示しない)
+        camera_matrix, window_matrix = matrix_override(region_3d.view_matrix.inverted(), region_3d.window_matrix)
+        if bpy.app.version >= (3, 1, 0):
+            offscreen = gpu.types.GPUOffScreen(width, height, format='RGBA16F')
+        else:
+            offscreen = gpu.types.GPUOffScreen(width, height)
+        try:
+            show_overlays = space.overlay.show_overlays
+            try:
+                space.overlay.show_overlays = False
+                offscreen.draw_view3d(context.scene, context.view_layer, space, region,
+                                      camera_matrix.inverted(), window_matrix, do_color_management=True)
+            finally:
+                space.overlay.show_overlays = show_overlays
+            timings["viewport"] = time.perf_counter() - start
+            start = time.perf_counter()
+
+            # ビューポートのプレビューと同じシェーダーで背景色とラインを合成する
+            with offscreen.bind():
+                fb = gpu.state.active_framebuffer_get()
+                with gpu.matrix.push_pop():
+                    with gpu.matrix.push_pop_projection():
+                        gpu.matrix.load_matrix(Matrix.Identity(4))
+                        gpu.matrix.load_projection_matrix(Matrix.Identity(4))
+                        if self.enalbe_background_color:
+                            color = list(self.background_color)
+                            if color[3] != 1.0:
+                                color = [color[0] * color[3], color[1] * color[3], color[2] * color[3], color[3]]
+                            gpu.state.blend_set("ALPHA")
+                            ViewportLineRenderManager.draw_color(space, color)
+                        if len(line_pixels) == width * height * 4:
+                            tex = gpu.types.GPUTexture((width, height), format='RGBA16F', data=gpu.types.Buffer("FLOAT", width * height * 4, line_pixels))
+                            gpu.state.blend_set("ALPHA")
+                            ViewportLineRenderManager.draw_texture(space, tex)
+                            del tex
+                gpu.state.blend_set("NONE")
+                buffer = fb.read_color(0, 0, width, height, 4, 0, 'FLOAT')
+        finally:
+            offscreen.free()
+        buffer.dimensions = width * height * 4
+        if self.writer is not None or self.movie_writer is not None:
+            # バックグラウンドスレッドでの書き込み用に画素をコピーしておく
+            self.frame_pixels = (np.array(buffer, dtype=np.float32), width, height)
+        timings["composite"] = time.perf_counter() - start
+        start = time.perf_counter()
+
+        # 合成結果は表示用の色空間に変換済みのため、色変換を行わない画像に書き込む
+        output_image = __class__.get_render_result_override_image()
+        if output_image is None or output_image.source != "GENERATED":
+            output_image = __class__.new_render_result_override_image(width, height)
+            __class__.set_render_view_image(output_image)
+        elif output_image.size[0] != width or output_image.size[1] != height:
+            output_image.generated_width = width
+            output_image.generated_height = height
+        colorspace_items = bpy.types.ColorManagedInputColorspaceSettings.bl_rna.properties["name"].enum_items
+        display_device = context.scene.display_settings.display_device
+        if context.scene.view_settings.view_transform != "Raw" and display_device in colorspace_items:
+            colorspace = display_device
+        else:
+            colorspace = "Non-Color" if "Non-Color" in colorspace_items else "Raw"
+        if output_image.colorspace_settings.name != colorspace:
+            output_image.colorspace_settings.name = colorspace
+        output_image.pixels.foreach_set(buffer)
+        output_image.update()
+        timings["image"] = time.perf_counter() - start
+        return output_image
+
     def invoke(self, context, event):
         if __class__.is_rendering():
             return {'CANCELLED'}
+        self.movie_writer = None
         if context.scene.render.is_movie_format and self.animation:
-            self.report({'ERROR'}, "Movie format is not supported.")
-            return {'CANCELLED'}
+            ffmpeg = movie_writer.find_ffmpeg()
+            if not context.scene.pencil4_line_viewport_render_in_memory or ffmpeg is None:
+                self.report({'ERROR'}, "Movie format is not supported.")
+                return {'CANCELLED'}
+            render = context.scene.render
+            width, height = pencil4_render_session.get_render_size(context.evaluated_depsgraph_get())
+            encoder_args = movie_writer.get_encoder_args(render.ffmpeg, render.image_settings.color_mode == "RGBA")
+            path = bpy.path.abspath(render.frame_path(frame=context.scene.frame_start))
+            self.movie_writer = movie_writer.FFmpegMovieWriter(path, width, height, render.fps / render.fps_base, encoder_args, ffmpeg)
         self.render_frames = None
         self.session = None
         self.image_alpha_mode = None
         self.original_frame_current = context.scene.frame_current
         self.background_color = context.scene.pencil4_line_viewport_render_background_color
         self.enalbe_background_color = context.scene.pencil4_line_viewport_render_background_color_enable
+        self.in_memory = context.scene.pencil4_line_viewport_render_in_memory
+        self.frame_timings = {}
+        self.frame_pixels = None
+        self.writer = None
+        if (self.animation and self.in_memory and context.scene.pencil4_line_viewport_render_pipelined and
+            context.scene.render.image_settings.file_format == "PNG"):
+            self.writer = image_writer.ImageWriteQueue(max_pending=2)
         context.window_manager.modal_handler_add(self)
         context.window.cursor_modal_set('WAIT')
         __class__.__timer = context.window_manager.event_timer_add(0.01, window=context.window)
@@ -882,17 +1232,207 @@ class PCL4_OT_ViewportRender(bpy.types.Operator):
         self.cleanup(context)
 
 
+class PCL4_OT_ViewportRenderBackground(bpy.types.Operator):
+    # 3Dビューやウィンドウを必要とせず、バックグラウンドモード(blender -b)でも実行できるビューポートレンダリング
+    # 例: blender -b scene.blend --python-expr "import bpy; bpy.ops.pcl4.viewport_render_background(camera='Camera', frame_start=1, frame_end=50)"
+    bl_idname = "pcl4.viewport_render_background"
+    bl_label = "Viewport Render (Background)"
+    bl_options = {'REGISTER'}
+
+    shading_type_items = (
+        ("NONE", "Lines Only", "", 0),
+        ("WIREFRAME", "Wireframe", "", 1),
+        ("SOLID", "Solid", "", 2),
+        ("MATERIAL", "Material Preview", "", 3),
+        ("RENDERED", "Rendered", "", 4),
+    )
+
+    camera: bpy.props.StringProperty(default="")
+    resolution_x: bpy.props.IntProperty(default=0, min=0)
+    resolution_y: bpy.props.IntProperty(default=0, min=0)
+    shading_type: bpy.props.EnumProperty(items=shading_type_items, default="NONE")
+    use_scene_frame_range: bpy.props.BoolProperty(default=True)
+    frame_start: bpy.props.IntProperty(default=1)
+    frame_end: bpy.props.IntProperty(default=1)
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH", default="")
+
+    def execute(self, context):
+        scene = context.scene
+        camera = bpy.data.objects.get(self.camera) if self.camera else scene.camera
+        if camera is None or camera.type != "CAMERA":
+            self.report({'ERROR'}, "Camera not found.")
+            return {'CANCELLED'}
+        frame_start = scene.frame_start if self.use_scene_frame_range else self.frame_start
+        frame_end = scene.frame_end if self.use_scene_frame_range else self.frame_end
+
+        # カメラ、解像度、出力先はシーンの設定を一時的に書き換え、終了後に元に戻す
+        render = scene.render
+        original_settings = (scene.camera, render.resolution_x, render.resolution_y, render.resolution_percentage,
+                             render.filepath, scene.frame_current)
+        scene.camera = camera
+        if self.resolution_x > 0 and self.resolution_y > 0:
+            render.resolution_x, render.resolution_y, render.resolution_percentage = self.resolution_x, self.resolution_y, 100
+        if self.filepath:
+            render.filepath = self.filepath
+
+        session = RenderSession()
+        writer = None
+        output_image = None
+        display_image = None
+        # 同時に実行される別のBlenderやレンダリングとファイルが衝突しないよう、一時ファイル名は実行ごとに一意にする
+        display_path = os.path.join(bpy.app.tempdir, f"pencil4_viewport_render_display_{os.getpid()}_{uuid.uuid4().hex[:8]}.png")
+        image_settings = render.image_settings
+        original_image_settings = (image_settings.file_format, image_settings.color_mode, image_settings.color_depth)
+        try:
+            width, height = pencil4_render_session.get_render_size(context.evaluated_depsgraph_get())
+            if render.is_movie_format:
+                ffmpeg = movie_writer.find_ffmpeg()
+                if ffmpeg is None:
+                    self.report({'ERROR'}, "Movie format is not supported.")
+                    return {'CANCELLED'}
+                writer = movie_writer.FFmpegMovieWriter(bpy.path.abspath(render.frame_path(frame=frame_start)), width, height,
+                                                        render.fps / render.fps_base,
+                                                        movie_writer.get_encoder_args(render.ffmpeg, image_settings.color_mode == "RGBA"),
+                                                        ffmpeg)
+                # 動画の各フレームはPNGとして一時的に保存し、シーンのカラーマネジメントを適用した画素を得る
+                image_settings.file_format = "PNG"
+                image_settings.color_mode = "RGBA"
+                image_settings.color_depth = "8"
+            # 合成結果はシーンリニアのため、保存時にシーンのカラーマネジメントを適用する
+            output_image = bpy.data.images.new("Viewport Render (Pencil+ 4)", width=width, height=height, alpha=True, float_buffer=True)
+
+            for frame in range(frame_start, frame_end + 1, scene.frame_step):
+                scene.frame_set(frame)
+                pixels = self.render_frame(context, session, camera, width, height)
+                if pixels is None:
+                    self.report({'ERROR'}, "Failed to render lines.")
+                    return {'CANCELLED'}
+                output_image.pixels.foreach_set(pixels)
+                if writer is not None:
+                    output_image.save_render(display_path, scene=scene)
+                    display_image = __class__.load_display_image(display_image, display_path)
+                    display_image.pixels.foreach_get(pixels)
+                    writer.write(pixels)
+                    if writer.error is not None:
+                        self.report({'ERROR'}, writer.error)
+                        return {'CANCELLED'}
+                else:
+                    output_image.save_render(bpy.path.abspath(render.frame_path(frame=frame)), scene=scene)
+        finally:
+            if writer is not None:
+                error = writer.close()
+                if error is not None:
+                    self.report({'ERROR'}, error)
+                (image_settings.file_format, image_settings.color_mode, image_settings.color_depth) = original_image_settings
+            if output_image is not None:
+                bpy.data.images.remove(output_image)
+            if display_image is not None:
+                bpy.data.images.remove(display_image)
+            if os.path.isfile(display_path):
+                os.remove(display_path)
+            session.cleanup_all()
+            (scene.camera, render.resolution_x, render.resolution_y, render.resolution_percentage,
+             render.filepath, frame_current) = original_settings
+            scene.frame_set(frame_current)
+        return {'FINISHED'}
+
+    def render_frame(self, context, session: RenderSession, camera: bpy.types.Object, width: int, height: int) -> np.ndarray:
+        # ライン描画とシェーディングの描画を行い、シーンリニアのプリマルチプライドRGBA配列として合成する
+        depsgraph = context.evaluated_depsgraph_get()
+        camera_eval = camera.evaluated_get(depsgraph)
+        camera_matrix, window_matrix = _calc_camera_matrix(width, height, depsgraph, camera_eval)
+        is_cycles, is_eevee_next = pencil4_render_session.get_shading_engine_flags(depsgraph, self.shading_type)
+        scene_data = pencil4_render_session.extract_scene(depsgraph, is_viewport=True, is_cycles=is_cycles, is_eevee_next=is_eevee_next,
+                                                          shading_type="SOLID" if self.shading_type == "NONE" else self.shading_type)
+        draw_ret = session.draw_line_for_view(depsgraph, width, height, camera_eval.data.clip_start, camera_eval.data.clip_end,
+                                              camera_matrix, window_matrix, scene_data)
+        if draw_ret != pencil4line_for_blender.draw_ret.success and draw_ret != pencil4line_for_blender.draw_ret.success_without_license:
+            return None
+
+        pixels = None
+        if self.shading_type != "NONE":
+            pixels = self.draw_shading(context, camera_matrix, window_matrix, width, height)
+        if pixels is None:
+            pixels = np.zeros(width * height * 4, dtype=np.float32)
+        pixels = pixels.reshape(-1, 4)
+        if context.scene.pencil4_line_viewport_render_background_color_enable:
+            color = np.array(context.scene.pencil4_line_viewport_render_background_color, dtype=np.float32)
+            color[:3] *= color[3]
+            pixels = color + pixels * (1.0 - color[3])
+        line_pixels = session.get_viewport_image_array()
+        if len(line_pixels) == width * height * 4:
+            line_pixels = line_pixels.reshape(-1, 4)
+            pixels = line_pixels + pixels * (1.0 - line_pixels[:, 3:4])
+        return np.ascontiguousarray(pixels, dtype=np.float32).reshape(-1)
+
+    def draw_shading(self, context, camera_matrix: Matrix, window_matrix: Matrix, width: int, height: int) -> np.ndarray:
+        # ファイル内の3Dビューの設定を借りてオフスクリーンに描画する
+        # UIが表示されるセッションでは3Dビューの設定を変更せず、シェーディングが一致しオーバーレイが非表示のビューのみを使用する
+        # GPUが利用できない環境ではラインのみを出力する
+        def is_usable(space: bpy.types.SpaceView3D) -> bool:
+            return bpy.app.background or (space.shading.type == self.shading_type and not space.overlay.show_overlays)
+        area = next((area for screen in bpy.data.screens for area in screen.areas if area.type == "VIEW_3D" and is_usable(area.spaces.active)), None)
+        region = next((region for region in area.regions if region.type == "WINDOW"), None) if area is not None else None
+        if region is None:
+            if bpy.app.background:
+                self.report({'WARNING'}, "3D Viewport not found. Only lines are rendered.")
+            else:
+                self.report({'WARNING'}, f"No 3D Viewport uses {self.shading_type} shading with overlays hidden. Only lines are rendered.")
+            return None
+        space: bpy.types.SpaceView3D = area.spaces.active
+        original_settings = (space.shading.type, space.overlay.show_overlays)
+        offscreen = None
+        try:
+            if space.shading.type != self.shading_type:
+                space.shading.type = self.shading_type
+            if space.overlay.show_overlays:
+                space.overlay.show_overlays = False
+            if bpy.app.version >= (3, 1, 0):
+                offscreen = gpu.types.GPUOffScreen(width, height, format='RGBA16F')
+            else:
+                offscreen = gpu.types.GPUOffScreen(width, height)
+            offscreen.draw_view3d(context.scene, context.view_layer, space, region,
+                                  camera_matrix.inverted(), window_matrix, do_color_management=False)
+            with offscreen.bind():
+                buffer = gpu.state.active_framebuffer_get().read_color(0, 0, width, height, 4, 0, 'FLOAT')
+        except Exception as e:
+            self.report({'WARNING'}, f"Failed to draw the viewport. Only lines are rendered. ({e})")
+            return None
+        finally:
+            if offscreen is not None:
+                offscreen.free()
+            if (space.shading.type, space.overlay.show_overlays) != original_settings:
+                space.shading.type, space.overlay.show_overlays = original_settings
+        buffer.dimensions = width * height * 4
+        return np.array(buffer, dtype=np.float32)
+
+    @staticmethod
+    def load_display_image(image: bpy.types.Image, path: str) -> bpy.types.Image:
+        # save_renderで保存した表示用の画像を読み込む。画素は色変換を行わずストレートアルファのまま取得する
+        if image is None:
+            image = bpy.data.images.load(path, check_existing=False)
+            image.colorspace_settings.name = "Non-Color" if "Non-Color" in bpy.types.ColorManagedInputColorspaceSettings.bl_rna.properties["name"].enum_items else "Raw"
+            image.alpha_mode = "STRAIGHT"
+        else:
+            image.reload()
+        return image
+
+
 def _calc_matrix_override(width: int, height: int, region, region_3d, depsgraph, camera_matrix, window_matrix):
     base_size = max(width, height)
     scale = min(base_size / region.width, base_size / region.height)
     window_matrix = Matrix(window_matrix) @ Matrix(((scale * region.width / width, 0, 0, 0), (0, scale * region.height / height, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1)))
     if region_3d.view_perspective == "CAMERA":
-        scene_camera = depsgraph.scene_eval.camera
-        camera_matrix = pencil4_render_session.get_camera_matrix(scene_camera)
-        sensor_size = max(width, height) if scene_camera.data.sensor_fit == "AUTO" else (width if scene_camera.data.sensor_fit == "HORIZONTAL" else height)
-        window_matrix = scene_camera.calc_matrix_camera(depsgraph,
-                            scale_x= depsgraph.scene.render.pixel_aspect_x * width / sensor_size,
-                            scale_y= depsgraph.scene.render.pixel_aspect_y * height / sensor_size)
+        camera_matrix, window_matrix = _calc_camera_matrix(width, height, depsgraph, depsgraph.scene_eval.camera)
+    return camera_matrix, window_matrix
+
+
+def _calc_camera_matrix(width: int, height: int, depsgraph, camera):
+    camera_matrix = pencil4_render_session.get_camera_matrix(camera)
+    sensor_size = max(width, height) if camera.data.sensor_fit == "AUTO" else (width if camera.data.sensor_fit == "HORIZONTAL" else height)
+    window_matrix = camera.calc_matrix_camera(depsgraph,
+                        scale_x= depsgraph.scene.render.pixel_aspect_x * width / sensor_size,
+                        scale_y= depsgraph.scene.render.pixel_aspect_y * height / sensor_size)
     return camera_matrix, window_matrix
 
 
@@ -904,6 +1444,10 @@ def register_props():
     bpy.types.Screen.pencil4_line_viewport_render_settings = bpy.props.CollectionProperty(type=ViewportLineRenderSettings)
     bpy.types.Scene.pencil4_line_viewport_render_background_color = bpy.props.FloatVectorProperty(subtype="COLOR", size=4, min=0.0, max=1.0, default=[1.0, 1.0, 1.0, 1.0])
     bpy.types.Scene.pencil4_line_viewport_render_background_color_enable = bpy.props.BoolProperty(default=False)
+    bpy.types.Scene.pencil4_line_viewport_render_in_memory = bpy.props.BoolProperty(default=False)
+    bpy.types.Scene.pencil4_line_viewport_render_pipelined = bpy.props.BoolProperty(default=True)
+    if not bpy.app.background:
+        _subscribe_screen_changes()
     if __is_reloaded:
         bpy.app.timers.register(
                     lambda: ViewportLineRenderManager.load(),
@@ -911,8 +1455,11 @@ def register_props():
         
 
 def unregister_props():
+    bpy.msgbus.clear_by_owner(__msgbus_owner)
     ViewportLineRenderManager.save()
     ViewportLineRenderManager.reset()
+    del(bpy.types.Scene.pencil4_line_viewport_render_pipelined)
+    del(bpy.types.Scene.pencil4_line_viewport_render_in_memory)
     del(bpy.types.Scene.pencil4_line_viewport_render_background_color_enable)
     del(bpy.types.Scene.pencil4_line_viewport_render_background_color)
     del(bpy.types.Screen.pencil4_line_viewport_render_settings)
@@ -924,3 +1471,14 @@ def on_save_pre():
 
 def on_load_post():
     ViewportLineRenderManager.load()
+    _subscribe_screen_changes()
+
+
+__msgbus_owner = object()
+def _subscribe_screen_changes():
+    # ワークスペースやスクリーンの切り替え時にスペースのインデックスを破棄する
+    # 購読はファイルの読み込みで解除されるため、読み込みのたびに登録し直す
+    bpy.msgbus.clear_by_owner(__msgbus_owner)
+    for key in ((bpy.types.Window, "workspace"), (bpy.types.Window, "screen")):
+        bpy.msgbus.subscribe_rna(key=key, owner=__msgbus_owner, args=(),
+                                 notify=ViewportLineRenderManager.invalidate_space_index)
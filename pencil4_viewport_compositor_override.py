@@ -12,6 +12,14 @@ import bpy
 class Manager:
     _handler = None
 
+    _dirty = True
+    _applied_states = set()
+
+    @classmethod
+    def invalidate(cls):
+        # ノードツリー、画像、ビューレイヤーの変更時に呼ばれ、次の描画でノードの設定をやり直す
+        cls._dirty = True
+
     @classmethod
     def _draw(cls):
         use_compositor = getattr(bpy.context.space_data.shading, "use_compositor", "DISABLED")
@@ -21,8 +29,19 @@ class Manager:
         if depsgraph is None:
             return
         scene = depsgraph.scene_eval
-        if scene.use_nodes and scene.node_tree:
-            for node in pencil4_render_images.iterate_all_pencil_image_nodes(scene.node_tree):
+        node_tree = scene.node_tree if scene.use_nodes else None
+
+        # 評価済みのノードツリーが作り直されておらず、変更の通知もなければ前回の設定が残っている
+        state = (scene.as_pointer(), node_tree.as_pointer() if node_tree else 0)
+        if not cls._dirty and state in cls._applied_states:
+            return
+        if cls._dirty:
+            cls._applied_states.clear()
+            cls._dirty = False
+        cls._applied_states.add(state)
+
+        if node_tree:
+            for node in pencil4_render_images.iterate_all_pencil_image_nodes(node_tree):
                 if not node.mute:
                     node.mute = True
                 for l in node.outputs[0].links:
@@ -44,3 +63,5 @@ def unregister():
     if Manager._handler:
         bpy.types.SpaceView3D.draw_handler_remove(Manager._handler, 'WINDOW')
         Manager._handler = None
+    Manager._applied_states.clear()
+    Manager.invalidate()
@@ -0,0 +1,54 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import io
+import pytest
+
+from line_data import compression
+
+
+def _compress(data: bytes, codec: int, level: int = 6) -> bytes:
+    dst = io.BytesIO()
+    compression.copy_compressed(io.BytesIO(data), dst, codec, level)
+    return dst.getvalue()
+
+
+def test_gzip_round_trip_and_detection():
+    data = b"%!PS-Adobe-3.0\n" * 100
+    compressed = _compress(data, compression.CODEC_GZIP)
+    assert compression.detect_codec(compressed[:4]) == compression.CODEC_GZIP
+    assert compression.decompress(compressed, compression.CODEC_GZIP) == data
+
+
+def test_gzip_output_is_deterministic():
+    data = b"line data" * 50
+    assert _compress(data, compression.CODEC_GZIP) == _compress(data, compression.CODEC_GZIP)
+
+
+def test_none_is_passthrough():
+    data = b"%!PS-Adobe-3.0"
+    assert _compress(data, compression.CODEC_NONE) == data
+    assert compression.detect_codec(data[:4]) == compression.CODEC_NONE
+    assert compression.decompress(data, compression.CODEC_NONE) is data
+
+
+def test_extensions():
+    assert compression.get_extension(compression.CODEC_NONE) == ""
+    assert compression.get_extension(compression.CODEC_GZIP) == ".gz"
+    assert compression.get_extension(compression.CODEC_ZSTD) == ".zst"
+
+
+def test_zstd():
+    data = b"line data" * 50
+    if not compression.is_available(compression.CODEC_ZSTD):
+        with pytest.raises(ValueError):
+            _compress(data, compression.CODEC_ZSTD)
+        return
+    compressed = _compress(data, compression.CODEC_ZSTD, 3)
+    assert compression.detect_codec(compressed[:4]) == compression.CODEC_ZSTD
+    assert compression.decompress(compressed, compression.CODEC_ZSTD) == data
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        compression.decompress(b"", 99)
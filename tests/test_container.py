@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import os
+import pytest
+
+from line_data import container, compression
+from line_data.container import LineDataContainerWriter, LineDataContainerReader
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "lines.pldseq")
+    with LineDataContainerWriter(path) as writer:
+        writer.append(1, "Line", b"frame1")
+        writer.append(2, "Line", b"frame2")
+        writer.append(2, "Line2", b"other")
+    with LineDataContainerReader(path) as reader:
+        assert reader.frames == [1, 2]
+        assert sorted(reader.names(2)) == ["Line", "Line2"]
+        assert reader.read(1) == b"frame1"
+        assert reader.read(2, "Line2") == b"other"
+
+
+def test_get_chunk_requires_name_when_ambiguous(tmp_path):
+    path = str(tmp_path / "lines.pldseq")
+    with LineDataContainerWriter(path) as writer:
+        writer.append(1, "A", b"a")
+        writer.append(1, "B", b"b")
+    with LineDataContainerReader(path) as reader:
+        with pytest.raises(KeyError):
+            reader.get_chunk(1)
+        with pytest.raises(KeyError):
+            reader.get_chunk(5, "A")
+
+
+def test_reopen_appends_and_later_chunk_wins(tmp_path):
+    path = str(tmp_path / "lines.pldseq")
+    with LineDataContainerWriter(path) as writer:
+        writer.append(1, "Line", b"old")
+    with LineDataContainerWriter(path) as writer:
+        writer.append(1, "Line", b"new")
+        writer.append(2, "Line", b"second")
+    with LineDataContainerReader(path) as reader:
+        assert reader.frames == [1, 2]
+        assert reader.read(1, "Line") == b"new"
+        assert len(reader.chunks()) == 2
+
+
+def test_missing_index_is_recovered_by_scanning(tmp_path):
+    path = str(tmp_path / "lines.pldseq")
+    with LineDataContainerWriter(path) as writer:
+        writer.append(1, "Line", b"frame1")
+        writer.append(2, "Line", b"frame2")
+    # 書き込み中に中断された状態(インデックスとフッターが無く、最後のチャンクが途中まで)を再現する
+    with open(path, "r+b") as f:
+        f.seek(-16, os.SEEK_END)
+        index_offset = int.from_bytes(f.read(8), "little")
+        f.truncate(index_offset - 2)
+    with LineDataContainerReader(path) as reader:
+        assert reader.frames == [1]
+        assert reader.read(1) == b"frame1"
+
+
+def test_append_file_compressed(tmp_path):
+    src = tmp_path / "line.pld"
+    payload = b"0123456789" * 1000
+    src.write_bytes(payload)
+    path = str(tmp_path / "lines.pldseq")
+    with LineDataContainerWriter(path) as writer:
+        writer.append_file(3, "Line", str(src), compression.CODEC_GZIP, 6)
+        writer.append_file(4, "Line", str(src))
+    with LineDataContainerReader(path) as reader:
+        chunk = reader.get_chunk(3)
+        assert chunk.codec == compression.CODEC_GZIP
+        assert chunk.payload_length < len(payload)
+        assert reader.read(3) == payload
+        assert reader.read(4) == payload
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a container")
+    with pytest.raises(ValueError):
+        LineDataContainerReader(str(path))
+    assert container.FILE_MAGIC == b"P4LSEQ01"
@@ -0,0 +1,119 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import struct
+import zlib
+import numpy as np
+
+from misc import exr_writer
+
+
+def _read_exr(path):
+    # ヘッダーの属性、チャンネル (名前, 型)、ブロック (先頭の行, データ) を返す
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"\x76\x2f\x31\x01"
+    position = 8
+    attributes = {}
+    while data[position] != 0:
+        name_end = data.index(b"\0", position)
+        type_end = data.index(b"\0", name_end + 1)
+        size, = struct.unpack_from("<i", data, type_end + 1)
+        attributes[data[position:name_end].decode()] = data[type_end + 5:type_end + 5 + size]
+        position = type_end + 5 + size
+    position += 1
+
+    channels = []
+    chlist = attributes["channels"]
+    offset = 0
+    while chlist[offset] != 0:
+        name_end = chlist.index(b"\0", offset)
+        pixel_type, = struct.unpack_from("<i", chlist, name_end + 1)
+        channels.append((chlist[offset:name_end].decode(), pixel_type))
+        offset = name_end + 17
+
+    _, _, _, y_max = struct.unpack("<iiii", attributes["dataWindow"])
+    compression = attributes["compression"][0]
+    lines_per_block = 16 if compression == exr_writer.COMPRESSIONS["ZIP"] else 1
+    block_count = (y_max + lines_per_block) // lines_per_block
+    offsets = struct.unpack_from(f"<{block_count}Q", data, position)
+    blocks = []
+    for block_offset in offsets:
+        y, size = struct.unpack_from("<ii", data, block_offset)
+        blocks.append((y, data[block_offset + 8:block_offset + 8 + size]))
+    return (attributes, channels, blocks)
+
+
+def _unzip_block(data: bytes, raw_size: int) -> bytes:
+    # _zip_blockの逆変換
+    if len(data) == raw_size:
+        return data
+    predicted = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    reordered = (np.cumsum(predicted.astype(np.int64) - 128) + 128).astype(np.uint8)
+    half = (len(reordered) + 1) // 2
+    raw = np.empty_like(reordered)
+    raw[0::2] = reordered[:half]
+    raw[1::2] = reordered[half:]
+    return raw.tobytes()
+
+
+def test_zip_block_predictor_round_trip():
+    raw = np.linspace(0.0, 1.0, 512, dtype=np.float32).astype("<f2").tobytes()
+    compressed = exr_writer._zip_block(raw)
+    assert len(compressed) < len(raw)
+    assert _unzip_block(compressed, len(raw)) == raw
+
+
+def test_zip_block_keeps_incompressible_data():
+    raw = np.random.default_rng(0).integers(0, 256, 64, dtype=np.uint8).tobytes()
+    assert exr_writer._zip_block(raw) == raw
+
+
+def test_collect_channels_order_and_types():
+    pixels = np.zeros((2, 3, 4), dtype=np.float32)
+    depth = np.zeros((2, 3, 1), dtype=np.float32)
+    channels = exr_writer.collect_channels([("View.Line", pixels), ("View.Element1", depth, False)], True)
+    assert [name for name, _ in channels] == ["View.Element1.V", "View.Line.A", "View.Line.B", "View.Line.G", "View.Line.R"]
+    assert channels[0][1].dtype == np.float32
+    assert all(x.dtype == np.float16 for _, x in channels[1:])
+    assert all(x.shape == (2, 3) for _, x in channels)
+
+
+def test_zip_blocks_hold_16_lines(tmp_path):
+    width, height = 5, 20
+    pixels = np.random.default_rng(1).random((height, width, 4), dtype=np.float32)
+    path = str(tmp_path / "zip.exr")
+    assert exr_writer.write_multilayer_exr(path, width, height, [("View.Line", pixels)], "ZIP", True) is None
+    _, channels, blocks = _read_exr(path)
+    assert [y for y, _ in blocks] == [0, 16]
+    rows = _unzip_block(blocks[1][1], 4 * width * 4 * 2)
+    # 行ごとにチャンネル名の順(A, B, G, R)で並ぶ
+    values = np.frombuffer(rows, dtype="<f2").reshape(4, 4, width)
+    assert np.array_equal(values[0, 3], pixels[16, :, 0].astype(np.float16))
+    assert np.array_equal(values[3, 0], pixels[19, :, 3].astype(np.float16))
+
+
+def test_uncompressed_layout_with_mixed_types(tmp_path):
+    width, height = 3, 2
+    line = np.arange(height * width * 4, dtype=np.float32).reshape(height, width, 4)
+    depth = np.full((height, width, 1), 7.5, dtype=np.float32)
+    path = str(tmp_path / "none.exr")
+    exr_writer.write_multilayer_exr(path, width, height, [("L.Line", line, True), ("L.Depth", depth, False)], "NONE", True)
+    attributes, channels, blocks = _read_exr(path)
+    assert attributes["compression"][0] == exr_writer.COMPRESSIONS["NONE"]
+    assert channels == [("L.Depth.V", 2), ("L.Line.A", 1), ("L.Line.B", 1), ("L.Line.G", 1), ("L.Line.R", 1)]
+    assert [y for y, _ in blocks] == [0, 1]
+    row = blocks[1][1]
+    assert len(row) == width * 4 + 4 * width * 2
+    assert np.array_equal(np.frombuffer(row[:width * 4], dtype="<f4"), depth[1, :, 0])
+    assert np.array_equal(np.frombuffer(row[width * 4 + width * 6:], dtype="<f2"), line[1, :, 0].astype(np.float16))
+
+
+def test_unavailable_compression_falls_back_to_zip(tmp_path):
+    if exr_writer.OpenImageIO is not None:
+        return
+    path = str(tmp_path / "piz.exr")
+    warning = exr_writer.write_multilayer_exr(path, 2, 2, [("L.Line", np.zeros((2, 2, 4), dtype=np.float32))], "PIZ")
+    assert warning is not None
+    attributes, _, _ = _read_exr(path)
+    assert attributes["compression"][0] == exr_writer.COMPRESSIONS["ZIP"]
@@ -0,0 +1,48 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+from misc.frame_cache import FrameCache
+
+
+class _Image:
+    def __init__(self, nbytes: int):
+        self.nbytes = nbytes
+
+
+def test_evicts_least_recently_used():
+    cache = FrameCache()
+    cache.put((1, 1), _Image(40), 100)
+    cache.put((1, 2), _Image(40), 100)
+    assert cache.get((1, 1)) is not None
+    cache.put((1, 3), _Image(40), 100)
+    assert cache.contains((1, 1))
+    assert not cache.contains((1, 2))
+    assert cache.size == 80
+
+
+def test_replacing_a_key_updates_the_size():
+    cache = FrameCache()
+    cache.put((1, 1), _Image(40), 100)
+    cache.put((1, 1), _Image(10), 100)
+    assert len(cache) == 1
+    assert cache.size == 10
+
+
+def test_items_larger_than_the_budget_are_not_stored():
+    cache = FrameCache()
+    cache.put((1, 1), _Image(40), 100)
+    cache.put((1, 2), _Image(200), 100)
+    assert not cache.contains((1, 2))
+    assert cache.contains((1, 1))
+
+
+def test_remove_region_and_clear():
+    cache = FrameCache()
+    cache.put((1, 1), _Image(10), 100)
+    cache.put((2, 1), _Image(10), 100)
+    cache.remove_region(1)
+    assert not cache.contains((1, 1))
+    assert cache.size == 10
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size == 0
@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import struct
+import zlib
+import numpy as np
+
+from misc import image_writer
+
+
+def _read_png(data: bytes):
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    position = 8
+    while position < len(data):
+        length, = struct.unpack_from(">I", data, position)
+        tag = data[position + 4:position + 8]
+        body = data[position + 8:position + 8 + length]
+        crc, = struct.unpack_from(">I", data, position + 8 + length)
+        assert crc == zlib.crc32(tag + body) & 0xffffffff
+        chunks[tag] = body
+        position += 12 + length
+    return chunks
+
+
+def _pixels(width: int, height: int) -> np.ndarray:
+    # 下の行から並ぶfloatのRGBA。下の行は赤、上の行は緑
+    pixels = np.zeros((height, width, 4), dtype=np.float32)
+    pixels[0, :, 0] = 1.0
+    pixels[-1, :, 1] = 1.0
+    pixels[:, :, 3] = 0.5
+    return pixels.ravel()
+
+
+def test_encode_rgba8():
+    width, height = 4, 3
+    chunks = _read_png(image_writer.encode_png(_pixels(width, height), width, height))
+    assert struct.unpack(">IIBBBBB", chunks[b"IHDR"]) == (width, height, 8, 6, 0, 0, 0)
+    assert b"IEND" in chunks
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, 1 + width * 4)
+    assert np.all(raw[:, 0] == 0)
+    rows = raw[:, 1:].reshape(height, width, 4)
+    # PNGは上の行から並ぶ
+    assert tuple(rows[0, 0]) == (0, 255, 0, 128)
+    assert tuple(rows[-1, 0]) == (255, 0, 0, 128)
+
+
+def test_encode_bw16():
+    width, height = 2, 2
+    chunks = _read_png(image_writer.encode_png(_pixels(width, height), width, height, "BW", "16", 0))
+    assert struct.unpack(">IIBBBBB", chunks[b"IHDR"]) == (width, height, 16, 0, 0, 0, 0)
+    raw = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, 1 + width * 2)
+    values = raw[:, 1:].copy().view(">u2")
+    assert values[0, 0] == round(0.7152 * 65535)
+    assert values[1, 0] == round(0.2126 * 65535)
+
+
+def test_to_integer_pixels_rgb_clamps():
+    pixels = np.array([2.0, -1.0, 0.5, 1.0], dtype=np.float32)
+    assert image_writer.to_integer_pixels(pixels, 1, 1, "RGB").tolist() == [[[255, 0, 128]]]
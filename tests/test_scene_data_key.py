@@ -0,0 +1,45 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+from types import SimpleNamespace
+
+from misc.scene_data_key import get_scene_data_key
+
+FILTER_PROPS = ["show_object_viewport_mesh", "show_object_viewport_curve"]
+
+
+class _Pointer:
+    def __init__(self, pointer: int, **attributes):
+        self.__pointer = pointer
+        self.__dict__.update(attributes)
+
+    def as_pointer(self) -> int:
+        return self.__pointer
+
+
+def _space(pointer: int, shading_type: str = "SOLID", local_view=None, use_local_collections=False, mesh=True, curve=True):
+    return _Pointer(pointer, shading=SimpleNamespace(type=shading_type), local_view=local_view,
+                    use_local_collections=use_local_collections,
+                    show_object_viewport_mesh=mesh, show_object_viewport_curve=curve)
+
+
+def test_regions_showing_the_same_depsgraph_share_scene_data():
+    depsgraph = _Pointer(1)
+    assert get_scene_data_key(depsgraph, _space(10), FILTER_PROPS) == get_scene_data_key(depsgraph, _space(11), FILTER_PROPS)
+
+
+def test_depsgraph_and_shading_separate_scene_data():
+    space = _space(10)
+    assert get_scene_data_key(_Pointer(1), space, FILTER_PROPS) != get_scene_data_key(_Pointer(2), space, FILTER_PROPS)
+    assert get_scene_data_key(_Pointer(1), _space(10, "SOLID"), FILTER_PROPS) != \
+        get_scene_data_key(_Pointer(1), _space(11, "RENDERED"), FILTER_PROPS)
+
+
+def test_view_specific_visibility_is_not_shared():
+    depsgraph = _Pointer(1)
+    shared = get_scene_data_key(depsgraph, _space(10), FILTER_PROPS)
+    assert get_scene_data_key(depsgraph, _space(11, local_view=object()), FILTER_PROPS) != shared
+    assert get_scene_data_key(depsgraph, _space(11, use_local_collections=True), FILTER_PROPS) != shared
+    assert get_scene_data_key(depsgraph, _space(11, local_view=object()), FILTER_PROPS) != \
+        get_scene_data_key(depsgraph, _space(12, local_view=object()), FILTER_PROPS)
+    assert get_scene_data_key(depsgraph, _space(11, curve=False), FILTER_PROPS) != shared
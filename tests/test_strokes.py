@@ -0,0 +1,76 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import gzip
+import numpy as np
+import pytest
+
+import line_data
+from line_data import strokes
+
+EPS = b"""%!PS-Adobe-3.0 EPSF-3.0
+%%BoundingBox: 0 0 100 50
+%%HiResBoundingBox: 0 0 100.5 50.25
+%%EndProlog
+% 1 2 m S
+2 w 1 0 0 XA
+10 10 m 20 20 l 30 10 l S
+0.5 G 3 setlinewidth
+0 0 m 10 0 10 10 0 10 c h S
+0 1 0 0 K
+5 5 moveto 6 6 lineto s
+"""
+
+
+def test_index_attributes():
+    index = strokes.EpsStrokeIndex(EPS, line_set_id=2)
+    assert len(index) == 3
+    assert index.bounding_box == (0.0, 0.0, 100.5, 50.25)
+    assert index.widths.tolist() == [2.0, 3.0, 3.0]
+    assert np.allclose(index.colors, [[1, 0, 0], [0.5, 0.5, 0.5], [1, 0, 1]])
+    assert index.line_set_ids.tolist() == [2, 2, 2]
+
+
+def test_select_points_and_curves():
+    index = strokes.EpsStrokeIndex(EPS, curve_segments=4)
+    selected = index.select()
+    assert selected.offsets.tolist() == [0, 3, 8, 10]
+    assert selected.closed.tolist() == [False, True, True]
+    assert selected.points.dtype == np.float32
+    assert selected.points[:3].tolist() == [[10, 10], [20, 20], [30, 10]]
+    # 曲線の中点と終点
+    assert np.allclose(selected.points[5], [7.5, 5.0])
+    assert np.allclose(selected.points[7], [0.0, 10.0])
+
+
+def test_select_with_mask_matches_stroke():
+    index = strokes.EpsStrokeIndex(EPS)
+    selected = index.select(np.array([True, False, True]))
+    assert selected.offsets.tolist() == [0, 3, 5]
+    assert selected.widths.tolist() == [2.0, 3.0]
+    points, closed = index.stroke(2)
+    assert points.tolist() == [[5, 5], [6, 6]]
+    assert closed
+    assert len(index.select(np.zeros(3, dtype=bool)).widths) == 0
+
+
+def test_iter_select_splits_blocks():
+    index = strokes.EpsStrokeIndex(EPS)
+    blocks = list(index.iter_select(block_size=1))
+    assert [indices.tolist() for indices, _ in blocks] == [[0], [1], [2]]
+    assert np.array_equal(np.concatenate([x.points for _, x in blocks]), index.select().points)
+
+
+def test_open_from_file_and_compressed(tmp_path):
+    path = tmp_path / "line.eps"
+    path.write_bytes(EPS)
+    with line_data.open_stroke_index(str(path)) as index:
+        assert len(index) == 3
+        points = index.select().points
+    assert len(points) == 3 + 1 + 8 + 2
+    assert len(line_data.open_stroke_index(gzip.compress(EPS))) == 3
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        line_data.open_stroke_index(b"PLD\0binary")
@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: GPL-2.0-or-later
+# The Original Code is Copyright (C) P SOFTHOUSE Co., Ltd. All rights reserved.
+
+import io
+import re
+import numpy as np
+
+from line_data import strokes, svg
+
+
+def test_simplify_removes_points_within_tolerance():
+    points = np.array([[0.0, 0.0], [1.0, 0.1], [2.0, -0.1], [3.0, 5.0], [4.0, 0.0]])
+    assert svg.simplify(points, 0.5).tolist() == [[0.0, 0.0], [2.0, -0.1], [3.0, 5.0], [4.0, 0.0]]
+    assert svg.simplify(points, 10.0).tolist() == [[0.0, 0.0], [4.0, 0.0]]
+    assert svg.simplify(points, 0.0) is points
+
+
+def test_simplify_closed_segment():
+    # 始点と終点が同じ場合は始点からの距離で判定する
+    points = np.array([[0.0, 0.0], [2.0, 0.0], [0.0, 0.1], [0.0, 0.0]])
+    assert svg.simplify(points, 1.0).tolist() == [[0.0, 0.0], [2.0, 0.0], [0.0, 0.0]]
+
+
+def test_quantize_and_format():
+    formatter = svg._NumberFormatter(2)
+    assert formatter.quantize(np.array([1.234, -0.005, 2.0])).tolist() == [123, -0, 200]
+    assert formatter.format([123, -1, 200, 0]) == "1.23 -0.01 2 0"
+    assert svg._NumberFormatter(0).format([3, -4]) == "3 -4"
+
+
+def test_write_svg():
+    eps = b"""%!PS-Adobe-3.0 EPSF-3.0
+%%BoundingBox: 0 0 100 50
+%%EndProlog
+1 w 1 0 0 XA
+10 10 m 10.04 10 l 20 20 l S
+30 30 m 40 30 l S
+2 w
+0 0 m 5 0 l h S
+1 1 m S
+"""
+    index = strokes.EpsStrokeIndex(eps)
+    file = io.StringIO()
+    assert svg.write_svg(file, [("lines", index)], 0.0, 1) == 3
+    text = file.getvalue()
+    assert 'width="100" height="50"' in text
+    paths = re.findall(r'<path stroke="([^"]+)" stroke-width="([^"]+)" d="([^"]+)"/>', text)
+    # 同じ線幅と色の連続したストロークは1つのpathにまとめ、量子化で動かない点は省く
+    assert paths == [("#ff0000", "1", "M10 40l10 -10M30 20l10 0"), ("#ff0000", "2", "M0 50l5 0z")]